@@ -1,10 +1,11 @@
 from django.contrib import admin
 
 # Import cat model
-from .models import Cat, Feeding, Photo, Toy
+from .models import Cat, Feeding, Photo, Task, Toy
 
 # Register your models here.
 admin.site.register(Cat)
 admin.site.register(Feeding)
 admin.site.register(Photo)
 admin.site.register(Toy)
+admin.site.register(Task)
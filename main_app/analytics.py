@@ -0,0 +1,212 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import date, timedelta
+from itertools import chain, compress, islice, repeat
+from operator import itemgetter, sub
+
+from django.db import connection, transaction
+
+from .models import ALL_MEALS_MASK, MEAL_BITS, MEALS, Checkpoint, Feeding, FeedingRollup
+
+# Feeding rows read per rollup batch
+ROLLUP_CHUNK_SIZE = 10000
+
+# each refresh re-reads this many ids below the checkpoint - ids are handed out
+# before commit, so a slow transaction can commit an id lower than one we've seen.
+# Merging a feeding twice is harmless (its bit is already set). The bulk writers
+# (ingest, import_data, generate_dataset) fold their feedings into the rollups
+# in their own transaction, so this only has to cover the feedings created one
+# at a time while a refresh runs; a transaction holding more uncommitted ids
+# than this when a refresh runs needs a --full rebuild afterwards.
+ROLLUP_OVERLAP = 10000
+
+# rollups written per INSERT
+ROLLUP_INSERT_BATCH_SIZE = 1000
+
+ROLLUP_CHECKPOINT = 'feeding_rollups'
+
+# longest range feeding_stats_view answers (meals_per_day has a row per day)
+MAX_STATS_DAYS = 3660
+
+# translate() tables over a day's meal mask (bytes 0 - 255)
+MEAL_COUNTS = bytes(bin(mask).count('1') for mask in range(256))
+FED_EVERY_MEAL = bytes(int(mask & ALL_MEALS_MASK == ALL_MEALS_MASK) for mask in range(256))
+
+
+# Feeding analytics
+# Rows are pulled with values_list().iterator() into array columns (C ints,
+# a few bytes per row) a chunk at a time and aggregated with C-level builtins -
+# bytes.translate, Counter, itertools.compress / repeat, map - instead of a
+# Python loop over every row.
+# Stats are read from FeedingRollup (one row per cat per fed day), which
+# refresh_rollups keeps current from the Feeding table incrementally.
+
+def columns(rows, *types, chunk_size=ROLLUP_CHUNK_SIZE):
+    """Read rows of tuples into one array per column, ``chunk_size`` rows at a time.
+
+    ``types`` are (array typecode, converter or None) pairs, one per column.
+    """
+    arrays = [array(typecode) for typecode, convert in types]
+    rows = iter(rows)
+    # only one chunk of tuples is alive at a time - the arrays hold the rest
+    while chunk := list(islice(rows, chunk_size)):
+        for position, (column, (typecode, convert)) in enumerate(zip(arrays, types)):
+            values = map(itemgetter(position), chunk)
+            column.extend(map(convert, values) if convert else values)
+    return arrays
+
+
+def feeding_columns(rows):
+    """(cat ids, day ordinals, meal bits) arrays from (cat_id, date, meal) rows."""
+    return columns(rows, ('l', None), ('l', date.toordinal), ('B', MEAL_BITS.__getitem__))
+
+
+def day_masks(cats, days, bits):
+    # {(cat_id, day): mask} - a day has each meal at most once (see the
+    # feeding_once_per_meal constraint), so its mask is the sum of its meal
+    # bits: count every (cat_id, day) key once per unit of its bit
+    return Counter(chain.from_iterable(map(repeat, zip(cats, days), bits)))
+
+
+def merge_rollups(masks):
+    """OR ``masks`` into the stored rollups; returns the number of rows written."""
+    masks = list(masks.items())
+    table = connection.ops.quote_name(FeedingRollup._meta.db_table)
+    # INSERT ... ON CONFLICT (cat, date) DO UPDATE SET meals = meals | new meals -
+    # the OR happens in the row update, so two writers adding different meals
+    # to the same day can't overwrite each other's bits
+    with connection.cursor() as cursor:
+        for start in range(0, len(masks), ROLLUP_INSERT_BATCH_SIZE):
+            batch = masks[start:start + ROLLUP_INSERT_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} (cat_id, date, meals) VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT (cat_id, date) DO UPDATE SET meals = {table}.meals | excluded.meals',
+                [value for (cat_id, day), mask in batch for value in (cat_id, date.fromordinal(day), mask)],
+            )
+    return len(masks)
+
+
+def fold_feedings(feedings):
+    """Merge newly written Feeding objects into the rollups (call in their transaction)."""
+    # a set - day_masks needs each meal once per day
+    keys = {(feeding.cat_id, feeding.date, feeding.meal) for feeding in feedings}
+    return merge_rollups(day_masks(*feeding_columns(keys)))
+
+
+def refresh_rollups(full=False, chunk_size=ROLLUP_CHUNK_SIZE):
+    """Fold the feedings added since the last run into FeedingRollup.
+
+    ``full`` throws the rollups away and rebuilds them from every feeding (for
+    when feedings were edited or deleted) in one transaction, so readers see
+    the old rollups until the new ones are complete. Yields (feedings read,
+    rollups written) after each batch.
+    """
+    if not full:
+        yield from _refresh_rollups(full, chunk_size)
+        return
+    with transaction.atomic():
+        yield from _refresh_rollups(full, chunk_size)
+
+
+def _refresh_rollups(full, chunk_size):
+    checkpoint, created = Checkpoint.objects.get_or_create(name=ROLLUP_CHECKPOINT)
+    if full:
+        FeedingRollup.objects.all().delete()
+        checkpoint.last_id = 0
+    last_id = max(checkpoint.last_id - ROLLUP_OVERLAP, 0)
+
+    feedings = Feeding.objects.order_by('id').values_list('id', 'cat_id', 'date', 'meal')
+    while True:
+        batch = list(feedings.filter(id__gt=last_id)[:chunk_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        masks = day_masks(*feeding_columns(row[1:] for row in batch))
+        with transaction.atomic():
+            written = merge_rollups(masks)
+            checkpoint.last_id = max(checkpoint.last_id, last_id)
+            checkpoint.save(update_fields=['last_id'])
+        yield len(batch), written
+    if full:
+        checkpoint.save(update_fields=['last_id'])
+
+
+def rollup_columns(cat_ids, start, end):
+    """(cat ids, day ordinals, masks) arrays for the cats' rollups in [start, end]."""
+    rows = (
+        FeedingRollup.objects.filter(cat_id__in=cat_ids, date__range=(start, end))
+        .order_by('cat_id', 'date')
+        .values_list('cat_id', 'date', 'meals')
+        .iterator(chunk_size=ROLLUP_CHUNK_SIZE)
+    )
+    return columns(rows, ('l', None), ('l', date.toordinal), ('B', None))
+
+
+def weighted_counts(keys, weights):
+    # {key: sum of weights} - one Counter pass per distinct weight (0 - 3 meals)
+    totals = Counter()
+    for weight in set(weights) - {0}:
+        for key, count in Counter(compress(keys, map(weight.__eq__, weights))).items():
+            totals[key] += weight * count
+    return totals
+
+
+def skipped_streaks(full_days, start, end):
+    """(longest, current) runs of days in [start, end] without every meal.
+
+    ``full_days`` are the sorted ordinals of the days with every meal.
+    """
+    # the gaps between consecutive full days, with start - 1 and end + 1 as bookends
+    gaps = map(sub, chain(full_days, [end + 1]), chain([start - 1], full_days))
+    current = end - (full_days[-1] if full_days else start - 1)
+    return max(gaps) - 1, current
+
+
+def feeding_stats(cat_ids, start, end):
+    """Meals per day, meal distribution and per-cat streaks from the rollups.
+
+    ``start`` / ``end`` are dates (inclusive). Days without a rollup row count
+    as days with every meal skipped.
+    """
+    cat_ids = list(cat_ids)
+    cats, days, masks = rollup_columns(cat_ids, start, end)
+    meal_counts = masks.tobytes().translate(MEAL_COUNTS)
+    fed_every_meal = masks.tobytes().translate(FED_EVERY_MEAL)
+    first, last = start.toordinal(), end.toordinal()
+
+    per_day = weighted_counts(days, meal_counts)
+    distribution = Counter(masks)
+    per_cat_meals = weighted_counts(cats, meal_counts)
+    # the rollups are sorted by (cat_id, date), so each cat's full days are one slice
+    full_cats = array('l', compress(cats, fed_every_meal))
+    full_days = array('l', compress(days, fed_every_meal))
+
+    cat_stats = {}
+    for cat_id in cat_ids:
+        cat_full_days = full_days[bisect_left(full_cats, cat_id):bisect_right(full_cats, cat_id)]
+        longest, current = skipped_streaks(cat_full_days, first, last)
+        cat_stats[cat_id] = {
+            'meals': per_cat_meals[cat_id],
+            'days_fed_every_meal': len(cat_full_days),
+            'longest_skipped_streak': longest,
+            'current_skipped_streak': current,
+        }
+    return {
+        'start': start,
+        'end': end,
+        'meals_per_day': [
+            {'date': date.fromordinal(day), 'meals': per_day[day]} for day in range(first, last + 1)
+        ],
+        'distribution': {
+            label: sum(count for mask, count in distribution.items() if mask & MEAL_BITS[meal])
+            for meal, label in MEALS
+        },
+        'cats': cat_stats,
+    }
+
+
+def default_range(today=None):
+    # the last 30 days, today included
+    end = today or date.today()
+    return end - timedelta(days=29), end
@@ -0,0 +1,189 @@
+import hashlib
+
+from django.db.models import Count, F, Max, Window
+from django.db.models.functions import RowNumber
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .models import Cat, Feeding, Photo, Toy
+from .pagination import paginate_by_keyset
+
+# the columns each resource can return - all of them unless ?fields= asks for fewer
+CAT_FIELDS = ('id', 'name', 'breed', 'description', 'age', 'last_fed_date', 'last_fed_meals', 'updated_at')
+FEEDING_FIELDS = ('id', 'cat_id', 'date', 'meal', 'updated_at')
+TOY_FIELDS = ('id', 'name', 'color', 'updated_at')
+PHOTO_FIELDS = ('id', 'cat_id', 'url', 'small_url', 'medium_url', 'width')
+
+CAT_INCLUDES = ('feedings', 'toys', 'photos')
+
+# ?include=feedings brings a cat's most recent feedings, not its whole history
+INCLUDED_FEEDINGS = 10
+
+CAT_ORDERING = ('name', 'id')
+FEEDING_ORDERING = ('-date', '-id')
+TOY_ORDERING = ('name', 'id')
+
+
+# Read-only JSON API
+# Everything is read with values() - plain dicts straight from the cursor, no
+# model instances and no templates. Lists are keyset paginated
+# ({"results": [...], "next": "<cursor>"}), ?fields=name,breed picks the
+# columns and ?include=feedings,toys,photos adds a cat's related rows with one
+# extra query per relation. The ETag is a hash of the URL and the version of
+# the rows behind the body - their count and last updated_at, read with an
+# aggregate query per table - so a repeat visit gets its 304 before any of
+# the payload is read or serialized.
+
+def parse_fields(value, allowed):
+    """?fields= -> the columns to select; id is always included."""
+    if not value:
+        return allowed
+    fields = [field for field in value.split(',') if field]
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise ValueError(f'unknown field: {", ".join(sorted(unknown))} (fields are {", ".join(allowed)})')
+    return ('id', *[field for field in dict.fromkeys(fields) if field != 'id'])
+
+
+def parse_includes(value):
+    includes = [name for name in (value or '').split(',') if name]
+    unknown = set(includes) - set(CAT_INCLUDES)
+    if unknown:
+        raise ValueError(f'unknown include: {", ".join(sorted(unknown))} (includes are {", ".join(CAT_INCLUDES)})')
+    return includes
+
+
+def group_by_cat(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row.pop('cat_id'), []).append(row)
+    return grouped
+
+
+def related_rows(include, cat_ids):
+    # {cat_id: [row, ...]} for one ?include= relation
+    if include == 'feedings':
+        # the newest INCLUDED_FEEDINGS per cat in one query
+        rows = (
+            Feeding.objects.filter(cat_id__in=cat_ids)
+            .annotate(position=Window(RowNumber(), partition_by=F('cat_id'), order_by=[F('date').desc(), F('id').desc()]))
+            .filter(position__lte=INCLUDED_FEEDINGS)
+            .order_by('cat_id', '-date', '-id')
+            .values(*FEEDING_FIELDS)
+        )
+    elif include == 'toys':
+        links = (
+            Cat.toys.through.objects.filter(cat_id__in=cat_ids)
+            .order_by('cat_id', 'toy__name', 'toy_id')
+            .values_list('cat_id', 'toy_id', 'toy__name', 'toy__color')
+        )
+        rows = ({'cat_id': cat_id, 'id': toy_id, 'name': name, 'color': color} for cat_id, toy_id, name, color in links)
+    else:
+        rows = Photo.objects.filter(cat_id__in=cat_ids).order_by('cat_id', 'id').values(*PHOTO_FIELDS)
+    return group_by_cat(rows)
+
+
+def add_includes(cats, includes):
+    cat_ids = [cat['id'] for cat in cats]
+    for include in includes:
+        related = related_rows(include, cat_ids) if cat_ids else {}
+        for cat in cats:
+            cat[include] = related.get(cat['id'], [])
+    return cats
+
+
+def list_page(queryset, fields, ordering, cursor):
+    # the ordering columns are needed for the cursor even if ?fields= leaves them out
+    columns = tuple(dict.fromkeys((*fields, *(field.lstrip('-') for field in ordering))))
+    page = paginate_by_keyset(queryset.values(*columns), ordering, cursor)
+    results = [{field: row[field] for field in fields} for row in page]
+    return results, page.next_cursor
+
+
+def cats_payload(user, fields='', include='', cursor=None):
+    fields, includes = parse_fields(fields, CAT_FIELDS), parse_includes(include)
+    cats, next_cursor = list_page(Cat.objects.filter(user=user), fields, CAT_ORDERING, cursor)
+    return {'results': add_includes(cats, includes), 'next': next_cursor}
+
+
+def cat_payload(user, cat_id, fields='', include=''):
+    # None when the cat doesn't exist or isn't the user's
+    fields, includes = parse_fields(fields, CAT_FIELDS), parse_includes(include)
+    cat = Cat.objects.filter(user=user, id=cat_id).values(*fields).first()
+    return add_includes([cat], includes)[0] if cat else None
+
+
+def feedings_payload(cat_id, fields='', cursor=None):
+    fields = parse_fields(fields, FEEDING_FIELDS)
+    feedings, next_cursor = list_page(Feeding.objects.filter(cat_id=cat_id), fields, FEEDING_ORDERING, cursor)
+    return {'results': feedings, 'next': next_cursor}
+
+
+def toys_payload(fields='', cursor=None):
+    fields = parse_fields(fields, TOY_FIELDS)
+    toys, next_cursor = list_page(Toy.objects.all(), fields, TOY_ORDERING, cursor)
+    return {'results': toys, 'next': next_cursor}
+
+
+def toy_payload(pk, fields=''):
+    return Toy.objects.filter(pk=pk).values(*parse_fields(fields, TOY_FIELDS)).first()
+
+
+def rows_version(queryset):
+    # a delete changes the count, anything else bumps an updated_at
+    return queryset.aggregate(count=Count('id'), updated=Max('updated_at'))
+
+
+def related_version(include, cat_ids):
+    if include == 'feedings':
+        return rows_version(Feeding.objects.filter(cat_id__in=cat_ids))
+    if include == 'toys':
+        # links are only ever added or deleted - new ones get a higher id - and
+        # the toys' own edits bump their updated_at
+        return Cat.toys.through.objects.filter(cat_id__in=cat_ids).aggregate(
+            count=Count('id'), last=Max('id'), updated=Max('toy__updated_at'),
+        )
+    # photos are added, deleted and given their variants (and width) once
+    return Photo.objects.filter(cat_id__in=cat_ids).aggregate(count=Count('id'), last=Max('id'), sized=Count('width'))
+
+
+def cats_version(user, include='', cat_id=None):
+    """The version of the user's cats (or one cat) plus each ?include= relation."""
+    cats = Cat.objects.filter(user=user)
+    if cat_id is not None:
+        cats = cats.filter(id=cat_id)
+    version = {'cats': rows_version(cats)}
+    for include in parse_includes(include):
+        version[include] = related_version(include, cats.values('id'))
+    return version
+
+
+def feedings_version(cat_id):
+    return rows_version(Feeding.objects.filter(cat_id=cat_id))
+
+
+def toys_version():
+    return rows_version(Toy.objects.all())
+
+
+def toy_version(pk):
+    # None when there's no such toy
+    return Toy.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+def api_response(request, version, build):
+    """JsonResponse of ``build()`` with an ETag, or a 304 if the client already has it.
+
+    ``version`` is what the body is built from (see the *_version functions);
+    on a 304 ``build`` is never called.
+    """
+    key = repr((request.get_full_path(), request.user.id, version))
+    etag = quote_etag(hashlib.md5(key.encode(), usedforsecurity=False).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    # every response is one user's data and must be revalidated before reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    response['ETag'] = etag
+    return response
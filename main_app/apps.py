@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        # connect the cache invalidation signal handlers
+        from . import signals  # noqa: F401
+        # register the background tasks so any worker can run them
+        from . import images  # noqa: F401
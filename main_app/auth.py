@@ -0,0 +1,56 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+
+_users = {}
+_users_lock = threading.Lock()
+
+
+# Per-process cache of authenticated users
+# Every signed-in request loads request.user with a query by id. With
+# USER_CACHE_SECONDS set, the backend keeps each user for that long in this
+# process instead. Saving or deleting a user and logging out forget the entry
+# here right away (see signals.py); other processes catch up within the TTL, so
+# keep it short. Django still checks the session's password hash against the
+# cached user, so sessions from before a password change stop working once the
+# entry is refreshed.
+
+def get_cached_user(user_id):
+    entry = _users.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    # a copy, so a view changing request.user can't change anyone else's
+    return copy.deepcopy(entry[1])
+
+
+def cache_user(user, timeout):
+    with _users_lock:
+        _users[user.pk] = (time.monotonic() + timeout, copy.deepcopy(user))
+
+
+def forget_user(user_id):
+    with _users_lock:
+        _users.pop(user_id, None)
+
+
+def clear_user_cache():
+    with _users_lock:
+        _users.clear()
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() is served from the per-process cache."""
+
+    def get_user(self, user_id):
+        timeout = getattr(settings, 'USER_CACHE_SECONDS', 0)
+        if not timeout:
+            return super().get_user(user_id)
+        user = get_cached_user(user_id)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache_user(user, timeout)
+        return user
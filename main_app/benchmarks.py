@@ -0,0 +1,434 @@
+import asyncio
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections, transaction
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path, reverse
+
+from .analytics import feeding_stats, refresh_rollups
+from .auth import clear_user_cache
+from .dashboard import hungry_cats
+from .models import Cat, Feeding, MEALS, Toy
+from .pagination import paginate_by_keyset
+from .search import reset_search_index, search, search_ordering
+from .stats import percentile
+from .synthetic import generate_dataset
+from .toy_links import link_toys, unlink_toys
+from .urls import build_urlpatterns
+
+
+# Benchmark helpers
+# Every benchmark builds its own synthetic data inside a transaction that is
+# rolled back at the end, so it can be pointed at any database. The exception
+# is bench_concurrency - its requests run on other threads / connections, so
+# its data is committed and deleted again afterwards.
+
+def measure(fn, repeat):
+    """Call ``fn`` ``repeat`` times and summarise latency (ms) and query count."""
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'runs': repeat,
+        'queries_per_run': len(queries) / repeat,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def bench_hungry_cats(cats=1000, days=30, repeat=20):
+    # cats are fed every meal except every third cat skips dinner
+    today = date.today()
+    with transaction.atomic():
+        user = User.objects.create_user(username=f'bench-{time.time_ns()}')
+        cat_rows = Cat.objects.bulk_create(
+            Cat(name=f'Cat {i}', breed='tabby', description='benchmark cat', age=i % 15, user=user)
+            for i in range(cats)
+        )
+        Feeding.objects.bulk_create(
+            (
+                Feeding(cat=cat, date=today - timedelta(days=day), meal=meal)
+                for index, cat in enumerate(cat_rows)
+                for day in range(days)
+                for meal, label in MEALS
+                if not (index % 3 == 0 and meal == 'D')
+            ),
+            batch_size=5000,
+        )
+        result = measure(lambda: hungry_cats(user, today), repeat)
+        result.update(name='hungry_cats', cats=cats, days=days, hungry=len(hungry_cats(user, today)))
+        transaction.set_rollback(True)
+    return result
+
+
+def route_requests(cat, toy):
+    # (name, method, url, data) for the main routes in main_app/urls.py
+    return [
+        ('index', 'get', reverse('index'), None),
+        ('detail', 'get', reverse('detail', args=[cat.id]), None),
+        ('toys_index', 'get', reverse('toys_index'), None),
+        ('add_feeding', 'post', reverse('add_feeding', args=[cat.id]), {'date': date.today(), 'meal': 'B'}),
+        ('assoc_toy', 'post', reverse('assoc_toy', args=[cat.id, toy.id]), None),
+    ]
+
+
+def bench_routes(repeat=20, **dataset):
+    """Drive the main routes through the test client against a synthetic dataset.
+
+    ``dataset`` is passed on to generate_dataset.
+    """
+    results = []
+    with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+        counts, users, toys = generate_dataset(**dataset)
+        client = Client()
+        client.force_login(users[0])
+        cat = Cat.objects.filter(user=users[0]).first()
+        toy = Toy.objects.exclude(cat=cat).first() or Toy.objects.first()
+        for name, method, url, data in route_requests(cat, toy):
+            request = getattr(client, method)
+            statuses = set()
+            result = measure(lambda: statuses.add(request(url, data).status_code), repeat)
+            result.update(name=name, url=url, method=method.upper(), statuses=sorted(statuses))
+            results.append(result)
+        transaction.set_rollback(True)
+    return results, counts
+
+
+def bench_api(repeat=20, **dataset):
+    """The cat detail page vs the same data from the JSON API - time and bytes.
+
+    ``dataset`` is passed on to generate_dataset.
+    """
+    results = []
+    with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+        counts, users, toys = generate_dataset(**dataset)
+        client = Client()
+        client.force_login(users[0])
+        cat = Cat.objects.filter(user=users[0]).first()
+        pages = [
+            ('detail_html', reverse('detail', args=[cat.id]), {}),
+            ('detail_api', reverse('api_cat', args=[cat.id]), {'include': 'feedings,toys,photos'}),
+            ('detail_api_sparse', reverse('api_cat', args=[cat.id]), {'fields': 'name,last_fed_meals'}),
+        ]
+        for name, url, params in pages:
+            sizes = []
+            result = measure(lambda: sizes.append(len(client.get(url, params).content)), repeat)
+            result.update(name=name, url=url, bytes=max(sizes))
+            results.append(result)
+        transaction.set_rollback(True)
+    return results, counts
+
+
+# (name, session backend, USER_CACHE_SECONDS)
+AUTH_MODES = (
+    ('db', 'db', 0),
+    ('cached_db', 'cached_db', 30),
+    ('signed_cookies', 'signed_cookies', 30),
+)
+
+
+def bench_auth(repeat=20, **dataset):
+    """The main routes under each session backend / user cache combination.
+
+    The queries_per_run difference against the db mode is what each mode
+    saves on every request. ``dataset`` is passed on to generate_dataset.
+    """
+    results = []
+    with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver']):
+        counts, users, toys = generate_dataset(**dataset)
+        cat = Cat.objects.filter(user=users[0]).first()
+        toy = Toy.objects.exclude(cat=cat).first() or Toy.objects.first()
+        for mode, backend, timeout in AUTH_MODES:
+            settings = {'SESSION_ENGINE': f'django.contrib.sessions.backends.{backend}', 'USER_CACHE_SECONDS': timeout}
+            with override_settings(**settings):
+                cache.clear()
+                clear_user_cache()
+                # a new client loads the middleware - and so the session backend - again
+                client = Client()
+                client.force_login(users[0])
+                for name, method, url, data in route_requests(cat, toy):
+                    request = getattr(client, method)
+                    statuses = set()
+                    result = measure(lambda: statuses.add(request(url, data).status_code), repeat)
+                    result.update(name=f'auth_{mode}_{name}', mode=mode, url=url, statuses=sorted(statuses))
+                    results.append(result)
+        clear_user_cache()
+        transaction.set_rollback(True)
+    return results, counts
+
+
+def bench_toy_links(cats=200, repeat=5):
+    """Give one toy to ``cats`` cats and take it away again - per pair vs batch."""
+    results = []
+    with transaction.atomic():
+        user = User.objects.create_user(username=f'bench-{time.time_ns()}')
+        cat_rows = Cat.objects.bulk_create(
+            Cat(name=f'Cat {i}', breed='tabby', description='benchmark cat', age=1, user=user)
+            for i in range(cats)
+        )
+        toy = Toy.objects.create(name='benchmark mouse', color='grey')
+        pairs = {(cat.id, toy.id) for cat in cat_rows}
+
+        def per_pair():
+            # what assoc_toy / unassoc_toy do for each pair
+            for cat in cat_rows:
+                Cat.objects.get(id=cat.id).toys.add(toy.id)
+            for cat in cat_rows:
+                Cat.objects.get(id=cat.id).toys.remove(toy.id)
+
+        def batch():
+            link_toys(pairs)
+            unlink_toys(pairs)
+
+        for name, fn in (('toy_links_per_pair', per_pair), ('toy_links_batch', batch)):
+            result = measure(fn, repeat)
+            result.update(name=name, cats=cats)
+            results.append(result)
+        transaction.set_rollback(True)
+    return results
+
+
+def bench_search(repeat=20, queries=('tab', 'mouse', 'ball red'), **dataset):
+    """Search one synthetic user's cats and the toys, facets and first pages included.
+
+    ``dataset`` is passed on to generate_dataset.
+    """
+    results = []
+    with transaction.atomic():
+        counts, users, toys = generate_dataset(**dataset)
+
+        def run(query):
+            cats, toys, facets = search(users[0], query)
+            paginate_by_keyset(cats, search_ordering())
+            paginate_by_keyset(toys, search_ordering())
+
+        # the first search builds the in-process index when there's no tsvector
+        run(queries[0])
+        for query in queries:
+            result = measure(lambda: run(query), repeat)
+            result.update(name=f"search_{query.replace(' ', '_')}", query=query)
+            results.append(result)
+        transaction.set_rollback(True)
+    # the index must not keep the rolled back rows
+    reset_search_index()
+    return results, counts
+
+
+def bench_analytics(repeat=20, **dataset):
+    """Build the feeding rollups, then read stats for one user over the whole history.
+
+    ``dataset`` is passed on to generate_dataset - use a long ``feeding_days``.
+    """
+    results = []
+    with transaction.atomic():
+        counts, users, toys = generate_dataset(**dataset)
+        cat_ids = list(Cat.objects.filter(user=users[0]).values_list('id', flat=True))
+        end = date.today()
+        start = end - timedelta(days=dataset.get('feeding_days', 30) - 1)
+
+        runs = [
+            ('analytics_rollup_full', 1, lambda: list(refresh_rollups(full=True))),
+            # nothing new since the full run - just the overlap is re-read
+            ('analytics_rollup_incremental', repeat, lambda: list(refresh_rollups())),
+            ('analytics_stats_user', repeat, lambda: feeding_stats(cat_ids, start, end)),
+            ('analytics_stats_cat', repeat, lambda: feeding_stats(cat_ids[:1], start, end)),
+        ]
+        for name, runs_wanted, fn in runs:
+            result = measure(fn, runs_wanted)
+            result.update(name=name, days=(end - start).days + 1)
+            results.append(result)
+        transaction.set_rollback(True)
+    return results, counts
+
+
+# (name, staticfiles storage) - what `benchmark static` compares
+STATIC_MODES = (
+    ('plain', 'django.contrib.staticfiles.storage.StaticFilesStorage'),
+    ('pipeline', 'main_app.staticfiles.CompressedManifestStaticFilesStorage'),
+)
+
+
+def page_assets(html):
+    # (local static URLs, third-party URLs) the page loads
+    urls = re.findall(r'(?:href|src)="([^"]+\.(?:css|js|png|jpg|svg))"', html)
+    return [url for url in urls if url.startswith('/')], [url for url in urls if not url.startswith('/')]
+
+
+def bench_static(repeat=20):
+    """The home page and its static files, collected plain vs through the pipeline.
+
+    Reports the bytes of a first visit and how many requests a repeat visit
+    still has to make (everything not cached as immutable).
+    """
+    results = []
+    for name, backend in STATIC_MODES:
+        # DEBUG off, as in production - {% static %} only links hashed names then
+        with tempfile.TemporaryDirectory() as static_root, override_settings(
+            DEBUG=False,
+            ALLOWED_HOSTS=['testserver'],
+            STATIC_ROOT=static_root,
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': backend}},
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            client = Client(HTTP_ACCEPT_ENCODING='gzip, deflate, br')
+            local, external = page_assets(client.get(reverse('home')).content.decode())
+            visit = {}
+
+            def first_visit():
+                page = client.get(reverse('home'))
+                responses = [client.get(url) for url in local]
+                visit['bytes'] = len(page.content) + sum(len(response.content) for response in responses)
+                visit['repeat_requests'] = 1 + sum('immutable' not in response['Cache-Control'] for response in responses)
+
+            result = measure(first_visit, repeat)
+            result.update(name=f'static_{name}', assets=len(local), external_assets=len(external), **visit)
+            results.append(result)
+    return results
+
+
+class AsyncURLConf:
+    # catcollector/urls.py with the async views switched on (ASYNC_VIEWS=True)
+    urlpatterns = [
+        path('', include(build_urlpatterns(async_views=True))),
+        path('accounts/', include('django.contrib.auth.urls')),
+    ]
+
+
+def read_heavy_urls(cat, toy):
+    # the pages that have async twins
+    return [
+        reverse('index'),
+        reverse('detail', args=[cat.id]),
+        reverse('toys_index'),
+        reverse('toys_detail', args=[toy.id]),
+    ]
+
+
+def summarize_run(name, concurrency, latencies, elapsed, statuses):
+    return {
+        'name': name,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies), 3),
+        'statuses': sorted(statuses),
+    }
+
+
+def run_wsgi(clients, requests):
+    # one thread per client, like a threaded WSGI server
+    def worker(client, urls):
+        latencies, statuses = [], set()
+        try:
+            for index in range(requests):
+                start = time.perf_counter()
+                statuses.add(client.get(urls[index % len(urls)]).status_code)
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            connections.close_all()
+        return latencies, statuses
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(clients)) as pool:
+        results = list(pool.map(lambda item: worker(*item), clients))
+    return results, time.perf_counter() - start
+
+
+async def run_asgi(clients, requests):
+    # every client is a task on one event loop, like an ASGI server
+    async def worker(client, urls):
+        latencies, statuses = [], set()
+        for index in range(requests):
+            start = time.perf_counter()
+            statuses.add((await client.get(urls[index % len(urls)])).status_code)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies, statuses
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(worker(client, urls) for client, urls in clients))
+    return results, time.perf_counter() - start
+
+
+def bench_concurrency(concurrency=8, requests=25, **dataset):
+    """Hit the read-heavy pages from ``concurrency`` clients at once, WSGI vs ASGI.
+
+    Each client makes ``requests`` requests as its own synthetic user.
+    ``dataset`` is passed on to generate_dataset.
+    """
+    dataset.setdefault('users', concurrency)
+    counts, users, toys = generate_dataset(**dataset)
+    results = []
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            for name, client_class in (('wsgi', Client), ('asgi', AsyncClient)):
+                clients = []
+                for index in range(concurrency):
+                    user = users[index % len(users)]
+                    client = client_class()
+                    client.force_login(user)
+                    cat = Cat.objects.filter(user=user).first()
+                    clients.append((client, read_heavy_urls(cat, toys[0])))
+
+                if name == 'wsgi':
+                    runs, elapsed = run_wsgi(clients, requests)
+                else:
+                    with override_settings(ROOT_URLCONF=AsyncURLConf):
+                        runs, elapsed = asyncio.run(run_asgi(clients, requests))
+                latencies = [latency for run_latencies, statuses in runs for latency in run_latencies]
+                statuses = set().union(*(statuses for run_latencies, statuses in runs))
+                results.append(summarize_run(f'concurrency_{name}', concurrency, latencies, elapsed, statuses))
+    finally:
+        # deleting the users takes their cats, feedings and photos with them
+        User.objects.filter(id__in=[user.id for user in users]).delete()
+        # only the toys generate_dataset made - not ones added meanwhile
+        Toy.objects.filter(id__in=[toy.id for toy in toys]).delete()
+    return results, counts
+
+
+def bench_connections(repeat=200):
+    """A request's worth of connection handling, new connection vs persistent.
+
+    Sends the request_started / request_finished signals around one small
+    query, which is what closes (or keeps) the connection between requests.
+    """
+    results = []
+    settings_dict = connection.settings_dict
+    max_age = settings_dict['CONN_MAX_AGE']
+
+    def request():
+        request_started.send(sender=None)
+        try:
+            User.objects.filter(id=0).exists()
+        finally:
+            request_finished.send(sender=None)
+
+    try:
+        for name, conn_max_age in (('connections_per_request', 0), ('connections_persistent', 600)):
+            # CONN_MAX_AGE is read when the connection opens
+            settings_dict['CONN_MAX_AGE'] = conn_max_age
+            connection.close()
+            result = measure(request, repeat)
+            result.update(name=name, conn_max_age=conn_max_age, vendor=connection.vendor)
+            results.append(result)
+    finally:
+        settings_dict['CONN_MAX_AGE'] = max_age
+        connection.close()
+    return results
@@ -0,0 +1,66 @@
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+
+from .models import Cat
+
+# a user's cat list rarely changes, and every change invalidates it anyway -
+# in every process, as long as they share the cache (see CACHES in settings)
+CAT_INDEX_TIMEOUT = 60 * 15
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+# Per-user cache of the cat index
+# The cached value is the list of the user's cats. The post_save / post_delete
+# signals in signals.py drop the entry whenever one of those cats changes.
+def cat_index_key(user_id):
+    return f'cats:index:{user_id}'
+
+
+def record(name, outcome):
+    with _stats_lock:
+        _stats[f'{name}.{outcome}'] += 1
+
+
+def cache_stats():
+    # e.g. {'cat_index.hit': 10, 'cat_index.miss': 2, 'cat_index.invalidate': 1}
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_cat_index(user_id):
+    key = cat_index_key(user_id)
+    cats = cache.get(key)
+    if cats is not None:
+        record('cat_index', 'hit')
+        return cats
+    record('cat_index', 'miss')
+    cats = list(Cat.objects.filter(user_id=user_id))
+    cache.set(key, cats, CAT_INDEX_TIMEOUT)
+    return cats
+
+
+def invalidate_cat_index(user_id):
+    record('cat_index', 'invalidate')
+    cache.delete(cat_index_key(user_id))
+
+
+async def aget_cat_index(user_id):
+    # async twin of get_cat_index for the async views
+    key = cat_index_key(user_id)
+    cats = await cache.aget(key)
+    if cats is not None:
+        record('cat_index', 'hit')
+        return cats
+    record('cat_index', 'miss')
+    cats = [cat async for cat in Cat.objects.filter(user_id=user_id)]
+    await cache.aset(key, cats, CAT_INDEX_TIMEOUT)
+    return cats
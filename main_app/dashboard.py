@@ -0,0 +1,53 @@
+from datetime import date, timedelta
+
+from django.db.models import Count, FilteredRelation, Q
+
+from .models import Cat, MEALS
+
+# the longest window the dashboard reports on
+DASHBOARD_DAYS = 30
+
+
+def meal_field(label):
+    # 'Breakfast' -> 'breakfast_today'
+    return f'{label.lower()}_today'
+
+
+# Hungry Cats dashboard
+# One query: the user's cats LEFT JOINed to only their last 30 days of feedings,
+# grouped by cat, with a conditional COUNT per meal / window.
+def hungry_cats(user, today=None):
+    """Return the user's cats that are still missing a meal today.
+
+    Each cat comes back with a ``<meal>_today`` count per meal in MEALS,
+    ``meals_7_days`` / ``meals_30_days`` totals and a ``missing_meals`` list.
+    """
+    today = today or date.today()
+    recent = Q(
+        feeding__date__gte=today - timedelta(days=DASHBOARD_DAYS - 1),
+        feeding__date__lte=today,
+    )
+    per_meal = {
+        meal_field(label): Count('recent_feedings', filter=Q(recent_feedings__date=today, recent_feedings__meal=meal))
+        for meal, label in MEALS
+    }
+    still_hungry = Q()
+    for field in per_meal:
+        still_hungry |= Q(**{field: 0})
+
+    cats = (
+        Cat.objects.filter(user=user)
+        .only('id', 'name', 'breed')
+        .annotate(recent_feedings=FilteredRelation('feeding', condition=recent))
+        .annotate(
+            **per_meal,
+            meals_7_days=Count('recent_feedings', filter=Q(recent_feedings__date__gte=today - timedelta(days=6))),
+            meals_30_days=Count('recent_feedings'),
+        )
+        .filter(still_hungry)
+        .order_by('name', 'id')
+    )
+    cats = list(cats)
+    for cat in cats:
+        cat.missing_meals = [label for meal, label in MEALS if not getattr(cat, meal_field(label))]
+    return cats
@@ -0,0 +1,102 @@
+import os
+import uuid
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Cat, Photo, PHOTO_VARIANT_WIDTHS
+from .storage import SPOOL_MAX_SIZE, download_photo, photo_key_from_url, upload_photo
+from .tasks import enqueue, task
+
+# Pillow is optional - without it photos are simply served at full size
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+WEBP_QUALITY = 80
+
+
+# Photo uploads and responsive variants
+# add_photo only writes each upload to UPLOAD_SPOOL_DIR and queues store_photo.
+# The task worker sends it to S3, records the Photo and queues
+# make_photo_variants, which makes smaller WebP copies for the cards on the
+# detail page. Both retry with backoff if S3 has a bad moment (see tasks.py).
+
+def spool_upload(photo_file):
+    """Write an uploaded file to UPLOAD_SPOOL_DIR and return its path."""
+    os.makedirs(settings.UPLOAD_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(settings.UPLOAD_SPOOL_DIR, uuid.uuid4().hex)
+    with open(path, 'wb') as spooled:
+        for chunk in photo_file.chunks():
+            spooled.write(chunk)
+    return path
+
+
+def discard_upload(cat_id, path, key):
+    # on_failure hook - don't leave the upload behind
+    if os.path.exists(path):
+        os.remove(path)
+
+
+@task(on_failure=discard_upload, atomic=False)
+def store_photo(cat_id, path, key):
+    # ``key`` is picked when the upload is queued, so a retry overwrites the same object
+    if not Cat.objects.filter(id=cat_id).exists():
+        discard_upload(cat_id, path, key)
+        return
+    # upload first, with no transaction held open while S3 takes its time
+    with open(path, 'rb') as photo_file:
+        url = upload_photo(photo_file, os.environ['S3_BUCKET'], key)
+    with transaction.atomic():
+        photo = Photo.objects.create(url=url, cat_id=cat_id)
+        if Image is not None:
+            enqueue(make_photo_variants, photo.id)
+        # only once the Photo is in - if the commit fails the retry still has the file
+        transaction.on_commit(lambda: discard_upload(cat_id, path, key))
+
+
+def variant_key(key, name):
+    return f'{key.rsplit(".", 1)[0]}-{name}.webp'
+
+
+def resize_to_webp(image, width):
+    # returns a spooled file holding the WebP encoding of ``image`` scaled to ``width``
+    image.thumbnail((width, width * 10), reducing_gap=2.0)
+    variant_file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    image.save(variant_file, 'WEBP', quality=WEBP_QUALITY)
+    variant_file.seek(0)
+    return variant_file
+
+
+def create_photo_variants(photo):
+    """Build, upload and record the resized variants of one ``Photo``."""
+    bucket = os.environ['S3_BUCKET']
+    key = photo_key_from_url(photo.url)
+    fields = {}
+    with download_photo(bucket, key) as original_file, Image.open(original_file) as image:
+        fields['width'] = image.width
+        # largest first so every smaller variant is resized from the one before it
+        sizes = sorted(PHOTO_VARIANT_WIDTHS.items(), key=lambda item: item[1], reverse=True)
+        # JPEGs can be decoded straight at a reduced scale which keeps memory down
+        image.draft('RGB', (sizes[0][1], sizes[0][1] * 10))
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for name, width in sizes:
+            if width >= fields['width']:
+                continue
+            with resize_to_webp(image, width) as variant_file:
+                fields[f'{name}_url'] = upload_photo(
+                    variant_file, bucket, variant_key(key, name), content_type='image/webp'
+                )
+    Photo.objects.filter(id=photo.id).update(**fields)
+    return fields
+
+
+# not atomic - the S3 round trips run outside a transaction, the final UPDATE is one statement
+@task(atomic=False)
+def make_photo_variants(photo_id):
+    photo = Photo.objects.filter(id=photo_id).first()
+    # the photo may have been deleted since
+    if photo is not None:
+        create_photo_variants(photo)
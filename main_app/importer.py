@@ -0,0 +1,224 @@
+import csv
+import json
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from .analytics import fold_feedings
+from .cache import invalidate_cat_index
+from .ingest import clean_feeding_record, insert_ignoring_conflicts
+from .models import Cat, Checkpoint, Feeding, Toy
+from .search import reset_search_index
+from .summaries import refresh_feeding_summaries
+
+# records written per transaction - also how often the checkpoint moves
+IMPORT_CHUNK_SIZE = 5000
+
+IMPORT_TYPES = ('toys', 'cats', 'cat_toys', 'feedings')
+
+# an import's progress is the Checkpoint row with this prefix plus its name
+IMPORT_CHECKPOINT_PREFIX = 'import:'
+
+CatToy = Cat.toys.through
+
+
+# Streaming bulk import of legacy data
+# The input is read lazily, cut into chunks, and each chunk is written with
+# bulk_create inside its own transaction - together with the import's
+# Checkpoint, so a resumed import never replays a committed chunk. The record format matches the
+# /export/ NDJSON, so an export can be imported straight back:
+#   {"type": "toys", "name": "mouse", "color": "grey"}
+#   {"type": "cats", "id": 17, "name": "Lolo", "breed": "tabby", "description": "...", "age": 3}
+#   {"type": "cat_toys", "cat_id": 17, "toy__name": "mouse", "toy__color": "grey"}
+#   {"type": "feedings", "cat_id": 17, "date": "2024-01-18", "meal": "B"}
+# Cat ids in the input are legacy ids - they're mapped to the new rows as the
+# cats are created (and can also be ids of the user's existing cats).
+
+def read_records(path, input_format, default_type=None):
+    """Yield the input's records one by one as dicts."""
+    with open(path, newline='') as input_file:
+        if input_format == 'csv':
+            for record in csv.DictReader(input_file):
+                record.setdefault('type', default_type)
+                yield record
+        else:
+            for line in input_file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if isinstance(record, dict):
+                    record.setdefault('type', default_type)
+                yield record
+
+
+def too_long(model, **values):
+    # an error for the first value longer than its column, or None
+    for name, value in values.items():
+        max_length = model._meta.get_field(name).max_length
+        if max_length and len(value) > max_length:
+            return f'{name} is longer than {max_length} characters'
+    return None
+
+
+def chunked(records, size):
+    iterator = iter(records)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class Importer:
+    """Holds the lookup tables that carry over from one chunk to the next."""
+
+    def __init__(self, user, cat_ids=None):
+        self.user = user
+        # legacy cat id -> new cat id
+        self.cat_ids = {int(legacy): new for legacy, new in (cat_ids or {}).items()}
+        self.own_cat_ids = set(Cat.objects.filter(user=user).values_list('id', flat=True))
+        # (name, color) -> toy id, loaded once
+        self.toy_ids = {(name, color): toy_id for toy_id, name, color in Toy.objects.values_list('id', 'name', 'color')}
+
+    def resolve_cat(self, legacy_id):
+        try:
+            legacy_id = int(legacy_id)
+        except (TypeError, ValueError):
+            return None
+        if legacy_id in self.cat_ids:
+            return self.cat_ids[legacy_id]
+        return legacy_id if legacy_id in self.own_cat_ids else None
+
+    def resolve_toys(self, keys):
+        # creates any toys we haven't seen yet in one INSERT
+        missing = [key for key in dict.fromkeys(keys) if key not in self.toy_ids]
+        if missing:
+            for toy in Toy.objects.bulk_create(Toy(name=name, color=color) for name, color in missing):
+                self.toy_ids[(toy.name, toy.color)] = toy.id
+
+    def import_chunk(self, chunk, first_index):
+        """Write one chunk; returns (rows written per type, errors)."""
+        by_type = {name: [] for name in IMPORT_TYPES}
+        errors = []
+        for index, record in enumerate(chunk, start=first_index):
+            record_type = record.get('type') if isinstance(record, dict) else None
+            if record_type not in by_type:
+                errors.append((index, 'invalid record or unknown type'))
+            else:
+                by_type[record_type].append((index, record))
+
+        written = dict.fromkeys(IMPORT_TYPES, 0)
+        with transaction.atomic():
+            # toys first, then cats, so the links and feedings below can find them
+            toy_keys = []
+            for index, record in by_type['toys']:
+                key = (str(record.get('name') or ''), str(record.get('color') or ''))
+                error = too_long(Toy, name=key[0], color=key[1])
+                if error:
+                    errors.append((index, error))
+                elif key[0]:
+                    toy_keys.append(key)
+            for index, record in by_type['cat_toys']:
+                key = (str(record.get('toy__name') or ''), str(record.get('toy__color') or ''))
+                # one that doesn't fit is reported as an unknown toy below
+                if key[0] and not too_long(Toy, name=key[0], color=key[1]):
+                    toy_keys.append(key)
+            before = len(self.toy_ids)
+            self.resolve_toys(toy_keys)
+            written['toys'] = len(self.toy_ids) - before
+
+            cats = []
+            for index, record in by_type['cats']:
+                try:
+                    legacy_id = record.get('id')
+                    cat = Cat(
+                        name=str(record['name']), breed=str(record['breed']),
+                        description=str(record.get('description', '')), age=int(record['age']), user=self.user,
+                    )
+                    legacy_id = int(legacy_id) if legacy_id not in (None, '') else None
+                except (KeyError, TypeError, ValueError):
+                    errors.append((index, 'cats need name, breed, a numeric age and a numeric id if any'))
+                    continue
+                error = too_long(Cat, name=cat.name, breed=cat.breed, description=cat.description)
+                if error:
+                    errors.append((index, error))
+                else:
+                    cats.append((legacy_id, cat))
+            Cat.objects.bulk_create([cat for legacy_id, cat in cats])
+            for legacy_id, cat in cats:
+                self.own_cat_ids.add(cat.id)
+                if legacy_id is not None:
+                    self.cat_ids[legacy_id] = cat.id
+            written['cats'] = len(cats)
+
+            links = []
+            for index, record in by_type['cat_toys']:
+                cat_id = self.resolve_cat(record.get('cat_id'))
+                toy_id = self.toy_ids.get((str(record.get('toy__name') or ''), str(record.get('toy__color') or '')))
+                if cat_id is None or toy_id is None:
+                    errors.append((index, 'unknown cat or toy'))
+                else:
+                    links.append(CatToy(cat_id=cat_id, toy_id=toy_id))
+            # links the cat already has are skipped - and not counted
+            written['cat_toys'] = insert_ignoring_conflicts(links, ['cat', 'toy'])
+
+            feedings = []
+            for index, record in by_type['feedings']:
+                cat_id = self.resolve_cat(record.get('cat_id'))
+                feeding, error = clean_feeding_record(dict(record, cat_id=cat_id), self.own_cat_ids)
+                if error:
+                    errors.append((index, error))
+                else:
+                    feedings.append(feeding)
+            written['feedings'] = insert_ignoring_conflicts(feedings, ['cat', 'date', 'meal'])
+            # bulk inserts skip the signals that maintain the fed-today summary
+            refresh_feeding_summaries({feeding.cat_id for feeding in feedings})
+            # ...and the rollups - in the chunk's transaction, so a refresh can't miss them
+            fold_feedings(feedings)
+
+            # once the chunk - and the checkpoint that goes with it - has committed
+            if written['cats']:
+                transaction.on_commit(lambda: invalidate_cat_index(self.user.id))
+            if written['cats'] or written['toys']:
+                # bulk_create skips the signals that keep the search index current
+                transaction.on_commit(reset_search_index)
+        return written, errors
+
+
+def load_checkpoint(name):
+    """The Checkpoint of the import called ``name`` (unsaved if it's new)."""
+    name = f'{IMPORT_CHECKPOINT_PREFIX}{name}'
+    return Checkpoint.objects.filter(name=name).first() or Checkpoint(name=name)
+
+
+def run_import(user, records, chunk_size=IMPORT_CHUNK_SIZE, checkpoint=None):
+    """Import ``records`` for ``user``, resuming the import named ``checkpoint`` if any.
+
+    Yields a progress dict after every committed chunk.
+    """
+    progress = load_checkpoint(checkpoint) if checkpoint else Checkpoint()
+    importer = Importer(user, progress.state.get('cat_ids'))
+    done = progress.last_id
+    totals = dict.fromkeys(IMPORT_TYPES, 0)
+    start = time.perf_counter()
+    for chunk in chunked(islice(records, done, None), chunk_size):
+        # the chunk and the checkpoint commit together - a crash in between
+        # would otherwise replay the chunk and create its cats twice
+        with transaction.atomic():
+            written, errors = importer.import_chunk(chunk, done)
+            if checkpoint:
+                progress.last_id = done + len(chunk)
+                progress.state = {'cat_ids': importer.cat_ids}
+                progress.save()
+        done += len(chunk)
+        for name, count in written.items():
+            totals[name] += count
+        elapsed = time.perf_counter() - start
+        yield {
+            'records': done,
+            'written': dict(totals),
+            'errors': errors,
+            'elapsed': elapsed,
+            'rows_per_sec': sum(totals.values()) / elapsed if elapsed else 0,
+        }
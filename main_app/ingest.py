@@ -0,0 +1,176 @@
+import json
+
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+from django.utils.dateparse import parse_date
+
+from .analytics import fold_feedings
+from .models import Feeding, MEALS
+from .summaries import refresh_feeding_summaries
+
+# how many rows go into a single INSERT
+BULK_CHUNK_SIZE = 500
+
+# duplicate feedings removed per DELETE
+DEDUPE_BATCH_SIZE = 1000
+
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+MEAL_CODES = {meal for meal, label in MEALS}
+
+
+# Bulk feeding ingestion - used by the automatic feeders
+# A batch is a list of {"cat_id": 1, "date": "2024-01-18", "meal": "B"} records.
+# Every record is checked on its own so one bad reading doesn't sink the batch,
+# and the good ones are written with a handful of INSERTs in one transaction.
+
+def parse_feeding_records(body, content_type):
+    """Split a JSON array or NDJSON body into (index, record) pairs.
+
+    NDJSON lines that are not valid JSON come back as (index, None) so they can
+    be reported per record. A JSON body that can't be parsed at all raises
+    ValueError.
+    """
+    text = body.decode('utf-8') if isinstance(body, bytes) else body
+    if content_type in NDJSON_CONTENT_TYPES:
+        records = []
+        for index, line in enumerate(line for line in text.splitlines() if line.strip()):
+            try:
+                records.append((index, json.loads(line)))
+            except ValueError:
+                records.append((index, None))
+        return records
+
+    data = json.loads(text)
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of feedings')
+    return list(enumerate(data))
+
+
+def clean_feeding_record(record, cat_ids):
+    # returns (Feeding, None) or (None, error message)
+    if not isinstance(record, dict):
+        return None, 'record must be a JSON object'
+    cat_id = record.get('cat_id')
+    # a real JSON integer - no "12", 1.5 or true (bool is an int subclass, hence type() is)
+    if type(cat_id) is not int:
+        return None, 'cat_id must be an integer'
+    if cat_id not in cat_ids:
+        return None, f'unknown cat: {cat_id}'
+    try:
+        feeding_date = parse_date(str(record.get('date')))
+    except ValueError:
+        feeding_date = None
+    if feeding_date is None:
+        return None, 'date must be YYYY-MM-DD'
+    meal = record.get('meal')
+    if meal not in MEAL_CODES:
+        return None, f'meal must be one of {", ".join(sorted(MEAL_CODES))}'
+    return Feeding(cat_id=cat_id, date=feeding_date, meal=meal), None
+
+
+def insert_ignoring_conflicts(objs, fields, batch_size=BULK_CHUNK_SIZE):
+    """INSERT ``objs`` (``fields`` only), skipping rows that hit a unique constraint.
+
+    Returns how many rows actually went in - bulk_create(ignore_conflicts=True)
+    can't tell, so this counts the rows RETURNING hands back.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    model = type(objs[0])
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    model_fields = [model._meta.get_field(name) for name in fields]
+    columns = ', '.join(quote(field.column) for field in model_fields)
+    row = f'({", ".join(["%s"] * len(model_fields))})'
+    inserted = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(getattr(obj, field.attname), connection)
+                for obj in batch
+                for field in model_fields
+            ]
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES {", ".join([row] * len(batch))} '
+                f'ON CONFLICT DO NOTHING RETURNING {quote(model._meta.pk.column)}',
+                params,
+            )
+            inserted += len(cursor.fetchall())
+    return inserted
+
+
+def ingest_feedings(records, cat_ids, batch_size=BULK_CHUNK_SIZE):
+    """Validate, dedupe and insert feeding records.
+
+    ``cat_ids`` is the set of cats the caller is allowed to feed. Returns a
+    summary dict with the number created, the number of duplicates skipped and
+    a list of per-record errors.
+    """
+    errors = []
+    candidates = {}
+    duplicates = 0
+    for index, record in records:
+        if record is None:
+            errors.append({'index': index, 'error': 'invalid JSON'})
+            continue
+        feeding, error = clean_feeding_record(record, cat_ids)
+        if error:
+            errors.append({'index': index, 'error': error})
+            continue
+        key = (feeding.cat_id, feeding.date, feeding.meal)
+        if key in candidates:
+            duplicates += 1
+        else:
+            candidates[key] = feeding
+
+    # one query to find the readings we already have
+    if candidates:
+        existing = set(
+            Feeding.objects.filter(
+                cat_id__in={key[0] for key in candidates},
+                date__in={key[1] for key in candidates},
+            ).values_list('cat_id', 'date', 'meal')
+        )
+        for key in existing & candidates.keys():
+            del candidates[key]
+            duplicates += 1
+
+    with transaction.atomic():
+        # ON CONFLICT DO NOTHING - a batch racing another one can't fail on the unique
+        # constraint, and the rows it got to first are counted as duplicates, not created
+        created = insert_ignoring_conflicts(candidates.values(), ['cat', 'date', 'meal'], batch_size)
+        # bulk_create skips the signals that maintain the fed-today summary
+        refresh_feeding_summaries({key[0] for key in candidates})
+        # ...and the rollups - in this transaction, so a refresh can't miss them
+        fold_feedings(candidates.values())
+
+    return {
+        'created': created,
+        'duplicates': duplicates + len(candidates) - created,
+        'errors': errors,
+    }
+
+
+def delete_duplicate_feedings(model=Feeding, batch_size=DEDUPE_BATCH_SIZE):
+    """Delete every feeding that repeats an earlier one's (cat, date, meal).
+
+    The oldest row of each group is kept. Yields the number deleted per batch.
+    ``model`` can be a historical Feeding from a migration state.
+    """
+    earlier = model.objects.filter(
+        cat_id=OuterRef('cat_id'), date=OuterRef('date'), meal=OuterRef('meal'), id__lt=OuterRef('id'),
+    )
+    duplicates = model.objects.filter(Exists(earlier)).order_by().values_list('id', flat=True)
+    table = model._meta.db_table
+    connection = connections[duplicates.db]
+    while ids := list(duplicates[:batch_size]):
+        # plain DELETE - a duplicate never changes a cat's fed-today summary,
+        # so there's nothing for the delete signals to do
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {connection.ops.quote_name(table)} WHERE id IN ({", ".join(["%s"] * len(ids))})', ids
+            )
+        yield len(ids)
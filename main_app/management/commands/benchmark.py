@@ -0,0 +1,163 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from main_app.benchmarks import (
+    bench_analytics, bench_api, bench_auth, bench_concurrency, bench_connections, bench_hungry_cats, bench_routes,
+    bench_search, bench_static, bench_toy_links,
+)
+
+SUITES = ('routes', 'api', 'auth', 'hungry_cats', 'toy_links', 'connections', 'search', 'analytics', 'static', 'concurrency')
+# concurrency commits its data (and deletes it again), so it only runs when asked for
+DEFAULT_SUITES = ('routes', 'api', 'auth', 'hungry_cats', 'toy_links', 'connections', 'search', 'analytics', 'static')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Run the performance benchmarks against synthetic data (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f'any of: {", ".join(SUITES)} (default: {", ".join(DEFAULT_SUITES)})')
+        parser.add_argument('--repeat', type=int, default=20, help='timed runs per benchmark')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--cats-per-user', type=int, default=10)
+        parser.add_argument('--toys', type=int, default=100)
+        parser.add_argument('--feeding-days', type=int, default=30, help='days of feedings per cat')
+        parser.add_argument('--hungry-cats', type=int, default=1000, help='cats for the hungry_cats suite')
+        parser.add_argument('--link-cats', type=int, default=200, help='cats for the toy_links suite')
+        parser.add_argument('--concurrency', type=int, default=8, help='simultaneous clients for the concurrency suite')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='print p50 / query deltas against an earlier --output file')
+
+    def handle(self, *args, **options):
+        suites = options['suites'] or DEFAULT_SUITES
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            raise CommandError(f'Unknown benchmark suite: {", ".join(sorted(unknown))}')
+        report = {
+            'revision': git_revision(),
+            # DATABASE_URL decides what we run against - PostgreSQL or a SQLite stand-in
+            'database': connection.vendor,
+            'created': datetime.now(timezone.utc).isoformat(),
+            'results': [],
+        }
+        if 'routes' in suites:
+            results, counts = bench_routes(
+                repeat=options['repeat'],
+                users=options['users'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                feeding_days=options['feeding_days'],
+                seed=options['seed'],
+            )
+            report['dataset'] = counts
+            report['results'].extend(results)
+        if 'api' in suites:
+            results, counts = bench_api(
+                repeat=options['repeat'],
+                users=options['users'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                feeding_days=options['feeding_days'],
+                seed=options['seed'],
+            )
+            report['results'].extend(results)
+        if 'auth' in suites:
+            results, counts = bench_auth(
+                repeat=options['repeat'],
+                users=options['users'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                feeding_days=options['feeding_days'],
+                seed=options['seed'],
+            )
+            report['results'].extend(results)
+        if 'hungry_cats' in suites:
+            report['results'].append(bench_hungry_cats(
+                cats=options['hungry_cats'], days=options['feeding_days'], repeat=options['repeat'],
+            ))
+        if 'toy_links' in suites:
+            report['results'].extend(bench_toy_links(cats=options['link_cats'], repeat=options['repeat']))
+        if 'connections' in suites:
+            report['results'].extend(bench_connections(repeat=options['repeat'] * 10))
+        if 'search' in suites:
+            results, counts = bench_search(
+                repeat=options['repeat'],
+                users=options['users'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                feeding_days=1,
+                seed=options['seed'],
+            )
+            report['results'].extend(results)
+        if 'analytics' in suites:
+            results, counts = bench_analytics(
+                repeat=options['repeat'],
+                users=options['users'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                feeding_days=options['feeding_days'],
+                seed=options['seed'],
+            )
+            report['results'].extend(results)
+        if 'static' in suites:
+            report['results'].extend(bench_static(repeat=options['repeat']))
+        if 'concurrency' in suites:
+            results, counts = bench_concurrency(
+                concurrency=options['concurrency'],
+                requests=options['repeat'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                feeding_days=options['feeding_days'],
+                seed=options['seed'],
+            )
+            report['results'].extend(results)
+
+        for result in report['results']:
+            # the concurrency suite reports throughput instead of queries
+            if 'requests_per_sec' in result:
+                extra = f"req/s {result['requests_per_sec']:>8.1f}"
+            else:
+                extra = f"queries {result['queries_per_run']:>6.1f}"
+            if 'bytes' in result:
+                extra += f"  bytes {result['bytes']:>8}"
+            if 'repeat_requests' in result:
+                extra += f"  repeat requests {result['repeat_requests']}"
+            self.stdout.write(
+                f"{result['name']:<32} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                f"p99 {result['p99_ms']:>9.2f}ms  {extra}"
+            )
+
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = {result['name']: result for result in json.load(baseline_file)['results']}
+            self.stdout.write(f"\nCompared with {options['compare']}:")
+            for result in report['results']:
+                before = baseline.get(result['name'])
+                if before and 'requests_per_sec' in result:
+                    self.stdout.write(
+                        f"{result['name']:<20} p50 {result['p50_ms'] - before['p50_ms']:>+9.2f}ms  "
+                        f"req/s {result['requests_per_sec'] - before['requests_per_sec']:>+8.1f}"
+                    )
+                elif before:
+                    self.stdout.write(
+                        f"{result['name']:<20} p50 {result['p50_ms'] - before['p50_ms']:>+9.2f}ms  "
+                        f"queries {result['queries_per_run'] - before['queries_per_run']:>+6.1f}"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main_app.ingest import DEDUPE_BATCH_SIZE, delete_duplicate_feedings
+
+
+class Command(BaseCommand):
+    help = 'Delete feedings that repeat the same cat, date and meal, keeping the oldest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=DEDUPE_BATCH_SIZE,
+            help=f'duplicates deleted per batch (default {DEDUPE_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for count in delete_duplicate_feedings(batch_size=options['batch_size']):
+            total += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {total} duplicates deleted')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {total} duplicate feedings'))
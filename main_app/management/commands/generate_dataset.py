@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main_app.synthetic import SYNTHETIC_PASSWORD, generate_dataset
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, cats, toys, feedings and photos for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--cats-per-user', type=int, default=10)
+        parser.add_argument('--toys', type=int, default=100)
+        parser.add_argument('--toys-per-cat', type=int, default=3)
+        parser.add_argument('--feeding-days', type=int, default=30, help='days of feedings per cat')
+        parser.add_argument('--photos-per-cat', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000, help='rows per INSERT')
+        parser.add_argument('--seed', type=int, default=None, help='random seed for repeatable data')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            counts, users, toys = generate_dataset(
+                users=options['users'],
+                cats_per_user=options['cats_per_user'],
+                toys=options['toys'],
+                toys_per_cat=options['toys_per_cat'],
+                feeding_days=options['feeding_days'],
+                photos_per_cat=options['photos_per_cat'],
+                batch_size=options['batch_size'],
+                seed=options['seed'],
+                log=self.stdout.write if options['verbosity'] > 1 else None,
+            )
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary}'))
+        if users:
+            self.stdout.write(f'Log in as {users[0].username} / {SYNTHETIC_PASSWORD}')
@@ -0,0 +1,48 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.importer import IMPORT_CHUNK_SIZE, IMPORT_TYPES, read_records, run_import
+
+
+class Command(BaseCommand):
+    help = 'Stream legacy cats, toys, cat-toy links and feedings from CSV or NDJSON into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='input file')
+        parser.add_argument('--user', required=True, help='username that will own the imported cats')
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='defaults to the file extension')
+        parser.add_argument('--type', choices=IMPORT_TYPES, help='record type for inputs without a "type" column')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='records per transaction')
+        parser.add_argument(
+            '--checkpoint',
+            help='name for this import\'s progress (kept in the database) - an interrupted import run again '
+                 'with the same name picks up where it stopped',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+        input_format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        records = read_records(options['path'], input_format, default_type=options['type'])
+
+        progress = None
+        error_count = 0
+        for progress in run_import(user, records, options['chunk_size'], options['checkpoint']):
+            for index, error in progress['errors']:
+                error_count += 1
+                self.stderr.write(f'record {index + 1}: {error}')
+            if options['verbosity'] > 1:
+                self.stdout.write(
+                    f"{progress['records']} records, {progress['rows_per_sec']:.0f} rows/sec"
+                )
+
+        if progress is None:
+            self.stdout.write('Nothing to import')
+            return
+        written = ', '.join(f'{count} {name}' for name, count in progress['written'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {written} in {progress['elapsed']:.1f}s "
+            f"({progress['rows_per_sec']:.0f} rows/sec, {error_count} errors)"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from main_app.summaries import SUMMARY_BATCH_SIZE, rebuild_feeding_summaries
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild every cat's fed-today summary from its Feeding rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=SUMMARY_BATCH_SIZE,
+            help=f'cats rebuilt per batch (default {SUMMARY_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for count in rebuild_feeding_summaries(batch_size=options['batch_size']):
+            total += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {total} cats rebuilt')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt feeding summaries for {total} cats'))
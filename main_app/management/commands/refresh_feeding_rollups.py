@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from main_app.analytics import ROLLUP_CHUNK_SIZE, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = 'Fold new feedings into the daily feeding rollups behind /stats/feedings/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='throw the rollups away and rebuild them from every feeding (after feedings are edited or deleted)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=ROLLUP_CHUNK_SIZE,
+            help=f'feedings read per batch (default {ROLLUP_CHUNK_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        read = written = 0
+        for batch_read, batch_written in refresh_rollups(full=options['full'], chunk_size=options['batch_size']):
+            read += batch_read
+            written += batch_written
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  {read} feedings read, {written} rollups written')
+        self.stdout.write(self.style.SUCCESS(f'Refreshed feeding rollups: {read} feedings read, {written} rollups written'))
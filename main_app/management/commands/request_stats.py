@@ -0,0 +1,38 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app import stats
+
+
+class Command(BaseCommand):
+    help = 'Print per-route request timing percentiles merged from every worker process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.REQUEST_STATS_DIR, help='defaults to REQUEST_STATS_DIR')
+        parser.add_argument('--json', action='store_true', help='print the raw summary as JSON')
+
+    def handle(self, *args, **options):
+        if not options['dir']:
+            raise CommandError('Set REQUEST_STATS_DIR (or pass --dir) so the workers dump their stats')
+        summary = stats.summarize(stats.load_dumps(options['dir']))
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+        if not summary:
+            self.stdout.write('No requests recorded yet')
+            return
+        # slowest routes first
+        routes = sorted(summary.items(), key=lambda item: item[1]['wall_ms']['p95'], reverse=True)
+        self.stdout.write(
+            f"{'route':<24} {'requests':>8} {'p50 ms':>9} {'p95 ms':>9} {'queries p95':>12} "
+            f"{'db p95 ms':>10} {'tmpl p95 ms':>12} {'bytes p95':>10}"
+        )
+        for url_name, route in routes:
+            self.stdout.write(
+                f"{url_name:<24} {route['requests']:>8} {route['wall_ms']['p50']:>9.1f} "
+                f"{route['wall_ms']['p95']:>9.1f} {route['queries']['p95']:>12.0f} "
+                f"{route['db_ms']['p95']:>10.1f} {route['template_ms']['p95']:>12.1f} "
+                f"{route.get('bytes', {}).get('p95', 0):>10.0f}"
+            )
@@ -0,0 +1,64 @@
+import json
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from main_app.tasks import POLL_INTERVAL, Worker, queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (photo uploads, resizing) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='tasks run at once per process (default 4, 0 runs them in the main thread)',
+        )
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='worker processes (default 1) - more helps CPU heavy tasks like resizing',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=POLL_INTERVAL,
+            help=f'seconds between looks for new tasks when idle (default {POLL_INTERVAL})',
+        )
+        parser.add_argument('--burst', action='store_true', help='exit once no task is due instead of waiting for more')
+        parser.add_argument('--stats', action='store_true', help='print the queue depth and task timings as JSON and exit')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(json.dumps(queue_stats(), indent=2))
+            return
+        if options['processes'] <= 1:
+            processed = self.work(options)
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} tasks'))
+            return
+
+        # the children inherit this process - they must not share its DB connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=self.work, args=(options,)) for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+        # pass a stop on to the children (SIGTERM) and wait for them to finish up
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda signum, frame: [child.terminate() for child in children])
+        for child in children:
+            child.join()
+
+    def work(self, options):
+        log = self.stdout.write if options['verbosity'] > 1 else None
+        worker = Worker(threads=options['threads'], poll_interval=options['poll_interval'], log=log)
+        # Ctrl-C / SIGTERM let the running tasks finish
+        handlers = {
+            signum: signal.signal(signum, lambda signum, frame: worker.stop())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        self.stdout.write(f'Worker {worker.name} started with {worker.threads} threads')
+        try:
+            return worker.run(burst=options['burst'])
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
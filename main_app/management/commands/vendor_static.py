@@ -0,0 +1,35 @@
+import os
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.staticfiles import VENDOR_ASSETS, VENDOR_DIR, is_vendored, sri_hash
+
+
+class Command(BaseCommand):
+    help = 'Download the third-party CSS / JS in staticfiles.VENDOR_ASSETS into main_app/static/vendor/ (commit them)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='download files that are already vendored again')
+
+    def handle(self, *args, **options):
+        for name, (url, integrity) in VENDOR_ASSETS.items():
+            path = os.path.join(VENDOR_DIR, *name.split('/'))
+            if os.path.exists(path) and not options['force']:
+                self.stdout.write(f'  {name} already vendored')
+                continue
+            try:
+                with urlopen(url, timeout=30) as response:
+                    content = response.read()
+            except OSError as e:
+                raise CommandError(f'Could not download {url}: {e}')
+            # nothing is written unless it's the file the pinned hash was taken from
+            if sri_hash(content) != integrity:
+                raise CommandError(f'{url} does not match its pinned hash: expected {integrity}, got {sri_hash(content)}')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as vendored_file:
+                vendored_file.write(content)
+            self.stdout.write(f'  {name} {len(content)} bytes, {integrity} checked')
+        # templates switch from the CDN to the local copies
+        is_vendored.cache_clear()
+        self.stdout.write(self.style.SUCCESS(f'Vendored {len(VENDOR_ASSETS)} files into {VENDOR_DIR}'))
@@ -0,0 +1,178 @@
+import mimetypes
+import os
+import time
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import stats
+from .staticfiles import COMPRESSIBLE_EXTENSIONS, is_hashed
+
+# hashed static files never change, so browsers may keep them for good
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# the encodings we keep pre-compressed copies in, best first
+STATIC_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def install_db_timers():
+    # db_timer stays on the connections for good - it does nothing outside a
+    # request, and leaving it on means one install covers every query
+    for connection in connections.all():
+        if stats.db_timer not in connection.execute_wrappers:
+            connection.execute_wrappers.append(stats.db_timer)
+
+
+# Request stats middleware
+# Records wall time, DB query count / time, template render time and response
+# size for every request under its URL name. Put it first in MIDDLEWARE so the
+# wall time covers the rest of the stack. Works under both WSGI and ASGI.
+class RequestStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.dump_dir = getattr(settings, 'REQUEST_STATS_DIR', None)
+        self.dump_every = getattr(settings, 'REQUEST_STATS_DUMP_SECONDS', 10)
+        self.last_dump = time.monotonic()
+        stats.install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        sample = stats.new_sample()
+        token = stats.current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            install_db_timers()
+            response = self.get_response(request)
+        finally:
+            stats.current_sample.reset(token)
+        return self.finish(request, response, sample, start)
+
+    async def __acall__(self, request):
+        sample = stats.new_sample()
+        token = stats.current_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            # the async ORM runs its queries on the sync thread, whose
+            # connections are not the ones we can see from the event loop
+            await sync_to_async(install_db_timers)()
+            response = await self.get_response(request)
+        finally:
+            stats.current_sample.reset(token)
+        return self.finish(request, response, sample, start)
+
+    def finish(self, request, response, sample, start):
+        sample['wall_ms'] = (time.perf_counter() - start) * 1000
+        if not response.streaming:
+            sample['bytes'] = len(response.content)
+
+        match = request.resolver_match
+        stats.record(match.view_name if match else '<unresolved>', sample)
+        self.maybe_dump()
+        return response
+
+    def maybe_dump(self):
+        if self.dump_dir and time.monotonic() - self.last_dump >= self.dump_every:
+            self.last_dump = time.monotonic()
+            stats.dump(self.dump_dir)
+
+
+def accepted_encodings(header):
+    # Accept-Encoding -> the set of codings the client takes (q=0 means "not this one")
+    accepted = set()
+    for part in header.split(','):
+        coding, *params = [item.strip() for item in part.split(';')]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0
+        if coding and quality > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def static_response(request, path, name):
+    """Response for one file in STATIC_ROOT, in the best encoding the client accepts."""
+    mtime = os.stat(path).st_mtime
+    hashed = is_hashed(name)
+    compressible = name.lower().endswith(COMPRESSIBLE_EXTENSIONS)
+    if not hashed and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), mtime):
+        response = HttpResponseNotModified()
+    else:
+        served, encoding = path, None
+        if compressible:
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            for candidate, suffix in STATIC_ENCODINGS:
+                if candidate in accepted and os.path.isfile(path + suffix):
+                    served, encoding = path + suffix, candidate
+                    break
+        with open(served, 'rb') as static_file:
+            content = static_file.read()
+        content_type, _ = mimetypes.guess_type(name)
+        response = HttpResponse(content, content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(mtime)
+    if compressible:
+        patch_vary_headers(response, ['Accept-Encoding'])
+    response['Cache-Control'] = IMMUTABLE if hashed else f'public, max-age={settings.STATIC_MAX_AGE}'
+    return response
+
+
+# Static files middleware
+# Serves what collectstatic wrote to STATIC_ROOT straight from the app, ahead
+# of the URLconf, so no separate web server is needed for it. Hashed names
+# (STATIC_PIPELINE) are cached by browsers for a year and never asked for
+# again; anything else gets STATIC_MAX_AGE and a Last-Modified to revalidate
+# against. Files are read whole - static assets are small - and requests for
+# anything not in STATIC_ROOT fall through to the rest of the stack.
+class StaticFilesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.root = settings.STATIC_ROOT
+        # nothing to do when the files live on another host (a CDN STATIC_URL)
+        static_url = urlsplit(settings.STATIC_URL or '')
+        self.prefix = static_url.path if self.root and static_url.path and not static_url.netloc else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # small local file reads - not worth a thread hop
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        if self.prefix is None or request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        name = request.path[len(self.prefix):]
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+        return static_response(request, path, name)
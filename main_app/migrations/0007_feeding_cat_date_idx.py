@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0006_cat_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feeding',
+            index=models.Index(fields=['cat', 'date'], name='feeding_cat_date_idx'),
+        ),
+    ]
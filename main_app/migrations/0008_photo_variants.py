@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0007_feeding_cat_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='medium_url',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='small_url',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0008_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cat',
+            name='last_fed_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='cat',
+            name='last_fed_meals',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_cat_last_fed_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='toy',
+            index=models.Index(fields=['name', 'id'], name='toy_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toy',
+            index=models.Index(fields=['color', 'name'], name='toy_color_name_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_toy_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='toy',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# Full-text search columns for PostgreSQL (see main_app/search.py)
+# Generated columns, so PostgreSQL keeps them current on every INSERT / UPDATE -
+# bulk_create included. They aren't model fields; other databases skip this
+# migration and search with an in-process index instead.
+
+SEARCH_COLUMNS = {
+    'main_app_cat': (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(breed, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+    ),
+    'main_app_toy': (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(color, '')), 'B')"
+    ),
+}
+
+
+def add_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, expression in SEARCH_COLUMNS.items():
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ({expression}) STORED'
+        )
+        schema_editor.execute(f'CREATE INDEX {table}_search_idx ON {table} USING gin (search_vector)')
+
+
+def remove_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in SEARCH_COLUMNS:
+        # the index goes with the column
+        schema_editor.execute(f'ALTER TABLE {table} DROP COLUMN search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_toy_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vectors, remove_search_vectors),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_search_vectors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # the new indexes are built before the ones they replace are dropped
+    operations = [
+        migrations.AddIndex(
+            model_name='cat',
+            index=models.Index(fields=['user', 'name', 'id'], name='cat_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feeding',
+            index=models.Index(fields=['cat', '-date', '-id'], name='feeding_cat_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='toy',
+            index=models.Index(fields=['updated_at'], name='toy_updated_at_idx'),
+        ),
+        migrations.AlterField(
+            model_name='cat',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='feeding',
+            name='cat',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.cat'),
+        ),
+        migrations.RemoveIndex(
+            model_name='feeding',
+            name='feeding_cat_date_idx',
+        ),
+    ]
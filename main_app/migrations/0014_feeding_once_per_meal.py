@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:45
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+# duplicate ids deleted per statement
+BATCH_SIZE = 1000
+
+
+def delete_duplicates(apps, schema_editor):
+    # the constraint can't be added while duplicates exist - on a big table
+    # run `manage.py dedupe_feedings` first so this finds nothing to do.
+    # Self-contained (no main_app imports) so later changes to the app can't
+    # change what this migration does; the oldest row of each group is kept.
+    Feeding = apps.get_model('main_app', 'Feeding')
+    feedings = Feeding.objects.using(schema_editor.connection.alias)
+    earlier = feedings.filter(
+        cat_id=OuterRef('cat_id'), date=OuterRef('date'), meal=OuterRef('meal'), id__lt=OuterRef('id'),
+    )
+    duplicates = feedings.filter(Exists(earlier)).order_by().values_list('id', flat=True)
+    while ids := list(duplicates[:BATCH_SIZE]):
+        feedings.filter(id__in=ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_index_plan'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='feeding',
+            constraint=models.UniqueConstraint(fields=('cat', 'date', 'meal'), name='feeding_once_per_meal'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0014_feeding_once_per_meal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FeedingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meals', models.PositiveSmallIntegerField(default=0)),
+                ('cat', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='main_app.cat')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='feedingrollup',
+            constraint=models.UniqueConstraint(fields=('cat', 'date'), name='feeding_rollup_cat_date'),
+        ),
+    ]
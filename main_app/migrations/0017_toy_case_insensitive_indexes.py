@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# Case-insensitive indexes for the available toys filters (see queries.py)
+# name__istartswith / color__iexact compare UPPER(column) on PostgreSQL and
+# use LIKE on SQLite, so the plain (name, id) / (color, name) indexes can't be
+# searched. These index what the lookups actually compare; they aren't in
+# Toy.Meta because the operator class / collation is specific to each database.
+
+TOY_INDEXES = {
+    'postgresql': {
+        # text_pattern_ops lets LIKE 'prefix%' seek whatever the database collation
+        'toy_name_upper_idx': '(UPPER(name) text_pattern_ops)',
+        'toy_color_upper_name_idx': '(UPPER(color), name, id)',
+    },
+    'sqlite': {
+        # SQLite only turns a case-insensitive LIKE into an index search on a NOCASE index
+        'toy_name_nocase_idx': '(name COLLATE NOCASE)',
+        'toy_color_nocase_name_idx': '(color COLLATE NOCASE, name, id)',
+    },
+}
+
+
+def add_toy_indexes(apps, schema_editor):
+    for name, columns in TOY_INDEXES.get(schema_editor.connection.vendor, {}).items():
+        schema_editor.execute(f'CREATE INDEX {name} ON main_app_toy {columns}')
+
+
+def remove_toy_indexes(apps, schema_editor):
+    for name in TOY_INDEXES.get(schema_editor.connection.vendor, {}):
+        schema_editor.execute(f'DROP INDEX {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0016_tasks'),
+    ]
+
+    # the case-sensitive (color, name) index served nothing once these exist
+    operations = [
+        migrations.RunPython(add_toy_indexes, remove_toy_indexes),
+        migrations.RemoveIndex(
+            model_name='toy',
+            name='toy_color_name_idx',
+        ),
+    ]
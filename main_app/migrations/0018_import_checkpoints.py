@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0017_toy_case_insensitive_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='checkpoint',
+            name='state',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.AlterField(
+            model_name='checkpoint',
+            name='name',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+    ]
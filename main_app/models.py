@@ -1,5 +1,7 @@
 from django.db import models
+from django.db.models.functions import Now
 from django.urls import reverse
+from django.utils import timezone
 from datetime import date
 
 from django.contrib.auth.models import User
@@ -11,17 +13,33 @@ MEALS = (
     ('D', 'Dinner')
 )
 
+# each meal gets one bit so a day's feedings fit in a single small integer
+# e.g. Breakfast + Dinner = 0b101 = 5
+MEAL_BITS = {meal: 1 << position for position, (meal, label) in enumerate(MEALS)}
+ALL_MEALS_MASK = sum(MEAL_BITS.values())
+
 # Create your models here.
 # The Toy model for our M:M relationship
 class Toy(models.Model):
     name = models.CharField(max_length=50)
     color = models.CharField(max_length=20)
+    # bumped on every save - used for ETags and the toy card fragment cache
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.color} {self.name}'
 
     def get_absolute_url(self):
-        return reverse('toy_detail', kwargs={'pk': self.id})
+        return reverse('toys_detail', kwargs={'pk': self.id})
+
+    class Meta:
+        indexes = [
+            # available toys are paged by (name, id) - the case-insensitive
+            # name / color filters have their own indexes (migration 0017)
+            models.Index(fields=['name', 'id'], name='toy_name_idx'),
+            # MAX(updated_at) is the toy catalog's conditional GET version
+            models.Index(fields=['updated_at'], name='toy_updated_at_idx'),
+        ]
 
 
 class Cat(models.Model):
@@ -33,7 +51,15 @@ class Cat(models.Model):
     # Cats >--< Toys
     toys = models.ManyToManyField(Toy)
     # Add the foreign key linking cat to a user instance
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # (no index of its own - cat_user_name_idx starts with user)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    # Denormalized summary of the most recent feeding day
+    # kept up to date by summaries.py so the fed-today status needs no query
+    last_fed_date = models.DateField(null=True, blank=True)
+    last_fed_meals = models.PositiveSmallIntegerField(default=0)
+    # bumped on every save and summary update - the API's ETag version. The
+    # database default covers rows the raw INSERTs write (ingest.insert_ignoring_conflicts)
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
 
     def __str__(self):
         return self.name
@@ -44,11 +70,27 @@ class Cat(models.Model):
         return reverse('detail', kwargs={'cat_id': self.id})
     
     # this is how we can view related data from the main parent model
+    # the meals come from the last_fed_* summary columns - no extra query
+    def meals_fed_today(self):
+        if self.last_fed_date != date.today():
+            return set()
+        return {meal for meal, bit in MEAL_BITS.items() if self.last_fed_meals & bit}
+
+    # returns a list of (label, fed) 2-tuples - one for each meal in MEALS
+    def meal_status_for_today(self):
+        fed = self.meals_fed_today()
+        return [(label, meal in fed) for meal, label in MEALS]
+
     def fed_for_today(self):
-        # we can use django's filter, which produces a queryset for all feedings
-        # we'll look at the array(QuerySet) and compare it to the length of the MEALS tuple
+        # every meal in MEALS has its bit set for today
         # we can return a boolean that will be useful in our detail template
-        return self.feeding_set.filter(date=date.today()).count() >= len(MEALS)
+        return self.last_fed_date == date.today() and self.last_fed_meals == ALL_MEALS_MASK
+
+    class Meta:
+        indexes = [
+            # a user's cats, in the name order the dashboard lists them in
+            models.Index(fields=['user', 'name', 'id'], name='cat_user_name_idx'),
+        ]
 
 
 # This is a model for feedings - this is a 1:M relationship with Cats
@@ -74,7 +116,10 @@ class Feeding(models.Model):
     # in the database, the column in the feedings table for the FK will be called "cat_id"
     # because Django, by default, appends _id to the name of the model
     # DO NOT CONFUSE THIS WITH MONGODB and THEIR `._id` - NOT THE SAME
-    cat = models.ForeignKey(Cat, on_delete=models.CASCADE)
+    # (no index of its own - feeding_cat_recent_idx starts with cat)
+    cat = models.ForeignKey(Cat, on_delete=models.CASCADE, db_index=False)
+    # like Cat.updated_at - the API's ETag version for a cat's feedings
+    updated_at = models.DateTimeField(auto_now=True, db_default=Now())
     
     def __str__(self):
         return f"{self.get_meal_display()} on {self.date} for {self.cat}"
@@ -82,13 +127,115 @@ class Feeding(models.Model):
     # change the default sort
     class Meta:
         ordering = [ '-date' ]
+        indexes = [
+            # a cat's feedings newest first - the keyset-paginated history reads
+            # it in order and the dashboard / summaries read date ranges from it
+            models.Index(fields=['cat', '-date', '-id'], name='feeding_cat_recent_idx'),
+        ]
+        constraints = [
+            # a meal is fed once a day - double submits and feeder retries are no-ops
+            models.UniqueConstraint(fields=['cat', 'date', 'meal'], name='feeding_once_per_meal'),
+        ]
+
+
+# Resized WebP copies we keep of every photo - name: width in pixels
+PHOTO_VARIANT_WIDTHS = {
+    'small': 320,
+    'medium': 800,
+}
 
 
 # Photo Model
 class Photo(models.Model):
     url = models.CharField(max_length=200)
     cat = models.ForeignKey(Cat, on_delete=models.CASCADE)
+    # the resized variants are filled in by a background worker after upload
+    width = models.PositiveIntegerField(null=True, blank=True)
+    small_url = models.CharField(max_length=200, blank=True)
+    medium_url = models.CharField(max_length=200, blank=True)
 
     def __str__(self):
         return f'Photo for cat_id: {self.cat_id} @{self.url}'
+
+    # the smallest image that's still big enough for a card
+    def display_url(self):
+        return self.medium_url or self.url
+
+    # value for the <img srcset> attribute - empty until the variants exist
+    def srcset(self):
+        candidates = [
+            f'{getattr(self, f"{name}_url")} {width}w'
+            for name, width in PHOTO_VARIANT_WIDTHS.items()
+            if getattr(self, f'{name}_url')
+        ]
+        if candidates and self.width:
+            candidates.append(f'{self.url} {self.width}w')
+        return ', '.join(candidates)
     
+
+
+# Daily feeding rollup - one row per cat per day it was fed
+# `meals` is the day's MEAL_BITS mask. Filled in by analytics.refresh_rollups
+# (`manage.py refresh_feeding_rollups`) so the feeding stats read a handful of
+# small rows instead of every Feeding.
+class FeedingRollup(models.Model):
+    # (no index of its own - the unique constraint starts with cat)
+    cat = models.ForeignKey(Cat, on_delete=models.CASCADE, db_index=False)
+    date = models.DateField()
+    meals = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f'Rollup for cat_id: {self.cat_id} on {self.date}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cat', 'date'], name='feeding_rollup_cat_date'),
+        ]
+
+
+# How far a background job has got through a table, e.g. the highest Feeding
+# id the rollups have seen, or the records an import has written. Saved in the
+# same transaction as the work it records, so the two can't disagree.
+class Checkpoint(models.Model):
+    name = models.CharField(max_length=200, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # anything else a job needs to resume, e.g. an import's legacy -> new cat ids
+    state = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f'{self.name} @{self.last_id}'
+
+
+TASK_STATUSES = (
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('failed', 'Failed'),
+)
+
+
+# Background task - one queued call of a function registered with tasks.task()
+# Workers (`manage.py run_tasks`) claim queued rows whose run_at has passed.
+class Task(models.Model):
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=TASK_STATUSES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=1)
+    # when it may (next) run - pushed back after every failed attempt
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # the worker that claimed it last
+    claimed_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
+
+    class Meta:
+        indexes = [
+            # workers look for the oldest due queued tasks
+            models.Index(fields=['status', 'run_at'], name='task_status_run_at_idx'),
+        ]
@@ -0,0 +1,117 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# how many rows a page holds unless the caller says otherwise
+PAGE_SIZE = 20
+
+
+# Keyset (a.k.a. cursor / seek) pagination
+# Instead of OFFSET - which makes the database walk every skipped row - we remember
+# the sort values of the last row we sent and ask for the rows that come after it.
+# Page N costs the same as page 1 as long as an index covers the ordering.
+class KeysetPage:
+    def __init__(self, rows, next_cursor):
+        self.rows = rows
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    raw = json.dumps([str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # raises ValueError for anything we did not hand out ourselves
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError) as error:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from error
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f'Invalid cursor: {cursor!r}')
+    return values
+
+
+def _rows_after(ordering, values):
+    # (a, b) > (x, y)  ==>  a > x OR (a = x AND b > y)
+    condition = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        equal = {f.lstrip('-'): value for f, value in zip(ordering[:position], values)}
+        condition |= Q(**equal, **{f'{name}__{lookup}': values[position]})
+    return condition
+
+
+def _ordering_field(queryset, name):
+    # a model field, or an annotation such as the search rank
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def _typed_values(queryset, ordering, values, cursor):
+    # the cursor holds strings - a tampered one ('abc' for an id) must be a
+    # ValueError here rather than a ValidationError from the query
+    try:
+        return [
+            _ordering_field(queryset, field.lstrip('-')).to_python(value)
+            for field, value in zip(ordering, values)
+        ]
+    except ValidationError as error:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from error
+
+
+def _value(row, name):
+    # rows can be model instances or dicts from .values()
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _page_query(queryset, ordering, cursor, page_size):
+    ordering = list(ordering)
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor)
+        if len(values) != len(ordering):
+            raise ValueError(f'Invalid cursor: {cursor!r}')
+        values = _typed_values(queryset, ordering, values, cursor)
+        queryset = queryset.filter(_rows_after(ordering, values))
+    # fetch one extra row to find out whether there is a next page
+    return queryset[:page_size + 1]
+
+
+def _make_page(rows, ordering, page_size):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(_value(rows[-1], field.lstrip('-')) for field in ordering)
+    return KeysetPage(rows, next_cursor)
+
+
+def paginate_by_keyset(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """Return one KeysetPage of ``queryset`` sorted by ``ordering``.
+
+    ``ordering`` must end in a unique column (usually ``id``) so every row has a
+    distinct position. Only plain (non relation) fields and annotations are supported.
+    """
+    rows = list(_page_query(queryset, ordering, cursor, page_size))
+    return _make_page(rows, ordering, page_size)
+
+
+async def apaginate_by_keyset(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """Async version of paginate_by_keyset for async views."""
+    rows = [row async for row in _page_query(queryset, ordering, cursor, page_size)]
+    return _make_page(rows, ordering, page_size)
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.db.models import Count, Exists, Max, OuterRef
+from django.middleware.csrf import get_token
+
+from .models import Cat, Toy
+
+# the available toys are paged alphabetically; id breaks ties between equal names
+AVAILABLE_TOYS_ORDERING = ('name', 'id')
+
+
+def available_toys(cat_id, name='', color=''):
+    """Toys the cat doesn't have yet, optionally filtered by name and color.
+
+    Uses an anti-join (NOT EXISTS against the cat-toy through table) instead of
+    pulling the cat's toy ids into a NOT IN list.
+    """
+    owned = Cat.toys.through.objects.filter(cat_id=cat_id, toy_id=OuterRef('pk'))
+    toys = Toy.objects.filter(~Exists(owned))
+    if name:
+        toys = toys.filter(name__istartswith=name)
+    if color:
+        toys = toys.filter(color__iexact=color)
+    return toys
+
+
+# Toy catalog versions for conditional GET
+# The pages include the user's name in the nav bar and a CSRF token in the
+# logout form, so every ETag includes the user and a hash of the CSRF secret -
+# login rotates the secret, and a 304 then would keep a page whose logout
+# form fails with 403. There's no Last-Modified for the same reason: a date
+# can't tell the tokens apart.
+
+def toy_viewer(request, user_id):
+    # creates the secret now if the page is going to, so the first ETag matches the second
+    get_token(request)
+    secret = hashlib.md5(request.META['CSRF_COOKIE'].encode()).hexdigest()[:12]
+    return f'{user_id}-{secret}'
+
+
+def toy_list_version(request, *args, **kwargs):
+    # (count, last update) of the catalog - a delete changes the count,
+    # anything else bumps a toy's updated_at. Computed once per request.
+    if not hasattr(request, '_toy_list_version'):
+        request._toy_list_version = Toy.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+    return request._toy_list_version
+
+
+def format_toy_list_etag(version, page, viewer):
+    updated = version['updated'].timestamp() if version['updated'] else 0
+    return f"toys-{version['count']}-{updated}-{page}-{viewer}"
+
+
+def format_toy_detail_etag(pk, updated, viewer):
+    return f'toy-{pk}-{updated.timestamp()}-{viewer}' if updated else None
+
+
+def toy_list_etag(request, *args, **kwargs):
+    return format_toy_list_etag(toy_list_version(request), request.GET.get('page', '1'), toy_viewer(request, request.user.id))
+
+
+def toy_detail_last_modified(request, pk):
+    return Toy.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+
+def toy_detail_etag(request, pk):
+    return format_toy_detail_etag(pk, toy_detail_last_modified(request, pk), toy_viewer(request, request.user.id))
+
+
+# async twins of the toy versions for the async views
+async def atoy_list_version():
+    return await Toy.objects.aaggregate(count=Count('id'), updated=Max('updated_at'))
+
+
+async def atoy_detail_last_modified(pk):
+    return await Toy.objects.filter(pk=pk).values_list('updated_at', flat=True).afirst()
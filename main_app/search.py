@@ -0,0 +1,192 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+from django.db import connection
+from django.db.models import BooleanField, Count, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Cat, Toy
+
+# the text each model is searched by - also what the tsvector columns are built from
+SEARCH_FIELDS = {
+    Cat: ('name', 'breed', 'description'),
+    Toy: ('name', 'color'),
+}
+
+# results per page of cats / toys
+SEARCH_PAGE_SIZE = 20
+
+SEARCH_ORDERING = ('name', 'id')
+
+# on PostgreSQL the best matches come first - ts_rank weighs a name match (A)
+# above a breed / color (B) above a description (C), see migration 0012
+RANKED_SEARCH_ORDERING = ('-rank', 'name', 'id')
+
+
+# Search over cats and toys
+# On PostgreSQL every cat and toy row has a generated search_vector tsvector
+# column with a GIN index (migration 0012) - the database keeps it current on
+# every write. Other databases (SQLite in the tests) use an inverted index
+# held in this process instead, kept current by the post_save / post_delete
+# signals. Either way a search is "every term is a prefix of some word", and
+# the matching rows come back as a queryset so paging and facets are shared.
+# Only PostgreSQL ranks the results; elsewhere they are in name order.
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def uses_tsvector():
+    return connection.vendor == 'postgresql'
+
+
+class InvertedIndex:
+    """token -> ids, with a sorted token list for prefix lookups."""
+
+    def __init__(self):
+        self.documents = {}
+        self.postings = {}
+        self.tokens = []
+        self.lock = threading.Lock()
+
+    def add(self, doc_id, text):
+        with self.lock:
+            self._remove(doc_id)
+            tokens = set(search_terms(text))
+            self.documents[doc_id] = tokens
+            for token in tokens:
+                if token not in self.postings:
+                    self.postings[token] = set()
+                    insort(self.tokens, token)
+                self.postings[token].add(doc_id)
+
+    def remove(self, doc_id):
+        with self.lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        for token in self.documents.pop(doc_id, ()):
+            ids = self.postings[token]
+            ids.discard(doc_id)
+            if not ids:
+                del self.postings[token]
+                del self.tokens[bisect_left(self.tokens, token)]
+
+    def _prefix(self, term):
+        ids = set()
+        position = bisect_left(self.tokens, term)
+        while position < len(self.tokens) and self.tokens[position].startswith(term):
+            ids |= self.postings[self.tokens[position]]
+            position += 1
+        return ids
+
+    def search(self, terms):
+        with self.lock:
+            matches = None
+            for term in terms:
+                matches = self._prefix(term) if matches is None else matches & self._prefix(term)
+                if not matches:
+                    return set()
+            return matches or set()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def document_text(values):
+    return ' '.join(str(value or '') for value in values)
+
+
+def get_index(model):
+    # built from the table the first time it's needed
+    with _indexes_lock:
+        if model not in _indexes:
+            fields = SEARCH_FIELDS[model]
+            index = InvertedIndex()
+            for doc_id, *values in model.objects.values_list('id', *fields).iterator():
+                index.add(doc_id, document_text(values))
+            _indexes[model] = index
+        return _indexes[model]
+
+
+def index_instance(instance):
+    # signal hook - only matters once the index has been built
+    model = type(instance)
+    if model in _indexes:
+        values = [getattr(instance, field) for field in SEARCH_FIELDS[model]]
+        _indexes[model].add(instance.id, document_text(values))
+
+
+def unindex_instance(model, doc_id):
+    if model in _indexes:
+        _indexes[model].remove(doc_id)
+
+
+def reset_search_index():
+    # bulk_create skips the signals, so the bulk paths throw the index away
+    # and let the next search rebuild it
+    with _indexes_lock:
+        _indexes.clear()
+
+
+def to_tsquery(terms):
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def matching(model, terms):
+    """The rows of ``model`` whose text matches every term (as a prefix)."""
+    if not terms:
+        return model.objects.none()
+    if uses_tsvector():
+        return model.objects.filter(RawSQL(
+            f"{model._meta.db_table}.search_vector @@ to_tsquery('simple', %s)", [to_tsquery(terms)],
+            output_field=BooleanField(),
+        ))
+    return model.objects.filter(id__in=get_index(model).search(terms))
+
+
+def ranked(queryset, terms):
+    # float8 so the rank survives the round trip through a page cursor exactly
+    table = queryset.model._meta.db_table
+    return queryset.annotate(rank=RawSQL(
+        f"ts_rank({table}.search_vector, to_tsquery('simple', %s))::float8", [to_tsquery(terms)],
+        output_field=FloatField(),
+    ))
+
+
+def search_ordering():
+    """The ordering to page search() results by."""
+    return RANKED_SEARCH_ORDERING if uses_tsvector() else SEARCH_ORDERING
+
+
+def facet_counts(queryset, field):
+    # [(value, count), ...] most common first
+    return list(
+        queryset.order_by().values_list(field).annotate(count=Count('id')).order_by('-count', field)
+    )
+
+
+def search(user, query, breed='', color=''):
+    """Search the user's cats and the toy catalog.
+
+    Returns (cats, toys, facets). ``cats`` and ``toys`` are querysets ready to
+    be paged by search_ordering(); ``facets`` holds breed and toy color counts over the text matches
+    before the breed / color filters narrow them down.
+    """
+    terms = search_terms(query)
+    cats = matching(Cat, terms).filter(user=user)
+    toys = matching(Toy, terms)
+    facets = {
+        'breed': facet_counts(cats, 'breed'),
+        'color': facet_counts(toys, 'color'),
+    }
+    if breed:
+        cats = cats.filter(breed=breed)
+    if color:
+        toys = toys.filter(color=color)
+    # ranked after the facets so the rank stays out of their GROUP BY
+    if uses_tsvector() and terms:
+        cats, toys = ranked(cats, terms), ranked(toys, terms)
+    return cats, toys, facets
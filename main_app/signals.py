@@ -0,0 +1,68 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth import forget_user
+from .cache import invalidate_cat_index
+from .models import Cat, Feeding, Toy
+from .search import index_instance, unindex_instance
+from .summaries import record_feeding, refresh_feeding_summaries
+
+
+# a password change, deactivation or delete must not be served from the user
+# cache - and a logout starts the next login from a fresh copy
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
+
+
+# CatCreate, CatUpdate and CatDelete (and the admin) all end up here
+@receiver(post_save, sender=Cat)
+@receiver(post_delete, sender=Cat)
+def cat_changed(sender, instance, **kwargs):
+    invalidate_cat_index(instance.user_id)
+
+
+# the in-process search index (used when the database has no full-text search)
+# only changes once the write is committed, so a rollback can't leave it behind
+@receiver(post_save, sender=Cat)
+@receiver(post_save, sender=Toy)
+def searchable_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: index_instance(instance))
+
+
+@receiver(post_delete, sender=Cat)
+@receiver(post_delete, sender=Toy)
+def searchable_deleted(sender, instance, **kwargs):
+    # the instance loses its id once the delete is done
+    doc_id = instance.id
+    transaction.on_commit(lambda: unindex_instance(sender, doc_id))
+
+
+# keep the cat's fed-today summary in step with its feedings
+# (bulk_create skips signals - the bulk paths refresh the summaries themselves)
+@receiver(post_save, sender=Feeding)
+def feeding_saved(sender, instance, created, **kwargs):
+    if created:
+        record_feeding(instance)
+    else:
+        # an edit can move a feeding off the summary day
+        refresh_feeding_summaries([instance.cat_id])
+
+
+@receiver(post_delete, sender=Feeding)
+def feeding_deleted(sender, instance, origin=None, **kwargs):
+    # when the cat (or its user) is being deleted the summary goes with it
+    deleted_from = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if deleted_from is Feeding:
+        refresh_feeding_summaries([instance.cat_id])
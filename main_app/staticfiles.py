@@ -0,0 +1,133 @@
+import base64
+import gzip
+import hashlib
+import io
+import os
+import re
+from functools import lru_cache
+
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.templatetags.static import static
+from django.utils.html import format_html
+
+# brotli and Pillow are optional - without them there are no .br files and
+# PNGs are collected as they are
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# text files worth compressing - images and fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.html', '.xml')
+
+# below this the bytes saved don't pay for the Content-Encoding / Vary headers
+COMPRESS_MIN_SIZE = 256
+
+# ManifestStaticFilesStorage names files like style.1a2b3c4d5e6f.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# third-party assets, served from static/vendor/ once `manage.py vendor_static`
+# has downloaded them and from the CDN until then: name -> (CDN url, the
+# Subresource Integrity hash cdnjs publishes for it). The browser checks the CDN
+# copy against the hash and vendor_static refuses a download that doesn't match.
+VENDOR_ASSETS = {
+    'materialize/1.0.0/materialize.min.css': (
+        'https://cdnjs.cloudflare.com/ajax/libs/materialize/1.0.0/css/materialize.min.css',
+        'sha512-UJfAaOlIRtdR+0P6C3KUoTDAxVTuy3lnSXLyLKlHYJlcSU8Juge/mjeaxDNMlw9LgeIotgz5FP8eUQPhX1q10A==',
+    ),
+    'materialize/1.0.0/materialize.min.js': (
+        'https://cdnjs.cloudflare.com/ajax/libs/materialize/1.0.0/js/materialize.min.js',
+        'sha512-NiWqa2rceHnN3Z5j6mSAvbwwg3tiwVNxiAQaaSMSXnRRDh5C2mk/+sKQRw8qjV1vN4nf8iK2a0b048PnHbyx+Q==',
+    ),
+}
+
+VENDOR_DIR = os.path.join(os.path.dirname(__file__), 'static', 'vendor')
+
+
+# Static asset pipeline
+# With STATIC_PIPELINE on, collectstatic copies every file to STATIC_ROOT
+# along with a copy named after a hash of its content (style.css ->
+# style.1a2b3c4d5e6f.css, and {% static %} links to that name), then
+# losslessly recompresses the PNGs and writes .gz / .br copies of the text
+# files next to them. A hashed name never
+# changes content, so StaticFilesMiddleware serves it with a one year
+# Cache-Control and picks the smallest encoding the browser accepts.
+
+def is_hashed(name):
+    return bool(HASHED_NAME.search(name))
+
+
+def optimize_png(path):
+    """Re-encode a PNG with zlib's best settings; returns the bytes saved."""
+    with open(path, 'rb') as original_file:
+        original = original_file.read()
+    with Image.open(io.BytesIO(original)) as image:
+        optimized = io.BytesIO()
+        image.save(optimized, 'PNG', optimize=True)
+    if optimized.tell() >= len(original):
+        return 0
+    with open(path, 'wb') as optimized_file:
+        optimized_file.write(optimized.getvalue())
+    return len(original) - optimized.tell()
+
+
+def compressed_variants(content):
+    # [(suffix, bytes), ...] for the encodings that actually make it smaller
+    variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content)))
+    return [(suffix, data) for suffix, data in variants if len(data) < len(content) * 0.95]
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage plus PNG optimization and .gz / .br copies."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        # the hashes are of the source files, so a name still changes whenever they do
+        for name, hashed_name in self.hashed_files.items():
+            for path in (name, hashed_name):
+                if Image is not None and path.lower().endswith('.png') and self.exists(path):
+                    optimize_png(self.path(path))
+                self.compress(path)
+
+    def compress(self, name):
+        if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS) or not self.exists(name):
+            return
+        with self.open(name) as original_file:
+            content = original_file.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+        for suffix, data in compressed_variants(content):
+            with open(self.path(name + suffix), 'wb') as compressed_file:
+                compressed_file.write(data)
+
+
+@lru_cache(maxsize=None)
+def is_vendored(name):
+    return finders.find(f'vendor/{name}') is not None
+
+
+def vendor_url(name):
+    """The URL of a VENDOR_ASSETS file - local once vendored, the CDN until then."""
+    return static(f'vendor/{name}') if is_vendored(name) else VENDOR_ASSETS[name][0]
+
+
+def vendor_integrity_attrs(name):
+    # integrity / crossorigin for the CDN copy - a vendored file was checked on download
+    if is_vendored(name):
+        return ''
+    return format_html(' integrity="{}" crossorigin="anonymous"', VENDOR_ASSETS[name][1])
+
+
+def sri_hash(content):
+    """The Subresource Integrity value (sha512-<base64 digest>) of ``content``."""
+    return f'sha512-{base64.b64encode(hashlib.sha512(content).digest()).decode()}'
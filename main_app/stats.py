@@ -0,0 +1,128 @@
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.template.base import Template
+
+# samples kept per URL name - the oldest fall off the end of the ring
+RING_SIZE = 1000
+
+METRICS = ('wall_ms', 'queries', 'db_ms', 'template_ms', 'bytes')
+
+_samples = defaultdict(lambda: deque(maxlen=RING_SIZE))
+_samples_lock = threading.Lock()
+
+# the sample being filled in by the request running in this thread / task
+current_sample = contextvars.ContextVar('current_sample', default=None)
+
+
+# Per-request performance stats
+# RequestStatsMiddleware fills in one sample per request and hands it to
+# record(). Everything lives in memory in this process; dump() / load_dumps()
+# let the request_stats command merge the rings of several worker processes.
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def new_sample():
+    return {'wall_ms': 0.0, 'queries': 0, 'db_ms': 0.0, 'template_ms': 0.0, 'bytes': None, '_depth': 0}
+
+
+def record(url_name, sample):
+    sample.pop('_depth', None)
+    with _samples_lock:
+        _samples[url_name].append(sample)
+
+
+def reset():
+    with _samples_lock:
+        _samples.clear()
+
+
+def snapshot():
+    # {url_name: [sample, ...]} copied so it can be used without the lock
+    with _samples_lock:
+        return {url_name: list(samples) for url_name, samples in _samples.items()}
+
+
+def summarize(samples_by_name):
+    """Percentile summary per URL name and metric."""
+    summary = {}
+    for url_name, samples in sorted(samples_by_name.items()):
+        summary[url_name] = {'requests': len(samples)}
+        for metric in METRICS:
+            values = [sample[metric] for sample in samples if sample.get(metric) is not None]
+            if values:
+                summary[url_name][metric] = {
+                    'p50': round(percentile(values, 50), 3),
+                    'p95': round(percentile(values, 95), 3),
+                    'p99': round(percentile(values, 99), 3),
+                    'max': round(max(values), 3),
+                }
+    return summary
+
+
+def db_timer(execute, sql, params, many, context):
+    # connection.execute_wrapper hook - counts and times every query
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample['queries'] += 1
+        sample['db_ms'] += (time.perf_counter() - start) * 1000
+
+
+def install_template_timer():
+    """Wrap Template.render so top level template renders are timed.
+
+    Includes render through the same method, so only the outermost call
+    (depth 0) adds to the sample.
+    """
+    if getattr(Template.render, 'timed', False):
+        return
+    render = Template.render
+
+    def timed_render(self, context):
+        sample = current_sample.get()
+        if sample is None:
+            return render(self, context)
+        sample['_depth'] += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            sample['_depth'] -= 1
+            if not sample['_depth']:
+                sample['template_ms'] += (time.perf_counter() - start) * 1000
+
+    timed_render.timed = True
+    Template.render = timed_render
+
+
+def dump(directory):
+    # one file per process, replaced atomically so readers never see half a file
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'requests-{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as dump_file:
+        json.dump(snapshot(), dump_file)
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+def load_dumps(directory):
+    merged = defaultdict(list)
+    for path in glob.glob(os.path.join(directory, 'requests-*.json')):
+        with open(path) as dump_file:
+            for url_name, samples in json.load(dump_file).items():
+                merged[url_name].extend(samples)
+    return dict(merged)
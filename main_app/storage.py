@@ -0,0 +1,52 @@
+import os
+import uuid
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+import boto3
+from botocore.config import Config
+
+# connections kept open to S3 per process - enough for every task worker thread
+S3_MAX_CONNECTIONS = 16
+
+# downloads bigger than this spill from memory to a temp file on disk
+SPOOL_MAX_SIZE = 4 * 1024 * 1024
+
+
+# S3 helpers for cat photos
+# boto3 clients are thread safe and expensive to build (credential lookup,
+# endpoint resolution, a fresh connection pool), so we build one per process
+# and share it between the task worker threads.
+@lru_cache(maxsize=None)
+def get_s3_client():
+    return boto3.client('s3', config=Config(max_pool_connections=S3_MAX_CONNECTIONS))
+
+
+def photo_key(filename):
+    # need a unique "key" for S3 and the image file extension
+    extension = filename[filename.rfind('.'):] if '.' in filename else ''
+    return uuid.uuid4().hex[:6] + extension
+
+
+def photo_url(bucket, key):
+    # build the full url string
+    return f"{os.environ['S3_BASE_URL']}{bucket}/{key}"
+
+
+def photo_key_from_url(url):
+    return url.rsplit('/', 1)[-1]
+
+
+def upload_photo(photo_file, bucket, key, content_type=None):
+    extra_args = {'ContentType': content_type} if content_type else None
+    get_s3_client().upload_fileobj(photo_file, bucket, key, ExtraArgs=extra_args)
+    return photo_url(bucket, key)
+
+
+def download_photo(bucket, key):
+    # streams the object into a spooled file so big photos never sit fully in memory
+    photo_file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    get_s3_client().download_fileobj(bucket, key, photo_file)
+    photo_file.seek(0)
+    return photo_file
+
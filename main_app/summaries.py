@@ -0,0 +1,101 @@
+from datetime import date
+
+from django.db.models import Case, F, Max, Q, QuerySet, Value, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from .cache import invalidate_cat_index
+from .models import Cat, Feeding, MEAL_BITS
+
+# how many cats are rebuilt per round trip
+SUMMARY_BATCH_SIZE = 1000
+
+
+# Fed-today summary
+# Cat.last_fed_date / Cat.last_fed_meals hold the most recent feeding day and a
+# bitmask of the meals served on it. A new feeding only ever touches one bit so
+# it's applied with a single UPDATE; anything that can remove a feeding falls
+# back to recomputing the summary from the Feeding rows. Feedings dated after
+# today are left out - the summary would otherwise move past today and miss
+# today's meals - until a rebuild once their day has come.
+
+def record_feeding(feeding):
+    """Fold one newly created feeding into its cat's summary."""
+    if feeding.date > date.today():
+        return False
+    bit = MEAL_BITS[feeding.meal]
+    # one conditional UPDATE - same day as the summary sets the meal's bit, a
+    # newer day starts a fresh mask, an older day matches nothing. Two steps
+    # would race: two meals on a new day could both start a fresh mask.
+    updated = Cat.objects.filter(
+        Q(last_fed_date__lte=feeding.date) | Q(last_fed_date__isnull=True),
+        id=feeding.cat_id,
+    ).update(
+        last_fed_meals=Case(
+            When(last_fed_date=feeding.date, then=F('last_fed_meals').bitor(bit)),
+            default=Value(bit),
+        ),
+        last_fed_date=feeding.date,
+        # update() skips auto_now
+        updated_at=Now(),
+    )
+    if updated:
+        invalidate_cat_index(Cat.objects.values_list('user_id', flat=True).get(id=feeding.cat_id))
+    return bool(updated)
+
+
+def rebuild_feeding_summaries(cat_ids=None, batch_size=SUMMARY_BATCH_SIZE):
+    """Recompute the summary columns from the Feeding table.
+
+    ``cat_ids`` may be any iterable of ids or a ``values('id')`` queryset.
+    Walks the given cats (or every cat) in batches so memory stays flat, and
+    yields the number of cats rebuilt after each batch.
+    """
+    cats = Cat.objects.order_by('id').only('id', 'user_id', 'last_fed_date', 'last_fed_meals')
+    if cat_ids is not None:
+        # a queryset stays a subquery instead of a long IN list
+        cats = cats.filter(id__in=cat_ids if isinstance(cat_ids, QuerySet) else list(cat_ids))
+
+    last_id = 0
+    while True:
+        batch = list(cats.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        ids = [cat.id for cat in batch]
+
+        last_dates = dict(
+            Feeding.objects.filter(cat_id__in=ids, date__lte=date.today())
+            .order_by()
+            .values('cat_id')
+            .annotate(last_date=Max('date'))
+            .values_list('cat_id', 'last_date')
+        )
+        masks = dict.fromkeys(ids, 0)
+        latest = Feeding.objects.filter(
+            cat_id__in=list(last_dates), date__in=set(last_dates.values())
+        ).order_by().values_list('cat_id', 'date', 'meal')
+        for cat_id, feeding_date, meal in latest:
+            if feeding_date == last_dates[cat_id]:
+                masks[cat_id] |= MEAL_BITS.get(meal, 0)
+
+        # only write the cats whose summary actually moved
+        changed = []
+        now = timezone.now()
+        for cat in batch:
+            summary = (last_dates.get(cat.id), masks[cat.id])
+            if (cat.last_fed_date, cat.last_fed_meals) != summary:
+                cat.last_fed_date, cat.last_fed_meals = summary
+                # bulk_update skips auto_now
+                cat.updated_at = now
+                changed.append(cat)
+        Cat.objects.bulk_update(changed, ['last_fed_date', 'last_fed_meals', 'updated_at'])
+        for user_id in {cat.user_id for cat in changed}:
+            invalidate_cat_index(user_id)
+
+        yield len(batch)
+
+
+def refresh_feeding_summaries(cat_ids):
+    for _ in rebuild_feeding_summaries(cat_ids):
+        pass
@@ -0,0 +1,126 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .analytics import fold_feedings
+from .models import Cat, Feeding, MEALS, Photo, Toy
+from .search import reset_search_index
+from .summaries import refresh_feeding_summaries
+
+BREEDS = ('tabby', 'calico', 'siamese', 'maine coon', 'persian', 'sphynx', 'bengal', 'ragdoll')
+TOY_KINDS = ('mouse', 'ball', 'feather', 'laser', 'string', 'box', 'tunnel', 'catnip sock')
+COLORS = ('red', 'blue', 'green', 'grey', 'yellow', 'purple', 'orange', 'black')
+
+# every synthetic user gets this password so benchmarks can log in
+SYNTHETIC_PASSWORD = 'synthetic-cat-123'
+
+
+# Synthetic data for benchmarks and load tests
+# Everything is written with bulk_create in batches so millions of feedings
+# can be generated without holding them all in memory.
+
+def _batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate_dataset(users=10, cats_per_user=10, toys=100, toys_per_cat=3,
+                     feeding_days=30, photos_per_cat=1, batch_size=5000, seed=None, log=None):
+    """Create a synthetic dataset.
+
+    Returns a dict with the number of rows made per model, the list of
+    synthetic users and the list of toys - the toys belong to no user, so
+    cleaning up means deleting exactly these. Each cat gets ``feeding_days`` days of feedings ending
+    today, with roughly one meal in ten skipped. ``log`` is an optional
+    callable for progress lines.
+    """
+    rng = random.Random(seed)
+    log = log or (lambda message: None)
+    today = date.today()
+    prefix = f'synthetic-{time.time_ns()}'
+    counts = {}
+
+    # hashing is slow on purpose - do it once and share the hash
+    password = make_password(SYNTHETIC_PASSWORD)
+    user_rows = User.objects.bulk_create(
+        (User(username=f'{prefix}-{i}', password=password) for i in range(users)),
+        batch_size=batch_size,
+    )
+    counts['users'] = len(user_rows)
+    log(f'{counts["users"]} users')
+
+    toy_rows = Toy.objects.bulk_create(
+        (Toy(name=f'{rng.choice(TOY_KINDS)} {i}', color=rng.choice(COLORS)) for i in range(toys)),
+        batch_size=batch_size,
+    )
+    counts['toys'] = len(toy_rows)
+    log(f'{counts["toys"]} toys')
+
+    cat_rows = Cat.objects.bulk_create(
+        (
+            Cat(
+                name=f'Cat {i}', breed=rng.choice(BREEDS), description='a synthetic cat',
+                age=rng.randint(0, 18), user=user,
+            )
+            for user in user_rows
+            for i in range(cats_per_user)
+        ),
+        batch_size=batch_size,
+    )
+    counts['cats'] = len(cat_rows)
+    log(f'{counts["cats"]} cats')
+
+    CatToy = Cat.toys.through
+    links = (
+        CatToy(cat_id=cat.id, toy_id=toy.id)
+        for cat in cat_rows
+        for toy in rng.sample(toy_rows, min(toys_per_cat, len(toy_rows)))
+    )
+    counts['cat_toys'] = 0
+    for batch in _batched(links, batch_size):
+        CatToy.objects.bulk_create(batch)
+        counts['cat_toys'] += len(batch)
+    log(f'{counts["cat_toys"]} cat-toy links')
+
+    feedings = (
+        Feeding(cat_id=cat.id, date=today - timedelta(days=day), meal=meal)
+        for cat in cat_rows
+        for day in range(feeding_days)
+        for meal, label in MEALS
+        if rng.random() >= 0.1
+    )
+    counts['feedings'] = 0
+    for batch in _batched(feedings, batch_size):
+        # the rollups go in with each batch, so a refresh can't miss them
+        with transaction.atomic():
+            Feeding.objects.bulk_create(batch)
+            fold_feedings(batch)
+        counts['feedings'] += len(batch)
+        log(f'{counts["feedings"]} feedings')
+
+    photos = (
+        Photo(cat_id=cat.id, url=f'https://example.com/{prefix}/{cat.id}-{i}.jpg')
+        for cat in cat_rows
+        for i in range(photos_per_cat)
+    )
+    counts['photos'] = 0
+    for batch in _batched(photos, batch_size):
+        Photo.objects.bulk_create(batch)
+        counts['photos'] += len(batch)
+    log(f'{counts["photos"]} photos')
+
+    # bulk_create skips the signals that keep the fed-today summary current
+    refresh_feeding_summaries(Cat.objects.filter(user__in=user_rows).values('id'))
+    # ...and the ones that keep the search index current
+    reset_search_index()
+    return counts, user_rows, toy_rows
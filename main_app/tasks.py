@@ -0,0 +1,278 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import TASK_STATUSES, Task
+from .stats import percentile
+
+TASK_MAX_ATTEMPTS = 5
+
+# attempt n failing waits RETRY_DELAY * 2 ** (n - 1) seconds before the next one
+RETRY_DELAY = 10
+MAX_RETRY_DELAY = 3600
+
+# how often an idle worker looks for new tasks (seconds)
+POLL_INTERVAL = 1.0
+
+# how often a worker requeues stuck tasks and deletes old finished ones (seconds)
+MAINTENANCE_INTERVAL = 60
+
+# finished tasks are kept this long for queue_stats - failed ones until deleted by hand
+KEEP_DONE = timedelta(days=1)
+
+# finished tasks queue_stats summarizes
+STATS_SAMPLE = 1000
+
+_tasks = {}
+
+logger = logging.getLogger(__name__)
+
+
+# Background tasks
+# Slow side effects (S3 uploads, image resizing) run outside the request as
+# Task rows. enqueue() is an INSERT in the caller's transaction, so a task only
+# becomes visible to the workers once the request commits - and never if it
+# rolls back. `manage.py run_tasks` claims due tasks (SELECT ... FOR UPDATE
+# SKIP LOCKED on PostgreSQL) and runs them in a thread pool. A task that raises
+# is retried with exponential backoff until max_attempts, then left as failed
+# with its traceback. With TASKS_EAGER on (the tests) enqueue() runs the task
+# right away in this process instead.
+
+def task(max_attempts=TASK_MAX_ATTEMPTS, on_failure=None, atomic=True):
+    """Register a function as a task. Its arguments must be JSON serializable.
+
+    ``on_failure`` is called with the same arguments once the last attempt has
+    failed, e.g. to clean up. With ``atomic`` off the task isn't wrapped in a
+    transaction - for tasks that call out to S3 and should only open one for
+    their own writes.
+    """
+    def register(fn):
+        fn.task_name = f'{fn.__module__}.{fn.__name__}'
+        _tasks[fn.task_name] = {
+            'fn': fn, 'max_attempts': max_attempts, 'on_failure': on_failure, 'atomic': atomic,
+        }
+        return fn
+    return register
+
+
+def enqueue(fn, *args, delay=0):
+    return enqueue_many(fn, [args], delay=delay)[0]
+
+
+def enqueue_many(fn, args_list, delay=0):
+    """Queue one run of task ``fn`` per tuple of arguments - a single INSERT."""
+    spec = _tasks[fn.task_name]
+    run_at = timezone.now() + timedelta(seconds=delay)
+    tasks = Task.objects.bulk_create(
+        Task(name=fn.task_name, args=list(args), max_attempts=spec['max_attempts'], run_at=run_at)
+        for args in args_list
+    )
+    if settings.TASKS_EAGER:
+        for queued in tasks:
+            run_eagerly(queued)
+    return tasks
+
+
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def run_eagerly(queued):
+    # every attempt back to back, no backoff
+    while queued.status == 'queued':
+        queued.status, queued.attempts, queued.started_at = 'running', queued.attempts + 1, timezone.now()
+        execute(queued)
+
+
+def execute(claimed):
+    """Run one claimed task and record how it went."""
+    spec = _tasks.get(claimed.name)
+    try:
+        if spec is None:
+            raise LookupError(f'No task registered as {claimed.name}')
+        if spec['atomic']:
+            # the task's own writes commit or roll back together
+            with transaction.atomic():
+                spec['fn'](*claimed.args)
+        else:
+            spec['fn'](*claimed.args)
+    except Exception:
+        claimed.last_error = traceback.format_exc()
+        if spec is not None and claimed.attempts < claimed.max_attempts:
+            claimed.status = 'queued'
+            claimed.run_at = timezone.now() + timedelta(seconds=retry_delay(claimed.attempts))
+        else:
+            claimed.status = 'failed'
+            if spec is not None and spec['on_failure']:
+                try:
+                    spec['on_failure'](*claimed.args)
+                except Exception:
+                    claimed.last_error += f'\non_failure:\n{traceback.format_exc()}'
+    else:
+        claimed.status = 'done'
+        claimed.last_error = ''
+    claimed.finished_at = timezone.now()
+    claimed.save(update_fields=['status', 'attempts', 'run_at', 'started_at', 'finished_at', 'last_error'])
+    return claimed
+
+
+def claim(limit, worker):
+    """Mark up to ``limit`` due tasks as running for ``worker`` and return them."""
+    now = timezone.now()
+    due = (
+        Task.objects.filter(status='queued', run_at__lte=now)
+        .order_by('run_at', 'id')
+        .select_for_update(skip_locked=True)
+        .values('id')[:limit]
+    )
+    # one UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED LIMIT n) -
+    # two workers never get the same row, and neither waits on the other
+    with transaction.atomic():
+        Task.objects.filter(id__in=due, status='queued').update(
+            status='running', attempts=F('attempts') + 1, started_at=now, claimed_by=worker,
+        )
+    return list(Task.objects.filter(status='running', claimed_by=worker, started_at=now).order_by('run_at', 'id'))
+
+
+def requeue_stuck(timeout):
+    """Give tasks left running longer than ``timeout`` seconds (a dead worker) another go."""
+    stuck = Task.objects.filter(status='running', started_at__lt=timezone.now() - timedelta(seconds=timeout))
+    requeued = stuck.filter(attempts__lt=F('max_attempts')).update(status='queued', run_at=timezone.now())
+    failed = stuck.update(status='failed', finished_at=timezone.now(), last_error=f'Timed out after {timeout}s')
+    return requeued, failed
+
+
+def prune_done():
+    return Task.objects.filter(status='done', finished_at__lt=timezone.now() - KEEP_DONE).delete()[0]
+
+
+class Worker:
+    """Claims due tasks and runs them on ``threads`` threads (0 runs them in this thread)."""
+
+    def __init__(self, threads=4, poll_interval=POLL_INTERVAL, timeout=None, log=None):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.timeout = timeout or settings.TASK_TIMEOUT
+        self.log = log or (lambda message: None)
+        self.name = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = threading.Event()
+        self.processed = 0
+        self.last_maintenance = float('-inf')
+
+    def stop(self):
+        # finish the tasks in hand, claim no more
+        self.stopping.set()
+
+    def maintain(self):
+        # at most once every MAINTENANCE_INTERVAL
+        if time.monotonic() - self.last_maintenance < MAINTENANCE_INTERVAL:
+            return
+        self.last_maintenance = time.monotonic()
+        requeued, failed = requeue_stuck(self.timeout)
+        if requeued or failed:
+            self.log(f'{requeued} stuck tasks requeued, {failed} failed')
+        prune_done()
+
+    def run_one(self, claimed):
+        try:
+            execute(claimed)
+        except Exception:
+            # e.g. the database went away before the outcome was saved - the
+            # task stays running until requeue_stuck gives it another go
+            logger.exception('Recording the outcome of %s failed', claimed)
+            try:
+                Task.objects.filter(id=claimed.id, status='running').update(last_error=traceback.format_exc())
+            except Exception:
+                logger.exception('Saving the error of %s failed too', claimed)
+            return claimed
+        self.log(f'{claimed} in {(claimed.finished_at - claimed.started_at).total_seconds() * 1000:.0f}ms')
+        return claimed
+
+    def run_in_thread(self, claimed):
+        # pool threads keep their own DB connection - drop it if it's broken or too old
+        close_old_connections()
+        try:
+            return self.run_one(claimed)
+        finally:
+            close_old_connections()
+
+    def run(self, burst=False):
+        """Work until stop() - or, with ``burst``, until no task is due. Returns the tasks run."""
+        if self.threads == 0:
+            while not self.stopping.is_set():
+                self.maintain()
+                claimed = claim(1, self.name)
+                if not claimed:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                for one in claimed:
+                    self.run_one(one)
+                    self.processed += 1
+            return self.processed
+
+        running = set()
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='tasks') as pool:
+            while not self.stopping.is_set():
+                self.maintain()
+                if len(running) < self.threads:
+                    running |= {pool.submit(self.run_in_thread, one) for one in claim(self.threads - len(running), self.name)}
+                if not running:
+                    if burst:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                # back to claiming as soon as a thread is free
+                done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                self.processed += len(done)
+            self.processed += len(wait(running).done)
+        return self.processed
+
+
+def summarize_ms(values):
+    return {
+        'p50': round(percentile(values, 50), 1),
+        'p95': round(percentile(values, 95), 1),
+        'max': round(max(values), 1),
+    }
+
+
+def queue_stats():
+    """Queue depth by status plus wait / run time percentiles per task name.
+
+    Read from the Task table, so it covers every worker process.
+    """
+    now = timezone.now()
+    depth = dict(Task.objects.order_by().values_list('status').annotate(Count('id')))
+    due = Task.objects.filter(status='queued', run_at__lte=now).aggregate(count=Count('id'), oldest=Min('run_at'))
+    finished = (
+        Task.objects.filter(status='done')
+        .order_by('-finished_at')
+        .values_list('name', 'run_at', 'started_at', 'finished_at')[:STATS_SAMPLE]
+    )
+    timings = {}
+    for name, run_at, started_at, finished_at in finished:
+        waits, runs = timings.setdefault(name, ([], []))
+        # from due to picked up, and from picked up to finished
+        waits.append(max((started_at - run_at).total_seconds(), 0) * 1000)
+        runs.append((finished_at - started_at).total_seconds() * 1000)
+    return {
+        'depth': {status: depth.get(status, 0) for status, label in TASK_STATUSES},
+        'due': due['count'],
+        'oldest_due_seconds': round((now - due['oldest']).total_seconds(), 1) if due['oldest'] else None,
+        'tasks': {
+            name: {'runs': len(runs), 'wait_ms': summarize_ms(waits), 'run_ms': summarize_ms(runs)}
+            for name, (waits, runs) in sorted(timings.items())
+        },
+    }
@@ -0,0 +1,17 @@
+from django import template
+
+from main_app.staticfiles import vendor_integrity_attrs, vendor_url
+
+register = template.Library()
+
+
+# {% vendor 'materialize/1.0.0/materialize.min.css' %} - see staticfiles.VENDOR_ASSETS
+@register.simple_tag
+def vendor(name):
+    return vendor_url(name)
+
+
+# <script src="{% vendor name %}"{% vendor_integrity name %}> - the SRI attributes while it comes from the CDN
+@register.simple_tag
+def vendor_integrity(name):
+    return vendor_integrity_attrs(name)
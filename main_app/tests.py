@@ -1,3 +1,1594 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import date, timedelta
+from itertools import takewhile
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.templatetags.static import static
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from catcollector import settings as project_settings
+
+from . import analytics, benchmarks, images, staticfiles, stats, storage, tasks
+from .auth import clear_user_cache, get_cached_user
+from .cache import cache_stats, reset_cache_stats
+from .ingest import BULK_CHUNK_SIZE, delete_duplicate_feedings, ingest_feedings
+from .middleware import accepted_encodings
+from .models import ALL_MEALS_MASK, Cat, Checkpoint, Feeding, FeedingRollup, Photo, Task, Toy
+from .pagination import PAGE_SIZE, decode_cursor, encode_cursor, paginate_by_keyset
+from .queries import available_toys
+from .search import InvertedIndex, reset_search_index
+from .summaries import rebuild_feeding_summaries, refresh_feeding_summaries
+from .synthetic import generate_dataset
+from .tasks import Worker, enqueue, queue_stats, requeue_stuck, task
+
+# moto is only needed to run the S3 tests
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+# tasks for TaskQueueTests - calls made, and failures left before a call succeeds
+task_calls = []
+task_failures = {}
+
+
+@task(max_attempts=3, on_failure=lambda value: task_calls.append(('gave up', value)))
+def record_call(value):
+    if task_failures.get(value):
+        task_failures[value] -= 1
+        raise ValueError(f'{value} failed')
+    task_calls.append(value)
+
+
+# Shared fixtures for the main_app tests
+class CatCollectorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='tester', password='meow-meow-123')
+        cls.cat = Cat.objects.create(
+            name='Lolo', breed='tabby', description='furry little demon', age=3, user=cls.user
+        )
+
+    def setUp(self):
+        cache.clear()
+        reset_search_index()
+        self.client.force_login(self.user)
+
+
+# Detail page - the number of queries must not grow with the amount of related data
+class CatDetailQueryBudgetTests(CatCollectorTestCase):
+    # session + user, cat, photos, toys, available toys, feeding history page
+    QUERY_BUDGET = 7
+
+    def add_related_rows(self, count):
+        toys = Toy.objects.bulk_create(
+            Toy(name=f'mouse {i}', color='grey') for i in range(count * 2)
+        )
+        self.cat.toys.add(*toys[:count])
+        Feeding.objects.bulk_create(
+            Feeding(date=date.today() - timedelta(days=day), meal=meal, cat=self.cat)
+            for meal in 'BLD' for day in range(count)
+        )
+        refresh_feeding_summaries([self.cat.id])
+        Photo.objects.bulk_create(
+            Photo(url=f'https://example.com/{i}.png', cat=self.cat) for i in range(count)
+        )
+
+    def test_detail_query_budget(self):
+        self.add_related_rows(2)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('detail', args=[self.cat.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_query_budget_is_flat(self):
+        self.add_related_rows(20)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(reverse('detail', args=[self.cat.id]))
+        self.assertContains(response, 'has been fed all meals for today')
+        self.assertContains(response, 'mouse 39')
+
+
+# Feeding history - keyset pagination over (date, id)
+class FeedingHistoryTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # several feedings share a date so the id tie-breaker matters
+        Feeding.objects.bulk_create(
+            Feeding(date=date(2024, 1, 1) + timedelta(days=i // 3), meal='BLD'[i % 3], cat=cls.cat)
+            for i in range(PAGE_SIZE * 3 + 5)
+        )
+
+    def test_pages_cover_every_feeding_once(self):
+        seen = []
+        cursor = None
+        while True:
+            page = paginate_by_keyset(Feeding.objects.filter(cat=self.cat), ('-date', '-id'), cursor)
+            seen.extend(feeding.id for feeding in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        expected = list(Feeding.objects.filter(cat=self.cat).order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_pages_ordered_by_an_annotation(self):
+        # like the search rank - a float that has to survive the cursor exactly
+        feedings = Feeding.objects.filter(cat=self.cat).annotate(score=Cast(F('id') % 5, FloatField()) / 3)
+        seen = []
+        cursor = None
+        while True:
+            page = paginate_by_keyset(feedings, ('-score', 'id'), cursor)
+            seen.extend(feeding.id for feeding in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, list(feedings.order_by('-score', 'id').values_list('id', flat=True)))
+        with self.assertRaises(ValueError):
+            paginate_by_keyset(feedings, ('-score', 'id'), encode_cursor(['high', '1']))
+
+    def test_later_pages_cost_the_same_as_the_first(self):
+        first = self.client.get(reverse('feeding_history', args=[self.cat.id]))
+        cursor = first.context['feedings'].next_cursor
+        self.assertEqual(len(decode_cursor(cursor)), 2)
+        # session + user, page
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('feeding_history', args=[self.cat.id]), {'cursor': cursor})
+        self.assertEqual(len(response.context['feedings']), PAGE_SIZE)
+
+    def test_detail_renders_first_page_only(self):
+        response = self.client.get(reverse('detail', args=[self.cat.id]))
+        self.assertEqual(len(response.context['feedings']), PAGE_SIZE)
+        self.assertContains(response, 'Load older feedings')
+
+    def test_invalid_cursor(self):
+        url = reverse('feeding_history', args=[self.cat.id])
+        self.assertEqual(self.client.get(url, {'cursor': 'nope!'}).status_code, 400)
+        # well formed, but not a date and an id
+        self.assertEqual(self.client.get(url, {'cursor': encode_cursor(['yesterday', 'abc'])}).status_code, 400)
+
+    def test_other_users_feedings_are_hidden(self):
+        self.client.force_login(User.objects.create_user(username='other', password='meow-meow-456'))
+        response = self.client.get(reverse('feeding_history', args=[self.cat.id]))
+        self.assertEqual(len(response.context['feedings']), 0)
+
+
+# One feeding per cat, date and meal
+class FeedingUniquenessTests(CatCollectorTestCase):
+    def test_double_submit_is_a_no_op(self):
+        url = reverse('add_feeding', args=[self.cat.id])
+        for _ in range(2):
+            response = self.client.post(url, {'date': date.today(), 'meal': 'B'})
+            self.assertRedirects(response, reverse('detail', args=[self.cat.id]))
+        self.assertEqual(Feeding.objects.filter(cat=self.cat).count(), 1)
+        self.cat.refresh_from_db()
+        self.assertEqual(self.cat.meals_fed_today(), {'B'})
+
+    def test_constraint(self):
+        Feeding.objects.create(cat=self.cat, date=date(2024, 1, 1), meal='B')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Feeding.objects.create(cat=self.cat, date=date(2024, 1, 1), meal='B')
+
+
+# the migration that adds the constraint deletes existing duplicates first
+class FeedingDedupeMigrationTests(TransactionTestCase):
+    before = [('main_app', '0013_index_plan')]
+    after = [('main_app', '0014_feeding_once_per_meal')]
+
+    def test_duplicates_are_deleted_in_batches(self):
+        executor = MigrationExecutor(connection)
+        # back to the latest schema afterwards for the tests that follow
+        self.addCleanup(lambda: MigrationExecutor(connection).migrate(executor.loader.graph.leaf_nodes()))
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        user = apps.get_model('auth', 'User').objects.create(username='tester')
+        cat = apps.get_model('main_app', 'Cat').objects.create(name='Lolo', breed='tabby', description='demon', age=3, user_id=user.id)
+        HistoricalFeeding = apps.get_model('main_app', 'Feeding')
+        keep = HistoricalFeeding.objects.bulk_create(
+            HistoricalFeeding(cat_id=cat.id, date=date(2024, 1, day), meal=meal) for day in range(1, 4) for meal in 'BL'
+        )
+        HistoricalFeeding.objects.bulk_create(
+            HistoricalFeeding(cat_id=cat.id, date=date(2024, 1, day), meal=meal) for day in range(1, 4) for meal in 'BL' * 2
+        )
+        self.assertEqual(list(delete_duplicate_feedings(HistoricalFeeding, batch_size=5)), [5, 5, 2])
+
+        HistoricalFeeding.objects.bulk_create([HistoricalFeeding(cat_id=cat.id, date=date(2024, 1, 1), meal='B')])
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        self.assertEqual(sorted(Feeding.objects.values_list('id', flat=True)), [feeding.id for feeding in keep])
+        out = io.StringIO()
+        call_command('dedupe_feedings', stdout=out)
+        self.assertIn('Deleted 0 duplicate feedings', out.getvalue())
+
+
+# Bulk feeding ingestion - JSON and NDJSON batches
+class BulkFeedingTests(CatCollectorTestCase):
+    def post(self, body, content_type='application/json'):
+        return self.client.post(reverse('bulk_add_feedings'), body, content_type=content_type)
+
+    def test_json_batch_is_validated_and_deduped(self):
+        other_user = User.objects.create_user(username='other', password='meow-meow-123')
+        other_cat = Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=other_user)
+        Feeding.objects.create(cat=self.cat, date=date(2024, 1, 1), meal='B')
+        response = self.post([
+            {'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'B'},  # already stored
+            {'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'L'},
+            {'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'L'},  # repeated in the batch
+            {'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'X'},
+            {'cat_id': self.cat.id, 'date': 'yesterday', 'meal': 'D'},
+            {'cat_id': other_cat.id, 'date': '2024-01-01', 'meal': 'D'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(result['duplicates'], 2)
+        self.assertEqual([error['index'] for error in result['errors']], [3, 4, 5])
+        self.assertEqual(Feeding.objects.filter(cat=self.cat).count(), 2)
+
+    def test_cat_id_must_be_an_integer(self):
+        result = self.post([
+            {'cat_id': str(self.cat.id), 'date': '2024-01-01', 'meal': 'B'},
+            {'cat_id': self.cat.id + 0.5, 'date': '2024-01-01', 'meal': 'B'},
+            {'cat_id': True, 'date': '2024-01-01', 'meal': 'B'},
+        ]).json()
+        self.assertEqual(result['created'], 0)
+        self.assertEqual({error['error'] for error in result['errors']}, {'cat_id must be an integer'})
+
+    def test_rows_lost_to_a_race_are_not_counted(self):
+        Feeding.objects.create(cat=self.cat, date=date(2024, 1, 1), meal='B')
+        # another batch wrote the row after our duplicate check ran
+        with mock.patch.object(Feeding.objects, 'filter', return_value=Feeding.objects.none()):
+            result = self.post([
+                {'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'B'},
+                {'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'L'},
+            ]).json()
+        self.assertEqual((result['created'], result['duplicates']), (1, 1))
+        self.assertEqual(Feeding.objects.filter(cat=self.cat).count(), 2)
+
+    def test_ndjson_batch_reports_bad_lines(self):
+        body = '\n'.join([
+            '{"cat_id": %d, "date": "2024-01-02", "meal": "B"}' % self.cat.id,
+            '{not json',
+            '{"cat_id": %d, "date": "2024-01-02", "meal": "D"}' % self.cat.id,
+        ])
+        result = self.post(body, 'application/x-ndjson').json()
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(result['errors'], [{'index': 1, 'error': 'invalid JSON'}])
+
+    def test_large_batch_query_count_is_flat(self):
+        records = [
+            {'cat_id': self.cat.id, 'date': str(date(2020, 1, 1) + timedelta(days=i)), 'meal': 'B'}
+            for i in range(1200)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            result = self.post(records).json()
+        self.assertEqual(result['created'], 1200)
+        # a few chunked INSERTs (the exact count depends on the backend's batch limit), not one per row
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "main_app_feeding"')]
+        self.assertLessEqual(len(inserts), 1200 // BULK_CHUNK_SIZE + 2)
+
+    def test_unparseable_body(self):
+        self.assertEqual(self.post('{"cat_id": 1}').status_code, 400)
+
+
+# Photo uploads - run against moto's in-memory S3
+@skipIf(mock_aws is None, 'moto is not installed')
+class PhotoUploadTests(CatCollectorTestCase):
+    BUCKET = 'cat-collector-test'
+
+    def setUp(self):
+        super().setUp()
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        env = mock.patch.dict(os.environ, {
+            'S3_BUCKET': self.BUCKET,
+            'S3_BASE_URL': 'https://s3.example.com/',
+            'AWS_DEFAULT_REGION': 'us-east-1',
+            'AWS_ACCESS_KEY_ID': 'testing',
+            'AWS_SECRET_ACCESS_KEY': 'testing',
+        })
+        env.start()
+        self.addCleanup(env.stop)
+        # the shared client must be built inside the mock
+        storage.get_s3_client.cache_clear()
+        self.addCleanup(storage.get_s3_client.cache_clear)
+        boto3.client('s3').create_bucket(Bucket=self.BUCKET)
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        settings = override_settings(UPLOAD_SPOOL_DIR=spool.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.spool_dir = spool.name
+
+    def run_worker(self):
+        return Worker(threads=0).run(burst=True)
+
+    def test_uploads_are_queued_for_the_worker(self):
+        files = [SimpleUploadedFile(f'lolo{i}.png', b'not really a png') for i in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('add_photo', args=[self.cat.id]), {'photo-file': files})
+        self.assertRedirects(response, reverse('detail', args=[self.cat.id]), fetch_redirect_response=False)
+        # the request only queues the uploads - one INSERT, nothing sent to S3 yet
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 1)
+        self.assertEqual(Task.objects.filter(name=images.store_photo.task_name, status='queued').count(), 3)
+        self.assertNotIn('Contents', boto3.client('s3').list_objects_v2(Bucket=self.BUCKET))
+
+        # the spooled files go once the Photo rows have committed
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_worker()
+        photos = Photo.objects.filter(cat=self.cat)
+        self.assertEqual(photos.count(), 3)
+        stored = boto3.client('s3').list_objects_v2(Bucket=self.BUCKET)['Contents']
+        self.assertEqual(
+            sorted(f'https://s3.example.com/{self.BUCKET}/{item["Key"]}' for item in stored),
+            sorted(photo.url for photo in photos),
+        )
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_client_is_reused(self):
+        self.assertIs(storage.get_s3_client(), storage.get_s3_client())
+
+    @override_settings(TASKS_EAGER=True)
+    def test_failed_upload_creates_no_photo(self):
+        with mock.patch.dict(os.environ, {'S3_BUCKET': 'no-such-bucket'}):
+            self.client.post(
+                reverse('add_photo', args=[self.cat.id]),
+                {'photo-file': SimpleUploadedFile('lolo.png', b'png')},
+            )
+        self.assertFalse(Photo.objects.exists())
+        failed = Task.objects.get(name=images.store_photo.task_name)
+        self.assertEqual((failed.status, failed.attempts), ('failed', tasks.TASK_MAX_ATTEMPTS))
+        self.assertIn('NoSuchBucket', failed.last_error)
+        # the spooled upload is cleaned up once it's given up on
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    @skipIf(images.Image is None, 'Pillow is not installed')
+    def test_variants_are_created_off_the_request(self):
+        png = io.BytesIO()
+        images.Image.new('RGB', (1200, 900), 'orange').save(png, 'PNG')
+        upload = SimpleUploadedFile('lolo.png', png.getvalue())
+        self.client.post(reverse('add_photo', args=[self.cat.id]), {'photo-file': upload})
+        # the request only queues the work
+        self.assertFalse(Photo.objects.exists())
+
+        # store_photo queues make_photo_variants, which is due right away
+        self.assertEqual(self.run_worker(), 2)
+        photo = Photo.objects.get(cat=self.cat)
+        self.assertEqual(photo.width, 1200)
+        self.assertTrue(photo.small_url.endswith('-small.webp'))
+        self.assertEqual(photo.display_url(), photo.medium_url)
+        self.assertEqual(
+            photo.srcset(),
+            f'{photo.small_url} 320w, {photo.medium_url} 800w, {photo.url} 1200w',
+        )
+        stored = boto3.client('s3').get_object(
+            Bucket=self.BUCKET, Key=storage.photo_key_from_url(photo.small_url)
+        )
+        self.assertEqual(stored['ContentType'], 'image/webp')
+        self.assertEqual(images.Image.open(stored['Body']).width, 320)
+
+
+# Photo spool files - S3 mocked out, so these run without moto
+class PhotoSpoolTests(CatCollectorTestCase):
+    def test_spool_file_outlives_a_failed_commit(self):
+        spool = tempfile.TemporaryDirectory()
+        self.addCleanup(spool.cleanup)
+        with override_settings(UPLOAD_SPOOL_DIR=spool.name):
+            path = images.spool_upload(SimpleUploadedFile('lolo.png', b'png'))
+        url = 'https://s3.example.com/cats/lolo.png'
+        with mock.patch.dict(os.environ, {'S3_BUCKET': 'cats'}), \
+                mock.patch.object(images, 'upload_photo', return_value=url) as upload:
+            with mock.patch.object(Photo.objects, 'create', side_effect=DatabaseError('could not serialize')):
+                with self.assertRaises(DatabaseError):
+                    images.store_photo(self.cat.id, path, 'lolo.png')
+            # still there for the retry
+            self.assertTrue(os.path.exists(path))
+            with self.captureOnCommitCallbacks(execute=True):
+                images.store_photo(self.cat.id, path, 'lolo.png')
+        self.assertEqual(upload.call_count, 2)
+        self.assertTrue(Photo.objects.filter(cat=self.cat, url=url).exists())
+        self.assertFalse(os.path.exists(path))
+
+
+# Cat index - per user cache invalidated by the Cat signals
+class CatIndexCacheTests(CatCollectorTestCase):
+    def setUp(self):
+        super().setUp()
+        reset_cache_stats()
+
+    def test_second_visit_is_served_from_cache(self):
+        self.client.get(reverse('index'))
+        # session + user only
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Lolo')
+        self.assertEqual(cache_stats()['cat_index.hit'], 1)
+        self.assertEqual(cache_stats()['cat_index.miss'], 1)
+
+    def test_create_update_and_delete_invalidate(self):
+        self.client.get(reverse('index'))
+        self.client.post(reverse('cats_create'), {'name': 'Sachi', 'breed': 'calico', 'description': 'gentle', 'age': 2})
+        self.assertContains(self.client.get(reverse('index')), 'Sachi')
+
+        sachi = Cat.objects.get(name='Sachi')
+        self.client.post(reverse('cats_update', args=[sachi.id]), {'breed': 'siamese', 'description': 'gentle', 'age': 2})
+        self.assertContains(self.client.get(reverse('index')), 'siamese')
+
+        self.client.post(reverse('cats_delete', args=[sachi.id]))
+        self.assertNotContains(self.client.get(reverse('index')), 'Sachi')
+        self.assertEqual(cache_stats()['cat_index.miss'], 4)
+
+    def test_other_users_are_not_affected(self):
+        other_user = User.objects.create_user(username='other', password='meow-meow-123')
+        self.client.get(reverse('index'))
+        Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=other_user)
+        self.client.get(reverse('index'))
+        self.assertEqual(cache_stats()['cat_index.hit'], 1)
+
+    def test_configured_cache_is_shared_between_processes(self):
+        # a locmem cache is per process - invalidating there leaves the other
+        # workers' copies stale. (The tests themselves run on a locmem cache.)
+        self.assertNotEqual(project_settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertIsInstance(caches['default'], LocMemCache)
+
+    def test_stats_are_staff_only(self):
+        self.assertEqual(self.client.get(reverse('cache_stats')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('index'))
+        self.assertEqual(self.client.get(reverse('cache_stats')).json()['cat_index.miss'], 1)
+
+
+# Fed-today summary - maintained incrementally, rebuilt by the management command
+class FeedingSummaryTests(CatCollectorTestCase):
+    def refresh_cat(self):
+        self.cat.refresh_from_db()
+        return self.cat
+
+    def test_status_costs_no_queries(self):
+        for meal in 'BLD':
+            Feeding.objects.create(cat=self.cat, date=date.today(), meal=meal)
+        cat = self.refresh_cat()
+        with self.assertNumQueries(0):
+            self.assertTrue(cat.fed_for_today())
+            self.assertEqual(cat.meal_status_for_today(), [('Breakfast', True), ('Lunch', True), ('Dinner', True)])
+
+    def test_incremental_updates(self):
+        yesterday = date.today() - timedelta(days=1)
+        Feeding.objects.create(cat=self.cat, date=yesterday, meal='B')
+        self.assertEqual(self.refresh_cat().meals_fed_today(), set())
+        lunch = Feeding.objects.create(cat=self.cat, date=date.today(), meal='L')
+        Feeding.objects.create(cat=self.cat, date=date.today(), meal='D')
+        # an older feeding doesn't disturb the summary
+        Feeding.objects.create(cat=self.cat, date=yesterday, meal='D')
+        self.assertEqual(self.refresh_cat().meals_fed_today(), {'L', 'D'})
+
+        lunch.delete()
+        self.assertEqual(self.refresh_cat().meals_fed_today(), {'D'})
+        Feeding.objects.filter(cat=self.cat, date=date.today()).delete()
+        self.assertEqual(self.refresh_cat().meals_fed_today(), set())
+        self.assertEqual(self.cat.last_fed_date, yesterday)
+
+    def test_future_feedings_are_left_out(self):
+        tomorrow = date.today() + timedelta(days=1)
+        Feeding.objects.create(cat=self.cat, date=tomorrow, meal='B')
+        for meal in 'BLD':
+            Feeding.objects.create(cat=self.cat, date=date.today(), meal=meal)
+        self.assertTrue(self.refresh_cat().fed_for_today())
+        refresh_feeding_summaries([self.cat.id])
+        self.assertEqual(self.refresh_cat().last_fed_date, date.today())
+
+    def test_bulk_ingest_refreshes_summary(self):
+        self.client.post(reverse('bulk_add_feedings'), [
+            {'cat_id': self.cat.id, 'date': str(date.today()), 'meal': meal} for meal in 'BLD'
+        ], content_type='application/json')
+        self.assertTrue(self.refresh_cat().fed_for_today())
+
+    def test_index_shows_status_after_feeding(self):
+        self.assertContains(self.client.get(reverse('index')), 'Might be hungry')
+        for meal in 'BLD':
+            self.client.post(reverse('add_feeding', args=[self.cat.id]), {'date': date.today(), 'meal': meal})
+        self.assertContains(self.client.get(reverse('index')), 'Fed all meals today')
+
+    def test_rebuild_command(self):
+        other = Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=self.user)
+        Feeding.objects.bulk_create([
+            Feeding(cat=self.cat, date=date.today(), meal='B'),
+            Feeding(cat=self.cat, date=date.today() - timedelta(days=3), meal='L'),
+            Feeding(cat=other, date=date(2024, 1, 1), meal='D'),
+        ])
+        out = io.StringIO()
+        call_command('rebuild_feeding_summaries', batch_size=1, stdout=out)
+        self.assertIn('2 cats', out.getvalue())
+        self.assertEqual(self.refresh_cat().meals_fed_today(), {'B'})
+        other.refresh_from_db()
+        self.assertEqual((other.last_fed_date, other.last_fed_meals), (date(2024, 1, 1), 0b100))
+        # nothing changed so a second run writes nothing
+        self.assertEqual(sum(rebuild_feeding_summaries()), 2)
+
+
+# Hungry cats dashboard - one aggregate query regardless of the number of cats
+class HungryCatsTests(CatCollectorTestCase):
+    def test_dashboard_counts(self):
+        today = date.today()
+        full = Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=self.user)
+        Feeding.objects.bulk_create(
+            [Feeding(cat=full, date=today, meal=meal) for meal in 'BLD']
+            + [Feeding(cat=self.cat, date=today, meal='B')]
+            + [Feeding(cat=self.cat, date=today - timedelta(days=day), meal='L') for day in range(1, 40)]
+        )
+        response = self.client.get(reverse('hungry_cats'))
+        cats = response.context['cats']
+        self.assertEqual([cat.name for cat in cats], ['Lolo'])
+        self.assertEqual(cats[0].missing_meals, ['Lunch', 'Dinner'])
+        self.assertEqual((cats[0].meals_7_days, cats[0].meals_30_days), (7, 30))
+
+    def test_single_query_at_scale(self):
+        result = benchmarks.bench_hungry_cats(cats=200, days=7, repeat=3)
+        self.assertEqual(result['queries_per_run'], 1)
+        self.assertEqual(result['hungry'], 67)
+
+
+# Feeding analytics - incremental rollups and stats read from them
+class FeedingAnalyticsTests(CatCollectorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.sachi = Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=self.user)
+        # Jan 1 - 2 every meal, Jan 3 - 4 breakfast only, Jan 5 every meal
+        Feeding.objects.bulk_create(
+            [Feeding(cat=self.cat, date=date(2024, 1, day), meal=meal) for day in (1, 2, 5) for meal in 'BLD']
+            + [Feeding(cat=self.cat, date=date(2024, 1, day), meal='B') for day in (3, 4)]
+            + [Feeding(cat=self.sachi, date=date(2024, 1, 2), meal='D')]
+        )
+
+    def refresh(self, **options):
+        out = io.StringIO()
+        call_command('refresh_feeding_rollups', stdout=out, **options)
+        return out.getvalue()
+
+    def rollups(self):
+        return set(FeedingRollup.objects.values_list('cat_id', 'date', 'meals'))
+
+    def test_incremental_refresh(self):
+        self.assertIn('12 feedings read, 6 rollups written', self.refresh())
+        self.assertEqual(Checkpoint.objects.get(name=analytics.ROLLUP_CHECKPOINT).last_id, Feeding.objects.latest('id').id)
+        self.assertIn((self.cat.id, date(2024, 1, 1), ALL_MEALS_MASK), self.rollups())
+        self.assertIn((self.sachi.id, date(2024, 1, 2), 4), self.rollups())
+
+        Feeding.objects.create(cat=self.sachi, date=date(2024, 1, 2), meal='B')
+        # the overlap re-reads old feedings too - ORing their bits in again changes nothing
+        before = self.rollups()
+        list(analytics.refresh_rollups(chunk_size=5))
+        self.assertEqual(self.rollups() - before, {(self.sachi.id, date(2024, 1, 2), 5)})
+        self.assertEqual(len(self.rollups()), 6)
+
+    def test_full_rebuild_after_delete(self):
+        self.refresh()
+        Feeding.objects.filter(cat=self.sachi).delete()
+        self.refresh()
+        self.assertTrue(FeedingRollup.objects.filter(cat=self.sachi).exists())
+        self.refresh(full=True)
+        self.assertFalse(FeedingRollup.objects.filter(cat=self.sachi).exists())
+        self.assertEqual(len(self.rollups()), 5)
+
+    def test_failed_full_rebuild_keeps_the_old_rollups(self):
+        self.refresh()
+        before = self.rollups()
+        rebuild = analytics.refresh_rollups(full=True, chunk_size=5)
+        next(rebuild)
+        with mock.patch.object(analytics, 'merge_rollups', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                list(rebuild)
+        self.assertEqual(self.rollups(), before)
+
+    def test_bulk_writes_fold_their_own_rollups(self):
+        self.refresh()
+        # the ingest lands in the rollups in its own transaction - no refresh needed
+        ingest_feedings([
+            (0, {'cat_id': self.sachi.id, 'date': '2024-01-02', 'meal': 'B'}),
+            (1, {'cat_id': self.sachi.id, 'date': '2024-01-03', 'meal': 'L'}),
+        ], {self.sachi.id})
+        self.assertIn((self.sachi.id, date(2024, 1, 2), 5), self.rollups())
+        self.assertIn((self.sachi.id, date(2024, 1, 3), 2), self.rollups())
+        # merging ORs into the stored mask rather than replacing it
+        analytics.merge_rollups({(self.sachi.id, date(2024, 1, 2).toordinal()): 2})
+        self.assertIn((self.sachi.id, date(2024, 1, 2), 7), self.rollups())
+
+    def test_columns_read_in_chunks(self):
+        rows = ((i, i * 2) for i in range(25))
+        ids, doubled = analytics.columns(rows, ('l', None), ('l', None), chunk_size=10)
+        self.assertEqual((list(ids), list(doubled)), (list(range(25)), list(range(0, 50, 2))))
+        self.assertEqual([list(column) for column in analytics.columns(iter([]), ('l', None))], [[]])
+
+    def test_stats(self):
+        self.refresh()
+        stats = analytics.feeding_stats([self.cat.id, self.sachi.id], date(2024, 1, 1), date(2024, 1, 7))
+        self.assertEqual([day['meals'] for day in stats['meals_per_day']], [3, 4, 1, 1, 3, 0, 0])
+        self.assertEqual(stats['distribution'], {'Breakfast': 5, 'Lunch': 3, 'Dinner': 4})
+        self.assertEqual(stats['cats'][self.cat.id], {
+            'meals': 11, 'days_fed_every_meal': 3, 'longest_skipped_streak': 2, 'current_skipped_streak': 2,
+        })
+        self.assertEqual(stats['cats'][self.sachi.id], {
+            'meals': 1, 'days_fed_every_meal': 0, 'longest_skipped_streak': 7, 'current_skipped_streak': 7,
+        })
+
+    def test_view(self):
+        self.refresh()
+        url = reverse('feeding_stats')
+        response = self.client.get(url, {'start': '2024-01-01', 'end': '2024-01-05', 'cat': self.cat.id})
+        stats = response.json()
+        self.assertEqual(list(stats['cats']), [str(self.cat.id)])
+        self.assertEqual(stats['meals_per_day'][0], {'date': '2024-01-01', 'meals': 3})
+        self.assertEqual(stats['cats'][str(self.cat.id)]['current_skipped_streak'], 0)
+
+        # the default range is the last 30 days
+        self.assertEqual(len(self.client.get(url).json()['meals_per_day']), 30)
+        self.assertEqual(self.client.get(url, {'start': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2024-01-05', 'end': '2024-01-01'}).status_code, 400)
+        other = User.objects.create_user(username='other', password='meow-meow-123')
+        stranger = Cat.objects.create(name='Tom', breed='tabby', description='not mine', age=5, user=other)
+        self.assertEqual(self.client.get(url, {'cat': stranger.id}).status_code, 404)
+
+    def test_benchmark(self):
+        results, counts = benchmarks.bench_analytics(repeat=2, users=1, cats_per_user=3, toys=5, feeding_days=60, seed=1)
+        queries = {result['name']: result['queries_per_run'] for result in results}
+        # one query for the rollup rows, whatever the length of the history
+        self.assertEqual(queries['analytics_stats_user'], 1)
+
+
+# Background tasks - queued in the DB, run by the worker with retries
+class TaskQueueTests(CatCollectorTestCase):
+    def setUp(self):
+        super().setUp()
+        task_calls.clear()
+        task_failures.clear()
+
+    def run_worker(self):
+        return Worker(threads=0).run(burst=True)
+
+    def test_enqueued_tasks_wait_for_a_worker(self):
+        queued = enqueue(record_call, 'meow')
+        self.assertEqual((queued.status, task_calls), ('queued', []))
+        self.assertEqual(self.run_worker(), 1)
+        self.assertEqual(task_calls, ['meow'])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('done', 1))
+
+    @override_settings(TASKS_EAGER=True)
+    def test_eager_mode(self):
+        self.assertEqual(enqueue(record_call, 'meow').status, 'done')
+        self.assertEqual(task_calls, ['meow'])
+
+    def test_retries_with_backoff(self):
+        task_failures['meow'] = 1
+        queued = enqueue(record_call, 'meow')
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), ('queued', 1))
+        self.assertIn('ValueError: meow failed', queued.last_error)
+        self.assertGreater(queued.run_at, queued.finished_at + timedelta(seconds=tasks.RETRY_DELAY - 1))
+        # not due yet
+        self.assertEqual(self.run_worker(), 0)
+
+        Task.objects.filter(id=queued.id).update(run_at=queued.finished_at)
+        self.run_worker()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.last_error), ('done', 2, ''))
+        self.assertEqual(task_calls, ['meow'])
+        self.assertEqual([tasks.retry_delay(attempt) for attempt in (1, 2, 3)], [10, 20, 40])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_gives_up_after_max_attempts(self):
+        task_failures['meow'] = 5
+        queued = enqueue(record_call, 'meow')
+        self.assertEqual((queued.status, queued.attempts), ('failed', 3))
+        self.assertEqual(task_calls, [('gave up', 'meow')])
+
+    def test_worker_logs_errors_outside_the_task(self):
+        queued = enqueue(record_call, 'meow')
+        with mock.patch.object(Task, 'save', side_effect=DatabaseError('server closed the connection')):
+            with self.assertLogs('main_app.tasks', 'ERROR') as logs:
+                self.run_worker()
+        self.assertIn('server closed the connection', logs.output[0])
+        queued.refresh_from_db()
+        # left running for requeue_stuck, with the error kept on the row
+        self.assertEqual(queued.status, 'running')
+        self.assertIn('DatabaseError: server closed the connection', queued.last_error)
+
+    def test_stuck_tasks_are_requeued(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        stuck = enqueue(record_call, 'stuck')
+        Task.objects.filter(id=stuck.id).update(status='running', attempts=1, started_at=long_ago)
+        last_try = enqueue(record_call, 'last try')
+        Task.objects.filter(id=last_try.id).update(status='running', attempts=3, started_at=long_ago)
+        self.assertEqual(requeue_stuck(timeout=60), (1, 1))
+        self.assertEqual(Task.objects.get(id=stuck.id).status, 'queued')
+        self.assertEqual(Task.objects.get(id=last_try.id).status, 'failed')
+
+    def test_stats_view_and_command(self):
+        enqueue(record_call, 'meow')
+        enqueue(record_call, 'later', delay=3600)
+        self.assertEqual(queue_stats()['depth']['queued'], 2)
+        self.assertEqual(queue_stats()['due'], 1)
+        out = io.StringIO()
+        call_command('run_tasks', burst=True, threads=0, stdout=out)
+        self.assertIn('Ran 1 tasks', out.getvalue())
+
+        self.assertEqual(self.client.get(reverse('task_stats')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        summary = self.client.get(reverse('task_stats')).json()
+        self.assertEqual(summary['depth'], {'queued': 1, 'running': 0, 'done': 1, 'failed': 0})
+        self.assertEqual(summary['tasks'][record_call.task_name]['runs'], 1)
+        self.assertIn('p95', summary['tasks'][record_call.task_name]['wait_ms'])
+
+
+# the worker's thread pool - tasks are claimed and run on other connections
+class TaskWorkerThreadsTests(TransactionTestCase):
+    def setUp(self):
+        task_calls.clear()
+        task_failures.clear()
+
+    def test_thread_pool(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('the in-memory SQLite test database locks whole tables against other threads')
+        tasks.enqueue_many(record_call, [(value,) for value in range(10)])
+        self.assertEqual(Worker(threads=3).run(burst=True), 10)
+        self.assertEqual(sorted(task_calls), list(range(10)))
+        self.assertEqual(Task.objects.filter(status='done').count(), 10)
+
+
+# Available toys - anti-join, search and keyset pages
+class AvailableToysTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        toys = Toy.objects.bulk_create(
+            Toy(name=f'{kind} {i:02}', color=color)
+            for i in range(PAGE_SIZE)
+            for kind, color in (('mouse', 'grey'), ('ball', 'red'))
+        )
+        cls.cat.toys.add(*toys[:4])
+
+    def get_toys(self, **params):
+        return self.client.get(reverse('detail', args=[self.cat.id]), params).context['toys']
+
+    def test_owned_toys_are_excluded_and_paged(self):
+        seen = []
+        params = {}
+        while True:
+            page = self.get_toys(**params)
+            seen.extend(toy.id for toy in page)
+            if not page.has_next:
+                break
+            params['toys_cursor'] = page.next_cursor
+        owned = set(self.cat.toys.values_list('id', flat=True))
+        self.assertEqual(len(seen), PAGE_SIZE * 2 - 4)
+        self.assertFalse(owned & set(seen))
+
+    def test_search_by_name_and_color(self):
+        self.assertEqual(len(self.get_toys(toy_name='Ball')), PAGE_SIZE - 2)
+        self.assertEqual(len(self.get_toys(toy_color='GREY', toy_name='mouse 1')), 10)
+        self.assertEqual(len(self.get_toys(toy_color='red', toy_name='mouse')), 0)
+
+    def test_anti_join(self):
+        sql = str(available_toys(self.cat.id).query)
+        self.assertIn('NOT EXISTS', sql)
+
+
+# Synthetic dataset generator and route benchmarks
+class SyntheticDatasetTests(TestCase):
+    def test_generate_dataset(self):
+        out = io.StringIO()
+        call_command(
+            'generate_dataset', users=2, cats_per_user=3, toys=10, toys_per_cat=2,
+            feeding_days=5, photos_per_cat=2, batch_size=7, seed=1, stdout=out,
+        )
+        self.assertIn('2 users, 10 toys, 6 cats, 12 cat_toys', out.getvalue())
+        self.assertEqual(Photo.objects.count(), 12)
+        self.assertTrue(Cat.objects.exclude(last_fed_date=None).exists())
+
+    def test_route_benchmarks(self):
+        results, counts = benchmarks.bench_routes(repeat=2, users=1, cats_per_user=2, toys=5, feeding_days=3, seed=1)
+        self.assertEqual(
+            [result['name'] for result in results],
+            ['index', 'detail', 'toys_index', 'add_feeding', 'assoc_toy'],
+        )
+        for result in results:
+            self.assertTrue(set(result['statuses']) <= {200, 302}, result)
+        # everything was rolled back
+        self.assertFalse(Cat.objects.exists())
+
+    def test_search_benchmark(self):
+        results, counts = benchmarks.bench_search(repeat=2, users=1, cats_per_user=5, toys=5, feeding_days=1, seed=1)
+        self.assertEqual([result['name'] for result in results], ['search_tab', 'search_mouse', 'search_ball_red'])
+        self.assertFalse(Cat.objects.exists())
+
+
+# Request stats middleware
+class RequestStatsTests(CatCollectorTestCase):
+    def setUp(self):
+        super().setUp()
+        stats.reset()
+
+    def test_requests_are_recorded_per_route(self):
+        for _ in range(3):
+            self.client.get(reverse('detail', args=[self.cat.id]))
+        self.client.get('/no-such-page/')
+        samples = stats.snapshot()
+        self.assertEqual(len(samples['detail']), 3)
+        self.assertEqual(len(samples['<unresolved>']), 1)
+        sample = samples['detail'][0]
+        self.assertEqual(sample['queries'], CatDetailQueryBudgetTests.QUERY_BUDGET)
+        self.assertGreater(sample['template_ms'], 0)
+        self.assertGreater(sample['bytes'], 0)
+        self.assertGreaterEqual(sample['wall_ms'], sample['template_ms'])
+
+    def test_staff_endpoint_and_command(self):
+        self.client.get(reverse('index'))
+        self.user.is_staff = True
+        self.user.save()
+        summary = self.client.get(reverse('request_stats')).json()
+        self.assertEqual(summary['index']['requests'], 1)
+        self.assertIn('p95', summary['index']['wall_ms'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            stats.dump(directory)
+            out = io.StringIO()
+            call_command('request_stats', dir=directory, stdout=out)
+        self.assertIn('index', out.getvalue())
+
+
+# Toy catalog - pagination and conditional GET
+class ToyCatalogTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Toy.objects.bulk_create(Toy(name=f'mouse {i:02}', color='grey') for i in range(30))
+
+    def test_list_is_paginated(self):
+        response = self.client.get(reverse('toys_index'))
+        self.assertEqual(len(response.context['object_list']), 24)
+        self.assertContains(response, 'Page 1 of 2')
+        self.assertEqual(len(self.client.get(reverse('toys_index'), {'page': 2}).context['object_list']), 6)
+
+    def test_repeat_visits_get_304(self):
+        url = reverse('toys_index')
+        etag = self.client.get(url)['ETag']
+        # session + user, catalog version
+        with self.assertNumQueries(3):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        # other pages and edits change the ETag
+        self.assertEqual(self.client.get(url, {'page': 2}, headers={'If-None-Match': etag}).status_code, 200)
+        toy = Toy.objects.first()
+        self.client.post(reverse('toys_update', args=[toy.id]), {'name': 'laser', 'color': 'red'})
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_detail_conditional_get(self):
+        toy = Toy.objects.first()
+        url = reverse('toys_detail', args=[toy.id])
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        # no Last-Modified - a date alone can't tell a stale CSRF token from a fresh one
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.client.get(reverse('toys_detail', args=[0])).status_code, 404)
+
+    def test_login_changes_etag(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        url = reverse('toys_index')
+        response = client.get(url)
+        etag = response['ETag']
+        self.assertEqual(client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        client.post(reverse('logout'), {'csrfmiddlewaretoken': response.context['csrf_token']})
+        login_page = client.get(reverse('login'))
+        client.post(reverse('login'), {
+            'username': 'tester', 'password': 'meow-meow-123',
+            'csrfmiddlewaretoken': login_page.context['csrf_token'],
+        })
+        # login rotated the CSRF secret, so the cached page's logout form would 403
+        response = client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        logout = client.post(reverse('logout'), {'csrfmiddlewaretoken': response.context['csrf_token']})
+        self.assertEqual(logout.status_code, 302)
+
+    def test_create_redirects_to_detail(self):
+        response = self.client.post(reverse('toys_create'), {'name': 'feather', 'color': 'blue'})
+        self.assertRedirects(response, Toy.objects.get(name='feather').get_absolute_url())
+
+
+# Search - text matches, facets and keeping the in-process index current
+class SearchTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Cat.objects.create(name='Tiger', breed='bengal', description='stripy and loud', age=2, user=cls.user)
+        Cat.objects.create(name='Tigger', breed='tabby', description='bouncy', age=4, user=cls.user)
+        other = User.objects.create_user(username='someone-else')
+        Cat.objects.create(name='Tiger Lily', breed='bengal', description='not ours', age=1, user=other)
+        Toy.objects.create(name='tiger tail', color='orange')
+        Toy.objects.create(name='mouse', color='grey')
+        Toy.objects.create(name='stripy ball', color='orange')
+
+    def search(self, **params):
+        return self.client.get(reverse('search'), params).context
+
+    def test_prefix_terms_and_facets(self):
+        context = self.search(q='tig')
+        self.assertEqual([cat.name for cat in context['cats']], ['Tiger', 'Tigger'])
+        self.assertEqual([toy.name for toy in context['toys']], ['tiger tail'])
+        self.assertEqual(context['facets']['breed'], [('bengal', 1), ('tabby', 1)])
+        self.assertEqual(context['facets']['color'], [('orange', 1)])
+        # every term has to match, across fields
+        self.assertEqual([cat.name for cat in self.search(q='stripy TIGER')['cats']], ['Tiger'])
+        self.assertEqual([toy.name for toy in self.search(q='orange')['toys']], ['stripy ball', 'tiger tail'])
+
+    def test_facet_filters(self):
+        context = self.search(q='tig', breed='tabby')
+        self.assertEqual([cat.name for cat in context['cats']], ['Tigger'])
+        # the facets still show the other breeds
+        self.assertEqual(len(context['facets']['breed']), 2)
+        self.assertEqual(len(self.search(q='stripy', color='grey')['toys']), 0)
+
+    def test_query_count(self):
+        self.search(q='tig')
+        # session + user, breed facets, color facets, cats, toys
+        with self.assertNumQueries(6):
+            self.search(q='tig')
+
+    def test_index_follows_saves_and_deletes(self):
+        self.search(q='tig')
+        with self.captureOnCommitCallbacks(execute=True):
+            toy = Toy.objects.create(name='feather wand', color='purple')
+            Cat.objects.filter(name='Tigger').get().delete()
+        self.assertEqual([toy.name for toy in self.search(q='feath')['toys']], ['feather wand'])
+        self.assertEqual([cat.name for cat in self.search(q='tig')['cats']], ['Tiger'])
+        with self.captureOnCommitCallbacks(execute=True):
+            toy.name = 'laser'
+            toy.save()
+        self.assertEqual(len(self.search(q='feath')['toys']), 0)
+
+    def test_inverted_index(self):
+        index = InvertedIndex()
+        index.add(1, 'Lolo tabby')
+        index.add(2, 'Lola calico')
+        self.assertEqual(index.search(['lol']), {1, 2})
+        self.assertEqual(index.search(['lol', 'cal']), {2})
+        index.remove(2)
+        self.assertEqual(index.search(['lol']), {1})
+        self.assertEqual(index.tokens, ['lolo', 'tabby'])
+
+    def test_empty_query_and_bad_cursor(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.search(q='')['cats']), 0)
+        response = self.client.get(reverse('search'), {'q': 'tig', 'cats_cursor': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+def sequential_scans(sql):
+    # the tables the database would read end to end to run ``sql`` - walking a
+    # whole index counts too, only a search on an index condition doesn't
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # with seq scans priced out PostgreSQL only picks one when no index
+            # can serve the query - a small test table can't fool it that way
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            plan = [row[0] for row in cursor.fetchall()]
+            scans = []
+            for i, line in enumerate(plan):
+                match = re.search(r'(Seq Scan|(?<!Bitmap )Index Scan|Index Only Scan|Bitmap Heap Scan)\b.* on (\w+)', line)
+                if not match:
+                    continue
+                # a node's details are the lines up to the next "->" node
+                details = list(takewhile(lambda detail: '->' not in detail, plan[i + 1:]))
+                if not any('Index Cond' in detail or 'Recheck Cond' in detail for detail in details):
+                    scans.append(match.group(2))
+            return scans
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        # "SEARCH t USING INDEX i (a=?)" seeks an index, every "SCAN t" - even
+        # "SCAN t USING INDEX i" - reads all of it
+        details = [row[-1] for row in cursor.fetchall()]
+        return [match.group(1) for match in map(re.compile(r'SCAN (\w+)').match, details) if match]
+
+
+# Index plan - EXPLAIN every query the hot pages run against seeded data
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        counts, users, toys = generate_dataset(users=3, cats_per_user=30, toys=200, feeding_days=30, seed=1)
+        cls.user = users[0]
+        cls.cat = Cat.objects.filter(user=cls.user).first()
+        cls.toy = Toy.objects.first()
+        # give the planner real statistics
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        reset_search_index()
+        self.client.force_login(self.user)
+
+    def assertNoSequentialScans(self, url, params=None, whole_tables=()):
+        # ``whole_tables`` are read end to end on purpose, e.g. the toy catalog's count
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            scans = [table for table in sequential_scans(sql) if table not in whole_tables]
+            self.assertFalse(scans, f'{url} scans {", ".join(scans)}:\n{sql}')
+
+    def test_cat_pages(self):
+        self.assertNoSequentialScans(reverse('index'))
+        # unfiltered, the available toys walk toy_name_idx until a page is full
+        self.assertNoSequentialScans(reverse('detail', args=[self.cat.id]), whole_tables=['main_app_toy'])
+        self.assertNoSequentialScans(reverse('detail', args=[self.cat.id]), {'toy_color': 'red'})
+        self.assertNoSequentialScans(reverse('detail', args=[self.cat.id]), {'toy_name': 'Ba', 'toy_color': 'RED'})
+        cursor = self.client.get(reverse('detail', args=[self.cat.id])).context['feedings'].next_cursor
+        self.assertNoSequentialScans(reverse('feeding_history', args=[self.cat.id]), {'cursor': cursor})
+        self.assertNoSequentialScans(reverse('hungry_cats'))
+
+    def test_toy_pages(self):
+        # the catalog version and the pager count every toy
+        self.assertNoSequentialScans(reverse('toys_index'), {'page': 2}, whole_tables=['main_app_toy'])
+        self.assertNoSequentialScans(reverse('toys_detail', args=[self.toy.id]))
+
+    def test_search_and_export(self):
+        # without tsvector the first search reads the tables once to build its index
+        self.client.get(reverse('search'), {'q': 'cat'})
+        self.assertNoSequentialScans(reverse('search'), {'q': 'cat', 'breed': 'tabby'})
+        self.assertNoSequentialScans(reverse('export'), {'format': 'ndjson'})
+
+    def test_scans_are_caught(self):
+        self.assertEqual(sequential_scans(str(Cat.objects.filter(age=3).query)), ['main_app_cat'])
+        # reading a whole index in order is no better
+        self.assertEqual(sequential_scans(str(Toy.objects.order_by('name', 'id').query)), ['main_app_toy'])
+
+
+# Async views - same pages, same query budgets, served through the async URLconf
+@override_settings(ROOT_URLCONF=benchmarks.AsyncURLConf)
+class AsyncViewTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Toy.objects.bulk_create(Toy(name=f'mouse {i:02}', color='grey') for i in range(30))
+
+    def test_detail_query_budget(self):
+        Photo.objects.create(url='https://example.com/1.png', cat=self.cat)
+        Feeding.objects.create(date=date.today(), meal='B', cat=self.cat)
+        with self.assertNumQueries(CatDetailQueryBudgetTests.QUERY_BUDGET):
+            response = self.client.get(reverse('detail', args=[self.cat.id]))
+        self.assertContains(response, 'Lolo')
+        self.assertContains(response, 'https://example.com/1.png')
+        self.assertEqual(len(response.context['toys']), PAGE_SIZE)
+        self.assertEqual(len(response.context['feedings']), 1)
+
+    def test_index_is_cached(self):
+        self.assertContains(self.client.get(reverse('index')), 'Lolo')
+        # session + user only
+        with self.assertNumQueries(2):
+            self.client.get(reverse('index'))
+
+    def test_toy_catalog_conditional_get(self):
+        url = reverse('toys_index')
+        response = self.client.get(url, {'page': 2})
+        self.assertEqual(len(response.context['object_list']), 6)
+        self.assertContains(response, 'Page 2 of 2')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 200)
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(3):
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        toy = Toy.objects.first()
+        url = reverse('toys_detail', args=[toy.id])
+        response = self.client.get(url)
+        self.assertContains(response, toy.name)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get(reverse('toys_detail', args=[0])).status_code, 404)
+
+    def test_login_required(self):
+        self.client.logout()
+        response = self.client.get(reverse('detail', args=[self.cat.id]))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('detail', args=[self.cat.id])}")
+
+    async def test_asgi_request_stats(self):
+        # through the async middleware chain, like under an ASGI server
+        stats.reset()
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('detail', args=[self.cat.id]))
+        self.assertContains(response, 'Lolo')
+        sample = stats.snapshot()['detail'][0]
+        self.assertEqual(sample['queries'], CatDetailQueryBudgetTests.QUERY_BUDGET)
+        self.assertGreater(sample['template_ms'], 0)
+
+
+# the concurrency benchmark commits its data, so it can't run inside TestCase's transaction
+class ConcurrencyBenchmarkTests(TransactionTestCase):
+    def test_wsgi_and_asgi_runs(self):
+        mine = Toy.objects.create(name='feather', color='blue')
+        results, counts = benchmarks.bench_concurrency(
+            concurrency=2, requests=4, cats_per_user=2, toys=5, feeding_days=2, seed=1,
+        )
+        self.assertEqual([result['name'] for result in results], ['concurrency_wsgi', 'concurrency_asgi'])
+        for result in results:
+            self.assertEqual(result['requests'], 8)
+            self.assertEqual(result['statuses'], [200])
+        # everything it made is gone again - and nothing else
+        self.assertFalse(User.objects.exists())
+        self.assertEqual(list(Toy.objects.all()), [mine])
+
+
+# closes and reopens the connection, which TestCase's transaction wouldn't survive
+class ConnectionBenchmarkTests(TransactionTestCase):
+    def test_per_request_and_persistent(self):
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        results = benchmarks.bench_connections(repeat=5)
+        self.assertEqual([result['name'] for result in results], ['connections_per_request', 'connections_persistent'])
+        self.assertEqual([result['queries_per_run'] for result in results], [1, 1])
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], max_age)
+
+
+# Read-only JSON API
+class ApiTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.toys = Toy.objects.bulk_create(Toy(name=f'mouse {i:02}', color='grey') for i in range(25))
+        cls.cat.toys.add(*cls.toys[:2])
+        Feeding.objects.bulk_create(
+            Feeding(cat=cls.cat, date=date(2024, 1, 1) + timedelta(days=day), meal='B') for day in range(15)
+        )
+        Photo.objects.create(cat=cls.cat, url='https://example.com/lolo.png')
+        other = User.objects.create_user(username='someone-else')
+        cls.other_cat = Cat.objects.create(name='Sachi', breed='calico', description='not ours', age=2, user=other)
+
+    def get(self, name, *args, **params):
+        return self.client.get(reverse(name, args=args), params)
+
+    def test_sparse_fields_and_includes(self):
+        cats = self.get('api_cats', fields='name,breed').json()
+        self.assertEqual(cats, {'results': [{'id': self.cat.id, 'name': 'Lolo', 'breed': 'tabby'}], 'next': None})
+
+        # session + user, the cat's version and one per include, then the cat and one query per include
+        with self.assertNumQueries(10):
+            response = self.get('api_cat', self.cat.id, fields='name', include='feedings,toys,photos')
+        cat = response.json()
+        self.assertEqual(set(cat), {'id', 'name', 'feedings', 'toys', 'photos'})
+        self.assertEqual(len(cat['feedings']), 10)
+        self.assertEqual(cat['feedings'][0]['date'], '2024-01-15')
+        self.assertEqual([toy['name'] for toy in cat['toys']], ['mouse 00', 'mouse 01'])
+        self.assertEqual(cat['photos'][0]['url'], 'https://example.com/lolo.png')
+        # a repeat visit only reads the versions
+        url = reverse('api_cat', args=[self.cat.id])
+        with self.assertNumQueries(6):
+            repeat = self.client.get(
+                url, {'fields': 'name', 'include': 'feedings,toys,photos'}, headers={'If-None-Match': response['ETag']},
+            )
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_cursor_pagination(self):
+        first = self.get('api_toys', fields='name').json()
+        self.assertEqual(len(first['results']), PAGE_SIZE)
+        second = self.get('api_toys', fields='name', cursor=first['next']).json()
+        self.assertEqual([toy['name'] for toy in second['results']], [f'mouse {i:02}' for i in range(20, 25)])
+        self.assertIsNone(second['next'])
+
+        feedings = self.get('api_cat_feedings', self.cat.id, fields='date').json()
+        self.assertEqual(feedings['results'][0], {'id': feedings['results'][0]['id'], 'date': '2024-01-15'})
+
+    def test_etag(self):
+        response = self.get('api_cat', self.cat.id)
+        etag = response['ETag']
+        self.assertIn('private', response['Cache-Control'])
+        url = reverse('api_cat', args=[self.cat.id])
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+        Feeding.objects.create(cat=self.cat, date=date.today(), meal='L')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+        # swapping a toy for another keeps the link count but not the newest link
+        etag = self.client.get(url, {'include': 'toys'})['ETag']
+        self.cat.toys.remove(self.toys[0])
+        self.cat.toys.add(self.toys[2])
+        self.assertEqual(self.client.get(url, {'include': 'toys'}, headers={'If-None-Match': etag}).status_code, 200)
+        # so does a feeding edited in place
+        url = reverse('api_cat_feedings', args=[self.cat.id])
+        etag = self.client.get(url)['ETag']
+        feeding = Feeding.objects.filter(cat=self.cat).earliest('date')
+        feeding.meal = 'D'
+        feeding.save()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_errors(self):
+        self.assertEqual(self.get('api_cats', fields='name,password').status_code, 400)
+        self.assertEqual(self.get('api_cats', include='owner').status_code, 400)
+        self.assertEqual(self.get('api_cats', cursor='nope').status_code, 400)
+        # other people's cats don't exist as far as the API is concerned
+        self.assertEqual(self.get('api_cat', self.other_cat.id).status_code, 404)
+        self.assertEqual(self.get('api_cat_feedings', self.other_cat.id).status_code, 404)
+        self.assertEqual(self.get('api_toy', 0).status_code, 404)
+
+    def test_benchmark(self):
+        results, counts = benchmarks.bench_api(repeat=2, users=1, cats_per_user=2, toys=5, feeding_days=3, seed=1)
+        sizes = {result['name']: result['bytes'] for result in results}
+        self.assertLess(sizes['detail_api'] * 10, sizes['detail_html'])
+
+
+# Cached sessions and users
+@override_settings(SESSION_ENGINE='django.contrib.sessions.backends.cached_db', USER_CACHE_SECONDS=30)
+class AuthCacheTests(CatCollectorTestCase):
+    def setUp(self):
+        clear_user_cache()
+        super().setUp()
+
+    def test_signed_in_requests_skip_session_and_user_queries(self):
+        self.client.get(reverse('index'))
+        # the cat list is cached too, so this is a request without a single query
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Lolo')
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_cached_user_is_a_copy(self):
+        self.client.get(reverse('index'))
+        get_cached_user(self.user.id).username = 'someone-else'
+        self.assertEqual(get_cached_user(self.user.id).username, 'tester')
+
+    def test_password_change_and_logout_invalidate(self):
+        self.client.get(reverse('index'))
+        user = User.objects.get(id=self.user.id)
+        user.set_password('a-new-password-456')
+        user.save()
+        self.assertIsNone(get_cached_user(self.user.id))
+        # the old session's password hash no longer matches
+        self.assertEqual(self.client.get(reverse('index')).status_code, 302)
+
+        self.client.force_login(user)
+        self.client.get(reverse('index'))
+        self.assertIsNotNone(get_cached_user(self.user.id))
+        self.client.post(reverse('logout'))
+        self.assertIsNone(get_cached_user(self.user.id))
+        self.assertEqual(self.client.get(reverse('index')).status_code, 302)
+
+    def test_signup_logs_the_new_user_in(self):
+        self.client.logout()
+        response = self.client.post(reverse('signup'), {
+            'username': 'newcomer', 'password1': 'purr-purr-789', 'password2': 'purr-purr-789',
+        })
+        self.assertRedirects(response, reverse('index'))
+        self.assertEqual(self.client.get(reverse('index')).context['user'].username, 'newcomer')
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_signed_cookie_sessions(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('index'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('index')).status_code, 200)
+
+    def test_benchmark(self):
+        results, counts = benchmarks.bench_auth(repeat=2, users=1, cats_per_user=2, toys=5, feeding_days=3, seed=1)
+        queries = {result['name']: result['queries_per_run'] for result in results}
+        self.assertEqual(queries['auth_db_detail'] - queries['auth_cached_db_detail'], 2)
+        self.assertEqual(queries['auth_db_detail'] - queries['auth_signed_cookies_detail'], 2)
+
+
+# Batch toy association
+class AssignToysTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.cats = [cls.cat] + [
+            Cat.objects.create(name=f'Cat {i}', breed='tabby', description='cat', age=1, user=cls.user)
+            for i in range(4)
+        ]
+        cls.mouse = Toy.objects.create(name='mouse', color='grey')
+        cls.ball = Toy.objects.create(name='ball', color='red')
+
+    def post(self, data):
+        return self.client.post(reverse('assign_toys'), data, content_type='application/json')
+
+    def test_one_toy_for_many_cats(self):
+        self.cat.toys.add(self.mouse)
+        with CaptureQueriesContext(connection) as queries:
+            result = self.post({'toy_id': self.mouse.id, 'cat_ids': [cat.id for cat in self.cats]}).json()
+        # the cat that already had the mouse isn't counted
+        self.assertEqual(result, {'linked': 4, 'removed': 0, 'errors': []})
+        self.assertEqual(Cat.toys.through.objects.filter(toy=self.mouse).count(), 5)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 1)
+
+        with CaptureQueriesContext(connection) as queries:
+            result = self.post({'toy_id': self.mouse.id, 'cat_ids': [cat.id for cat in self.cats[:3]], 'action': 'remove'}).json()
+        self.assertEqual(result['removed'], 3)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('DELETE')]), 1)
+
+    def test_pairs_and_errors(self):
+        other_user = User.objects.create_user(username='other', password='meow-meow-123')
+        other_cat = Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=other_user)
+        self.cat.toys.add(self.ball)
+        result = self.post({
+            'add': [[self.cat.id, self.mouse.id], [other_cat.id, self.mouse.id], [self.cat.id, 0], 'nope'],
+            'remove': [[self.cat.id, self.ball.id]],
+        }).json()
+        self.assertEqual((result['linked'], result['removed']), (1, 1))
+        self.assertEqual([error['index'] for error in result['errors']], [1, 2, 3])
+        self.assertEqual(result['errors'][2]['error'], 'expected a [cat_id, toy_id] pair')
+        self.assertEqual(list(self.cat.toys.all()), [self.mouse])
+        self.assertFalse(other_cat.toys.exists())
+
+    def test_pairs_must_be_two_integers(self):
+        loose = [
+            f'{self.cat.id}{self.mouse.id}', [str(self.cat.id), self.mouse.id], [self.cat.id, self.mouse.id + 0.5],
+            [True, self.mouse.id], [self.cat.id, self.mouse.id, 1], {'cat': self.cat.id, 'toy': self.mouse.id},
+        ]
+        result = self.post({'add': loose}).json()
+        self.assertEqual(result['linked'], 0)
+        self.assertEqual([error['index'] for error in result['errors']], list(range(len(loose))))
+        self.assertFalse(self.cat.toys.exists())
+
+    def test_bad_body(self):
+        self.assertEqual(self.post({'add': 'nope'}).status_code, 400)
+
+    def test_benchmark(self):
+        per_pair, batch = benchmarks.bench_toy_links(cats=10, repeat=1)
+        self.assertLess(batch['queries_per_run'], per_pair['queries_per_run'])
+
+
+# Streaming export
+class ExportTests(CatCollectorTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Feeding.objects.bulk_create(
+            Feeding(cat=cls.cat, date=date(2024, 1, day), meal='B') for day in range(1, 11)
+        )
+        Photo.objects.create(cat=cls.cat, url='https://example.com/lolo.png')
+        cls.cat.toys.add(Toy.objects.create(name='mouse', color='grey'))
+        # someone else's cat must never show up
+        other_user = User.objects.create_user(username='other', password='meow-meow-123')
+        other_cat = Cat.objects.create(name='Sachi', breed='calico', description='gentle', age=2, user=other_user)
+        Feeding.objects.create(cat=other_cat, date=date(2024, 1, 5), meal='L')
+
+    def export(self, **params):
+        response = self.client.get(reverse('export'), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_table(self):
+        records = [json.loads(line) for line in self.export().splitlines()]
+        counts = {}
+        for record in records:
+            counts[record['type']] = counts.get(record['type'], 0) + 1
+        self.assertEqual(counts, {'cats': 1, 'feedings': 10, 'photos': 1, 'cat_toys': 1})
+        self.assertEqual(records[-1]['toy__name'], 'mouse')
+
+    def test_csv_with_date_range(self):
+        rows = list(csv.reader(io.StringIO(self.export(format='csv', table='feedings', since='2024-01-03', until='2024-01-05'))))
+        self.assertEqual(rows[0], ['id', 'cat_id', 'date', 'meal'])
+        self.assertEqual([row[2] for row in rows[1:]], ['2024-01-03', '2024-01-04', '2024-01-05'])
+
+    def test_bad_requests(self):
+        for params in ({'format': 'csv'}, {'format': 'xml'}, {'table': 'users'}, {'since': 'last week'}):
+            self.assertEqual(self.client.get(reverse('export'), params).status_code, 400, params)
+
+
+# Streaming import command
+class ImportCommandTests(CatCollectorTestCase):
+    def write(self, directory, name, lines):
+        path = os.path.join(directory, name)
+        with open(path, 'w') as input_file:
+            input_file.write('\n'.join(lines) + '\n')
+        return path
+
+    def import_data(self, *args, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_data', *args, user='tester', stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_ndjson_import(self):
+        lines = [
+            json.dumps({'type': 'toys', 'name': 'mouse', 'color': 'grey'}),
+            json.dumps({'type': 'cats', 'id': 501, 'name': 'Sachi', 'breed': 'calico', 'description': 'gentle', 'age': 2}),
+            json.dumps({'type': 'cat_toys', 'cat_id': 501, 'toy__name': 'mouse', 'toy__color': 'grey'}),
+            json.dumps({'type': 'cat_toys', 'cat_id': 501, 'toy__name': 'laser', 'toy__color': 'red'}),
+            json.dumps({'type': 'feedings', 'cat_id': 501, 'date': str(date.today()), 'meal': 'B'}),
+            json.dumps({'type': 'feedings', 'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'L'}),
+            json.dumps({'type': 'feedings', 'cat_id': 501, 'date': '2024-01-01', 'meal': 'X'}),
+            '{broken',
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            out, err = self.import_data(self.write(directory, 'legacy.ndjson', lines), chunk_size=3)
+        self.assertIn('rows/sec', out)
+        self.assertIn('2 errors', out)
+        self.assertIn('record 7: meal must be one of', err)
+        sachi = Cat.objects.get(name='Sachi', user=self.user)
+        self.assertEqual(sorted(str(toy) for toy in sachi.toys.all()), ['grey mouse', 'red laser'])
+        self.assertEqual(Toy.objects.filter(name='mouse').count(), 1)
+        self.assertEqual(sachi.meals_fed_today(), {'B'})
+        self.assertTrue(Feeding.objects.filter(cat=self.cat, meal='L').exists())
+
+    def test_csv_import_resumes_from_checkpoint(self):
+        lines = ['cat_id,date,meal'] + [f'{self.cat.id},2024-01-{day:02},B' for day in range(1, 11)]
+        Checkpoint.objects.create(name='import:legacy', last_id=4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'feedings.csv', lines)
+            self.import_data(path, type='feedings', chunk_size=4, checkpoint='legacy')
+        self.assertEqual(Checkpoint.objects.get(name='import:legacy').last_id, 10)
+        # the first four were "already imported"
+        self.assertEqual(Feeding.objects.filter(cat=self.cat).count(), 6)
+
+    def test_chunk_and_checkpoint_commit_together(self):
+        lines = [json.dumps({'type': 'cats', 'id': 501, 'name': 'Sachi', 'breed': 'calico', 'age': 2})]
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'cats.ndjson', lines)
+            with mock.patch.object(Checkpoint, 'save', side_effect=DatabaseError('server closed the connection')):
+                with self.assertRaises(DatabaseError):
+                    self.import_data(path, checkpoint='cats')
+            self.assertFalse(Cat.objects.filter(name='Sachi').exists())
+            # run again it creates the cat once and remembers its legacy id
+            self.import_data(path, checkpoint='cats')
+            self.import_data(path, checkpoint='cats')
+        sachi = Cat.objects.get(name='Sachi')
+        self.assertEqual(Checkpoint.objects.get(name='import:cats').state, {'cat_ids': {'501': sachi.id}})
+
+    def test_oversized_fields_and_skipped_rows(self):
+        Feeding.objects.create(cat=self.cat, date=date(2024, 1, 1), meal='B')
+        lines = [
+            json.dumps({'type': 'toys', 'name': 'm' * 51, 'color': 'grey'}),
+            json.dumps({'type': 'cats', 'name': 'Sachi', 'breed': 'b' * 101, 'age': 2}),
+            json.dumps({'type': 'feedings', 'cat_id': self.cat.id, 'date': '2024-01-01', 'meal': 'B'}),
+            json.dumps({'type': 'feedings', 'cat_id': self.cat.id, 'date': '2024-01-02', 'meal': 'B'}),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            out, err = self.import_data(self.write(directory, 'legacy.ndjson', lines))
+        self.assertIn('record 1: name is longer than 50 characters', err)
+        self.assertIn('record 2: breed is longer than 100 characters', err)
+        # the feeding that was already there isn't counted
+        self.assertIn('Imported 0 toys, 0 cats, 0 cat_toys, 1 feedings', out)
+
+    def test_export_round_trip(self):
+        Feeding.objects.create(cat=self.cat, date=date(2024, 1, 1), meal='D')
+        exported = b''.join(self.client.get(reverse('export')).streaming_content).decode()
+        User.objects.create_user(username='restored', password='meow-meow-123')
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.write(directory, 'export.ndjson', exported.splitlines())
+            call_command('import_data', path, user='restored', stdout=io.StringIO())
+        restored = Cat.objects.get(user__username='restored')
+        self.assertEqual(list(restored.feeding_set.values_list('date', 'meal')), [(date(2024, 1, 1), 'D')])
+
+
+# Static pipeline - hashed, compressed, long-cached files served by the middleware
+class StaticPipelineTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.source_dir = os.path.join(directory.name, 'source')
+        self.static_root = os.path.join(directory.name, 'root')
+        os.makedirs(os.path.join(self.source_dir, 'img'))
+        # big enough to compress, and a PNG saved without compression
+        self.big_css = b''.join(b'.cat-%d { color: orange; }\n' % i for i in range(200))
+        with open(os.path.join(self.source_dir, 'big.css'), 'wb') as css_file:
+            css_file.write(self.big_css)
+        if images.Image is not None:
+            images.Image.new('RGB', (200, 200), 'orange').save(
+                os.path.join(self.source_dir, 'img', 'orange.png'), compress_level=0
+            )
+        settings = override_settings(
+            DEBUG=False,
+            STATIC_ROOT=self.static_root,
+            STATICFILES_DIRS=[self.source_dir],
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'main_app.staticfiles.CompressedManifestStaticFilesStorage'},
+            },
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        staticfiles.is_vendored.cache_clear()
+        self.addCleanup(staticfiles.is_vendored.cache_clear)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def collected(self, name):
+        return os.path.join(self.static_root, name)
+
+    def test_collectstatic(self):
+        hashed = static('big.css')
+        self.assertRegex(hashed, r'^/static/big\.[0-9a-f]{12}\.css$')
+        hashed_path = self.collected(hashed.removeprefix('/static/'))
+        with open(hashed_path + '.gz', 'rb') as gz_file:
+            self.assertEqual(gzip.decompress(gz_file.read()), self.big_css)
+        # too small to be worth it
+        self.assertFalse(os.path.exists(self.collected(static('css/style.css').removeprefix('/static/')) + '.gz'))
+
+    @skipIf(images.Image is None, 'Pillow is not installed')
+    def test_pngs_are_optimized(self):
+        original = os.path.getsize(os.path.join(self.source_dir, 'img', 'orange.png'))
+        for name in ('img/orange.png', static('img/orange.png').removeprefix('/static/')):
+            self.assertLess(os.path.getsize(self.collected(name)), original)
+
+    def test_hashed_files_are_compressed_and_immutable(self):
+        url = static('big.css')
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip, deflate, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), self.big_css)
+
+        response = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.big_css)
+
+    def test_unhashed_files_revalidate(self):
+        response = self.client.get('/static/big.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        response = self.client.get('/static/big.css', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # anything else under /static/ falls through to the URLconf
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_pages_link_hashed_names(self):
+        self.assertContains(self.client.get(reverse('home')), static('css/style.css'))
+        self.assertNotEqual(static('css/style.css'), '/static/css/style.css')
+
+    def test_vendored_assets(self):
+        name = 'materialize/1.0.0/materialize.min.css'
+        url, integrity = staticfiles.VENDOR_ASSETS[name]
+        self.assertEqual(staticfiles.vendor_url(name), url)
+        # the CDN tags carry the pinned hash until the files are vendored
+        self.assertContains(self.client.get(reverse('home')), f'href="{url}" integrity="{integrity}" crossorigin="anonymous"')
+        content = b'.btn { color: teal; }'
+        pinned = {name: (url, staticfiles.sri_hash(content)) for name, (url, integrity) in staticfiles.VENDOR_ASSETS.items()}
+        with tempfile.TemporaryDirectory() as vendor_dir:
+            response = mock.MagicMock()
+            response.__enter__.return_value.read.return_value = content
+            with mock.patch('main_app.management.commands.vendor_static.VENDOR_DIR', vendor_dir), \
+                    mock.patch('main_app.management.commands.vendor_static.urlopen', return_value=response):
+                # a download that doesn't match its pinned hash is refused
+                with self.assertRaisesMessage(CommandError, 'does not match its pinned hash'):
+                    call_command('vendor_static', stdout=io.StringIO())
+                self.assertEqual(os.listdir(vendor_dir), [])
+                with mock.patch.dict(staticfiles.VENDOR_ASSETS, pinned):
+                    call_command('vendor_static', stdout=io.StringIO())
+            self.assertTrue(os.path.exists(os.path.join(vendor_dir, 'materialize', '1.0.0', 'materialize.min.js')))
+
+            with override_settings(STATICFILES_DIRS=[self.source_dir, ('vendor', vendor_dir)]):
+                staticfiles.is_vendored.cache_clear()
+                call_command('collectstatic', interactive=False, verbosity=0)
+                self.assertRegex(staticfiles.vendor_url(name), r'^/static/vendor/materialize/1\.0\.0/materialize\.min\.[0-9a-f]{12}\.css$')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, GZIP;q=0.5, identity'), {'gzip', 'identity'})
+        self.assertEqual(accepted_encodings(''), set())
+
+    def test_benchmark(self):
+        results = {result['name']: result for result in benchmarks.bench_static(repeat=1)}
+        # only the page itself is asked for again on a repeat visit
+        self.assertEqual(results['static_pipeline']['repeat_requests'], 1)
+        self.assertEqual(results['static_plain']['repeat_requests'], 1 + results['static_plain']['assets'])
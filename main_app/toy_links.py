@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from django.db.models import Q
+
+from .models import Cat, Toy
+
+CatToy = Cat.toys.through
+
+
+# Batch toy association
+# Works straight on the Cat.toys through table: one SELECT of the links that
+# already exist plus one INSERT ... ON CONFLICT DO NOTHING for the pairs being
+# added, and one DELETE for every pair removed, instead of a Cat lookup plus an
+# add/remove per pair.
+
+def parse_pairs(data):
+    """Turn the request JSON into (action, index, cat_id, toy_id) tuples.
+
+    Accepts ``{"add": [[cat_id, toy_id], ...], "remove": [...]}`` and the
+    shorthand ``{"toy_id": 1, "cat_ids": [...], "action": "add"}``.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    if 'toy_id' in data:
+        action = data.get('action', 'add')
+        if action not in ('add', 'remove') or not isinstance(data.get('cat_ids'), list):
+            raise ValueError('Expected "cat_ids" as a list and "action" as add or remove')
+        data = {action: [[cat_id, data['toy_id']] for cat_id in data['cat_ids']]}
+
+    pairs = []
+    for action in ('add', 'remove'):
+        items = data.get(action, [])
+        if not isinstance(items, list):
+            raise ValueError(f'Expected "{action}" to be a list of [cat_id, toy_id] pairs')
+        for index, item in enumerate(items):
+            pairs.append((action, index, item))
+    return pairs
+
+
+def clean_pairs(pairs, cat_ids):
+    # returns ({'add': {(cat_id, toy_id)}, 'remove': {...}}, errors)
+    cleaned = {'add': set(), 'remove': set()}
+    errors = []
+    candidates = []
+    for action, index, item in pairs:
+        # two real JSON integers - no "12", 1.5 or true (bool is an int subclass, hence type() is)
+        if not (isinstance(item, list) and len(item) == 2 and all(type(value) is int for value in item)):
+            errors.append({'action': action, 'index': index, 'error': 'expected a [cat_id, toy_id] pair'})
+            continue
+        cat_id, toy_id = item
+        if cat_id not in cat_ids:
+            errors.append({'action': action, 'index': index, 'error': f'unknown cat: {cat_id}'})
+            continue
+        candidates.append((action, index, cat_id, toy_id))
+
+    # one query to check every toy at once
+    toy_ids = set(Toy.objects.filter(id__in={pair[3] for pair in candidates}).values_list('id', flat=True))
+    for action, index, cat_id, toy_id in candidates:
+        if toy_id not in toy_ids:
+            errors.append({'action': action, 'index': index, 'error': f'unknown toy: {toy_id}'})
+        else:
+            cleaned[action].add((cat_id, toy_id))
+    errors.sort(key=lambda error: (error['action'], error['index']))
+    return cleaned, errors
+
+
+def pairs_condition(pairs):
+    # group by toy so "one toy for / off many cats" is a single IN list
+    cats_by_toy = defaultdict(set)
+    for cat_id, toy_id in pairs:
+        cats_by_toy[toy_id].add(cat_id)
+    condition = Q()
+    for toy_id, cat_ids in cats_by_toy.items():
+        condition |= Q(toy_id=toy_id, cat_id__in=cat_ids)
+    return condition
+
+
+def link_toys(pairs):
+    """Add the (cat_id, toy_id) links that don't exist yet; returns how many were added."""
+    if not pairs:
+        return 0
+    existing = set(CatToy.objects.filter(pairs_condition(pairs)).values_list('cat_id', 'toy_id'))
+    new_pairs = set(pairs) - existing
+    # the through table is unique on (cat, toy) - a link another request added
+    # since the read above is skipped too
+    CatToy.objects.bulk_create(
+        [CatToy(cat_id=cat_id, toy_id=toy_id) for cat_id, toy_id in new_pairs],
+        ignore_conflicts=True,
+    )
+    return len(new_pairs)
+
+
+def unlink_toys(pairs):
+    if not pairs:
+        return 0
+    deleted, _ = CatToy.objects.filter(pairs_condition(pairs)).delete()
+    return deleted
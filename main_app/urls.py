@@ -1,36 +1,71 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
-urlpatterns = [
-    # first arg - url endpoint
-    # second arg - view to render
-    # third arg - names the route
-    path('', views.home, name='home'),
-    path('about/', views.about, name='about'),
-    path('cats/', views.cats_index, name='index'),
+
+def build_urlpatterns(async_views=False):
+    # the read-heavy pages have async twins for when we're served over ASGI
+    if async_views:
+        cats_index, cats_detail = views.cats_index_async, views.cats_detail_async
+        toy_list, toy_detail = views.toy_list_async, views.toy_detail_async
+    else:
+        cats_index, cats_detail = views.cats_index, views.cats_detail
+        toy_list, toy_detail = views.ToyList.as_view(), views.ToyDetail.as_view()
+
+    return [
+        # first arg - url endpoint
+        # second arg - view to render
+        # third arg - names the route
+        path('', views.home, name='home'),
+        path('about/', views.about, name='about'),
+        path('cats/', cats_index, name='index'),
+        path('cats/hungry/', views.hungry_cats_view, name='hungry_cats'),
+        path('search/', views.search_view, name='search'),
     
-    # route for the detail page of our cats
-    # we need an id, as well as a way to refer to the id
-    path('cats/create', views.CatCreate.as_view(),  name='cats_create'),
-    path('cats/<int:cat_id>', views.cats_detail, name='detail'),
-    path('cats/<int:pk>/update', views.CatUpdate.as_view(), name='cats_update'),
-    path('cats/<int:pk>/delete', views.CatDelete.as_view(), name='cats_delete'),
-    path('cats/<int:cat_id>/add_feeding', views.add_feeding, name='add_feeding'),
-    path('cats/<int:cat_id>/add_photo', views.add_photo, name='add_photo'),
-
-    # toy routes
-    path('toys/', views.ToyList.as_view(), name='toys_index'),
-    path('toys/create/', views.ToyCreate.as_view(), name='toys_create'),
-    path('toys/<int:pk>/update/', views.ToyUpdate.as_view(), name='toys_update'),
-    path('toys/<int:pk>/delete/', views.ToyDelete.as_view(), name='toys_delete'),
-    path('toys/<int:pk>/', views.ToyDetail.as_view(), name='toys_detail'),
-
-    # once this is all set up correctly, we will add code to 
-    # associate our toys with our cats, as well as a url to 
-    # unassociate toys and cats
-    path('cats/<int:cat_id>/assoc_toy/<int:toy_id>/', views.assoc_toy, name='assoc_toy'),
-    path('cats/<int:cat_id>/unassoc_toy/<int:toy_id>/', views.unassoc_toy, name='unassoc_toy'),
-
-    # User routes
-    path('accounts/signup/', views.signup, name='signup'),
-]
\ No newline at end of file
+        # route for the detail page of our cats
+        # we need an id, as well as a way to refer to the id
+        path('cats/create', views.CatCreate.as_view(),  name='cats_create'),
+        path('cats/<int:cat_id>', cats_detail, name='detail'),
+        path('cats/<int:pk>/update', views.CatUpdate.as_view(), name='cats_update'),
+        path('cats/<int:pk>/delete', views.CatDelete.as_view(), name='cats_delete'),
+        path('cats/<int:cat_id>/add_feeding', views.add_feeding, name='add_feeding'),
+        path('cats/<int:cat_id>/feedings/', views.feeding_history, name='feeding_history'),
+        path('feedings/bulk/', views.bulk_add_feedings, name='bulk_add_feedings'),
+        path('cats/<int:cat_id>/add_photo', views.add_photo, name='add_photo'),
+
+        # toy routes
+        path('toys/', toy_list, name='toys_index'),
+        path('toys/create/', views.ToyCreate.as_view(), name='toys_create'),
+        path('toys/<int:pk>/update/', views.ToyUpdate.as_view(), name='toys_update'),
+        path('toys/<int:pk>/delete/', views.ToyDelete.as_view(), name='toys_delete'),
+        path('toys/<int:pk>/', toy_detail, name='toys_detail'),
+
+        # once this is all set up correctly, we will add code to 
+        # associate our toys with our cats, as well as a url to 
+        # unassociate toys and cats
+        path('cats/<int:cat_id>/assoc_toy/<int:toy_id>/', views.assoc_toy, name='assoc_toy'),
+        path('cats/<int:cat_id>/unassoc_toy/<int:toy_id>/', views.unassoc_toy, name='unassoc_toy'),
+        path('toys/assign/', views.assign_toys, name='assign_toys'),
+
+        # read-only JSON API
+        path('api/cats/', views.api_cats, name='api_cats'),
+        path('api/cats/<int:cat_id>/', views.api_cat, name='api_cat'),
+        path('api/cats/<int:cat_id>/feedings/', views.api_cat_feedings, name='api_cat_feedings'),
+        path('api/toys/', views.api_toys, name='api_toys'),
+        path('api/toys/<int:pk>/', views.api_toy, name='api_toy'),
+
+        # export route
+        path('export/', views.export_data, name='export'),
+
+        # stats routes
+        path('stats/cache/', views.cache_stats_view, name='cache_stats'),
+        path('stats/requests/', views.request_stats_view, name='request_stats'),
+        path('stats/tasks/', views.task_stats_view, name='task_stats'),
+        path('stats/feedings/', views.feeding_stats_view, name='feeding_stats'),
+
+        # User routes
+        path('accounts/signup/', views.signup, name='signup'),
+    ]
+
+
+urlpatterns = build_urlpatterns(settings.ASYNC_VIEWS)
@@ -1,7 +1,14 @@
-import uuid
-import boto3
-import os
-
+import asyncio
+import json
+
+from django.db import transaction
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition, require_POST
 from django.shortcuts import render, redirect
 
 # import class-based-views (CBVs)
@@ -10,12 +17,30 @@ from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 
 from django.contrib.auth import login
+from django.contrib.auth.views import redirect_to_login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 
-from .models import Cat, Toy, Photo
+from .models import Cat, Feeding, Toy, Photo
+from . import analytics, api, stats
+from .cache import aget_cat_index, cache_stats, get_cat_index
+from .dashboard import hungry_cats
+from .export import EXPORT_FORMATS, export_tables, stream_csv, stream_ndjson
 from .forms import FeedingForm
+from .images import spool_upload, store_photo
+from .ingest import ingest_feedings, parse_feeding_records
+from .pagination import apaginate_by_keyset, paginate_by_keyset
+from .queries import (
+    AVAILABLE_TOYS_ORDERING, atoy_detail_last_modified, atoy_list_version, available_toys,
+    format_toy_detail_etag, format_toy_list_etag, toy_detail_etag, toy_list_etag, toy_viewer,
+)
+from .search import SEARCH_PAGE_SIZE, search, search_ordering
+from .storage import photo_key
+from .summaries import record_feeding
+from .tasks import enqueue_many, queue_stats
+from .toy_links import clean_pairs, link_toys, parse_pairs, unlink_toys
 
 # cats = [
 #     {'name': 'Lolo', 'breed': 'tabby', 'description': 'furry little demon', 'age': 3},
@@ -40,31 +65,99 @@ def cats_index(request):
     # this uses the object's object on the at model class
     # the objects object has a method called all
     # all grabs all of the entities using the parent model
-    cats = Cat.objects.filter(user=request.user)
+    # the list is cached per user and dropped whenever one of their cats changes
+    cats = get_cat_index(request.user.id)
     # print(cats)
     # for cat in cats:
     #     print(cat)
     # just like in EJS we can pass data to views
     return render(request, 'cats/index.html', { 'cats': cats })
 
+# feeding history is shown newest first; the keyset cursor is the
+# (date, id) of the last row on the previous page
+FEEDING_HISTORY_ORDERING = ('-date', '-id')
+
 # Detail View - shows one cat at '/cats/:id'
 @login_required
 def cats_detail(request, cat_id):
     # find one cat with its id
-    cat = Cat.objects.get(id=cat_id)
-
-    # here we'll get a value list of the toy ids associated with the cat
-    id_list = cat.toys.all().values_list('id')
-    # this is for all toys a cat does not have
-    toys_cat_doesnt_have = Toy.objects.exclude(id__in=id_list)
+    # prefetch everything the detail template renders so each relation
+    # costs exactly one query no matter how many times the template touches it
+    # (the "fed today" status comes from the cat row and the feeding history
+    # table is paginated separately)
+    cat = Cat.objects.prefetch_related('photo_set', 'toys').get(id=cat_id)
+
+    # this is for the toys a cat does not have - one page at a time,
+    # optionally searched by name and color
+    toy_name = request.GET.get('toy_name', '').strip()
+    toy_color = request.GET.get('toy_color', '').strip()
+    try:
+        toys_cat_doesnt_have = paginate_by_keyset(
+            available_toys(cat.id, name=toy_name, color=toy_color),
+            AVAILABLE_TOYS_ORDERING,
+            cursor=request.GET.get('toys_cursor'),
+        )
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
 
     # instantiate the FeedingForm to be rendered in our template
     feeding_form = FeedingForm()
 
+    # first page of the feeding history - older pages come from feeding_history
+    feedings = paginate_by_keyset(Feeding.objects.filter(cat=cat), FEEDING_HISTORY_ORDERING)
+
     return render(request, 'cats/detail.html', { 
         'cat': cat, 
+        'photos': cat.photo_set.all(),
+        'cat_toys': cat.toys.all(),
         'feeding_form': feeding_form,
-        'toys': toys_cat_doesnt_have
+        'feedings': feedings,
+        'toys': toys_cat_doesnt_have,
+        'toy_name': toy_name,
+        'toy_color': toy_color,
+    })
+
+# Hungry Cats - the user's cats still missing a meal today at '/cats/hungry/'
+@login_required
+def hungry_cats_view(request):
+    return render(request, 'cats/hungry.html', { 'cats': hungry_cats(request.user) })
+
+# Search - the user's cats and the toy catalog at '/search/?q=&breed=&color='
+@login_required
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    breed = request.GET.get('breed', '')
+    color = request.GET.get('color', '')
+    cats, toys, facets = search(request.user, query, breed=breed, color=color)
+    try:
+        cats = paginate_by_keyset(cats, search_ordering(), request.GET.get('cats_cursor'), SEARCH_PAGE_SIZE)
+        toys = paginate_by_keyset(toys, search_ordering(), request.GET.get('toys_cursor'), SEARCH_PAGE_SIZE)
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
+    return render(request, 'search.html', {
+        'query': query,
+        'breed': breed,
+        'color': color,
+        'cats': cats,
+        'toys': toys,
+        'facets': facets,
+    })
+
+# Feeding History - one page of a cat's feedings at '/cats/:id/feedings/?cursor='
+@login_required
+def feeding_history(request, cat_id):
+    try:
+        feedings = paginate_by_keyset(
+            Feeding.objects.filter(cat_id=cat_id, cat__user=request.user),
+            FEEDING_HISTORY_ORDERING,
+            cursor=request.GET.get('cursor'),
+        )
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
+
+    return render(request, 'cats/feeding_history.html', {
+        'cat_id': cat_id,
+        'feedings': feedings,
     })
 
 
@@ -118,18 +211,42 @@ def add_feeding(request, cat_id):
         new_feeding = form.save(commit=False)
         # add the cat_id
         new_feeding.cat_id = cat_id
-        new_feeding.save()
+        # INSERT ... ON CONFLICT DO NOTHING so a double submit is a no-op
+        # bulk_create skips the signals - record_feeding is safe to repeat
+        Feeding.objects.bulk_create([new_feeding], ignore_conflicts=True)
+        record_feeding(new_feeding)
 
     # finally, redirect to cat detail page
     return redirect('detail', cat_id=cat_id)
 
+# Bulk Feedings - the automatic feeders POST a JSON array or NDJSON stream of
+# { "cat_id": 1, "date": "2024-01-18", "meal": "B" } records to '/feedings/bulk/'
+@login_required
+@require_POST
+def bulk_add_feedings(request):
+    try:
+        records = parse_feeding_records(request.body, request.content_type)
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+    # users can only feed their own cats
+    cat_ids = set(Cat.objects.filter(user=request.user).values_list('id', flat=True))
+    result = ingest_feedings(records, cat_ids)
+
+    return JsonResponse(result)
+
 # TOY views
 # Toy List
+# paginated, and answers repeat visits with 304 Not Modified
+@method_decorator(condition(etag_func=toy_list_etag), name='dispatch')
 class ToyList(LoginRequiredMixin, ListView):
     model = Toy
     template_name = 'toys/index.html'
+    paginate_by = 24
+    ordering = [ 'name', 'id' ]
 
 # Toy Detail
+@method_decorator(condition(etag_func=toy_detail_etag), name='dispatch')
 class ToyDetail(LoginRequiredMixin, DetailView):
     model = Toy
     template_name = 'toys/detail.html'
@@ -169,31 +286,290 @@ def unassoc_toy(request, cat_id, toy_id):
     return redirect('detail', cat_id=cat_id)
 
 
+# Batch Toys - add / remove many (cat, toy) pairs in one POST to '/toys/assign/'
+# { "add": [[cat_id, toy_id], ...], "remove": [[cat_id, toy_id], ...] }
+# or { "toy_id": 1, "cat_ids": [1, 2, 3], "action": "add" }
+@login_required
+@require_POST
+def assign_toys(request):
+    try:
+        pairs = parse_pairs(json.loads(request.body))
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+    # users can only change their own cats
+    cat_ids = set(Cat.objects.filter(user=request.user).values_list('id', flat=True))
+    cleaned, errors = clean_pairs(pairs, cat_ids)
+    with transaction.atomic():
+        removed = unlink_toys(cleaned['remove'])
+        linked = link_toys(cleaned['add'])
+
+    return JsonResponse({ 'linked': linked, 'removed': removed, 'errors': errors })
+
+
 # Photo Views
 @login_required
 def add_photo(request, cat_id):
     # photo-file will be the "name" of the attribute on the <input>
-    photo_file = request.FILES.get('photo-file', None)
-    if photo_file:
-        s3 = boto3.client('s3')
-        # need a unique "key" for S3 
-        # need image file extension
-        key = uuid.uuid4().hex[:6] + photo_file.name[photo_file.name.rfind('.'):]
-        # in case something goes wrong:
-        try:
-            bucket = os.environ['S3_BUCKET']
-            s3.upload_fileobj(photo_file, bucket, key)
-            
-            # build the full url string
-            url = f"{os.environ['S3_BASE_URL']}{bucket}/{key}"
-            # assign to cat_id or cat
-            Photo.objects.create(url=url, cat_id=cat_id)
-        except Exception as e:
-            print('An error occurred uploading file to S3')
-            print(e)
+    # the input accepts several files - each is spooled to disk here and sent
+    # to S3 by a store_photo task, so the request doesn't wait on S3
+    photo_files = request.FILES.getlist('photo-file')
+    if photo_files:
+        # one INSERT queues them all - workers pick them up once we commit
+        enqueue_many(store_photo, [
+            (cat_id, spool_upload(photo_file), photo_key(photo_file.name)) for photo_file in photo_files
+        ])
     return redirect('detail', cat_id=cat_id)
 
 
+# Export - stream the user's cats, feedings, photos and toys at '/export/'
+# ?format=csv&table=feedings or ?format=ndjson (every table), plus optional
+# ?since=YYYY-MM-DD&until=YYYY-MM-DD to limit the feedings
+@login_required
+def export_data(request):
+    export_format = request.GET.get('format', 'ndjson')
+    table = request.GET.get('table', 'all')
+    dates = {}
+    for name in ('since', 'until'):
+        value = request.GET.get(name)
+        if not value:
+            continue
+        try:
+            dates[name] = parse_date(value)
+        except ValueError:
+            dates[name] = None
+        if dates[name] is None:
+            return HttpResponseBadRequest(f'{name} must be YYYY-MM-DD')
+
+    tables = export_tables(request.user, **dates)
+    if table != 'all':
+        if table not in tables:
+            return HttpResponseBadRequest(f'table must be one of: all, {", ".join(tables)}')
+        tables = { table: tables[table] }
+
+    if export_format == 'csv':
+        if len(tables) > 1:
+            return HttpResponseBadRequest('CSV exports one table at a time - add ?table=')
+        columns, rows = tables[table]
+        response = StreamingHttpResponse(stream_csv(columns, rows), content_type='text/csv')
+    elif export_format == 'ndjson':
+        response = StreamingHttpResponse(stream_ndjson(tables), content_type='application/x-ndjson')
+    else:
+        return HttpResponseBadRequest(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+
+    response['Content-Disposition'] = f'attachment; filename="catcollector-{table}.{export_format}"'
+    return response
+
+
+# JSON API - read-only, see api.py for ?fields= / ?include= / ?cursor=
+# Each view reads the version of the rows behind the body first - a repeat
+# visit gets its 304 without the payload ever being built
+@login_required
+def api_cats(request):
+    try:
+        version = api.cats_version(request.user, request.GET.get('include'))
+        return api.api_response(request, version, lambda: api.cats_payload(
+            request.user, request.GET.get('fields'), request.GET.get('include'), request.GET.get('cursor'),
+        ))
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+@login_required
+def api_cat(request, cat_id):
+    try:
+        version = api.cats_version(request.user, request.GET.get('include'), cat_id)
+        if not version['cats']['count']:
+            return JsonResponse({ 'error': 'cat not found' }, status=404)
+        return api.api_response(request, version, lambda: api.cat_payload(
+            request.user, cat_id, request.GET.get('fields'), request.GET.get('include'),
+        ))
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+@login_required
+def api_cat_feedings(request, cat_id):
+    # users can only read their own cats' feedings
+    if not Cat.objects.filter(user=request.user, id=cat_id).exists():
+        return JsonResponse({ 'error': 'cat not found' }, status=404)
+    try:
+        return api.api_response(request, api.feedings_version(cat_id), lambda: api.feedings_payload(
+            cat_id, request.GET.get('fields'), request.GET.get('cursor'),
+        ))
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+@login_required
+def api_toys(request):
+    try:
+        return api.api_response(request, api.toys_version(), lambda: api.toys_payload(
+            request.GET.get('fields'), request.GET.get('cursor'),
+        ))
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+@login_required
+def api_toy(request, pk):
+    version = api.toy_version(pk)
+    if version is None:
+        return JsonResponse({ 'error': 'toy not found' }, status=404)
+    try:
+        return api.api_response(request, version, lambda: api.toy_payload(pk, request.GET.get('fields')))
+    except ValueError as e:
+        return JsonResponse({ 'error': str(e) }, status=400)
+
+
+# Cache Stats - hit/miss/invalidate counters for this process at '/stats/cache/'
+@staff_member_required
+def cache_stats_view(request):
+    return JsonResponse(cache_stats())
+
+
+# Request Stats - per-route timing percentiles for this process at '/stats/requests/'
+@staff_member_required
+def request_stats_view(request):
+    return JsonResponse(stats.summarize(stats.snapshot()))
+
+
+# Task Stats - queue depth and wait / run time percentiles for every worker at '/stats/tasks/'
+@staff_member_required
+def task_stats_view(request):
+    return JsonResponse(queue_stats())
+
+
+# Feeding Stats - meals per day, meal distribution and skipped-meal streaks at
+# '/stats/feedings/?start=YYYY-MM-DD&end=YYYY-MM-DD&cat=' (all the user's cats,
+# last 30 days by default), read from the rollups refresh_feeding_rollups keeps
+@login_required
+def feeding_stats_view(request):
+    start, end = analytics.default_range()
+    dates = { 'start': start, 'end': end }
+    for name in dates:
+        value = request.GET.get(name)
+        if not value:
+            continue
+        try:
+            dates[name] = parse_date(value)
+        except ValueError:
+            dates[name] = None
+        if dates[name] is None:
+            return JsonResponse({ 'error': f'{name} must be YYYY-MM-DD' }, status=400)
+    if dates['start'] > dates['end']:
+        return JsonResponse({ 'error': 'start must not be after end' }, status=400)
+    if (dates['end'] - dates['start']).days >= analytics.MAX_STATS_DAYS:
+        return JsonResponse({ 'error': f'ranges are limited to {analytics.MAX_STATS_DAYS} days' }, status=400)
+
+    cats = Cat.objects.filter(user=request.user)
+    cat_id = request.GET.get('cat')
+    if cat_id:
+        if not cat_id.isdigit() or not cats.filter(id=cat_id).exists():
+            raise Http404('No such cat')
+        cats = cats.filter(id=cat_id)
+    return JsonResponse(analytics.feeding_stats(cats.values_list('id', flat=True), dates['start'], dates['end']))
+
+
+# ASYNC views
+# Async twins of the read-heavy views, used instead of the sync ones when
+# ASYNC_VIEWS is on (i.e. when served through catcollector/asgi.py).
+# @login_required and LoginRequiredMixin can't wrap async views in this
+# Django version and the lazy request.user would query synchronously, so each
+# view resolves the user with request.auser() first.
+
+async def aget_authenticated_user(request):
+    user = await request.auser()
+    # templates and context processors read request.user
+    request.user = user
+    return user if user.is_authenticated else None
+
+async def cats_index_async(request):
+    user = await aget_authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+    cats = await aget_cat_index(user.id)
+    return render(request, 'cats/index.html', { 'cats': cats })
+
+async def cats_detail_async(request, cat_id):
+    user = await aget_authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+
+    toy_name = request.GET.get('toy_name', '').strip()
+    toy_color = request.GET.get('toy_color', '').strip()
+    # none of these depend on each other, so they're all sent off together
+    try:
+        cat, photos, cat_toys, toys_cat_doesnt_have, feedings = await asyncio.gather(
+            Cat.objects.aget(id=cat_id),
+            alist(Photo.objects.filter(cat_id=cat_id)),
+            alist(Toy.objects.filter(cat=cat_id)),
+            apaginate_by_keyset(
+                available_toys(cat_id, name=toy_name, color=toy_color),
+                AVAILABLE_TOYS_ORDERING,
+                cursor=request.GET.get('toys_cursor'),
+            ),
+            apaginate_by_keyset(Feeding.objects.filter(cat_id=cat_id), FEEDING_HISTORY_ORDERING),
+        )
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
+
+    return render(request, 'cats/detail.html', {
+        'cat': cat,
+        'photos': photos,
+        'cat_toys': cat_toys,
+        'feeding_form': FeedingForm(),
+        'feedings': feedings,
+        'toys': toys_cat_doesnt_have,
+        'toy_name': toy_name,
+        'toy_color': toy_color,
+    })
+
+async def toy_list_async(request):
+    user = await aget_authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+
+    version = await atoy_list_version()
+    etag = format_toy_list_etag(version, request.GET.get('page', '1'), toy_viewer(request, user.id))
+    not_modified = get_conditional_response(request, etag=quote_etag(etag))
+    if not_modified:
+        return not_modified
+
+    # same page size and ordering as ToyList - the count comes from the version query
+    paginator = Paginator(range(version['count']), ToyList.paginate_by)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    toys = Toy.objects.order_by(*ToyList.ordering)[page_obj.start_index() - 1:page_obj.end_index()]
+    response = render(request, ToyList.template_name, {
+        'object_list': await alist(toys),
+        'paginator': paginator,
+        'page_obj': page_obj,
+        'is_paginated': page_obj.has_other_pages(),
+    })
+    return with_etag(response, etag)
+
+async def toy_detail_async(request, pk):
+    user = await aget_authenticated_user(request)
+    if user is None:
+        return redirect_to_login(request.get_full_path())
+
+    updated = await atoy_detail_last_modified(pk)
+    if updated is None:
+        raise Http404('No toy found matching the query')
+    etag = format_toy_detail_etag(pk, updated, toy_viewer(request, user.id))
+    not_modified = get_conditional_response(request, etag=quote_etag(etag))
+    if not_modified:
+        return not_modified
+
+    toy = await Toy.objects.aget(pk=pk)
+    response = render(request, ToyDetail.template_name, { 'toy': toy, 'object': toy })
+    return with_etag(response, etag)
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+def with_etag(response, etag):
+    # the same ETag header @condition adds to the sync views
+    response.headers.setdefault('ETag', quote_etag(etag))
+    return response
+
+
 # USER views
 def signup(request):
     error_message = ''
@@ -203,8 +579,9 @@ def signup(request):
         if form.is_valid():
             # Add user to database
             user = form.save()
-            # Log in user via code
-            login(request, user)
+            # Log in user via code - with more than one backend configured
+            # login() needs to be told which one to remember in the session
+            login(request, user, backend='main_app.auth.CachedModelBackend')
             return redirect('index')
         else:
             error_message = 'Invalid sign up - try again'